@@ -0,0 +1,298 @@
+"""Local stand-ins of the GCP services for benchmarks.
+
+`FakeChatBot` replaces the Vertex AI backed `ChatBot` with a configurable
+latency and token rate, and `FirestoreStub` is an in-memory stand-in of the
+subset of the Firestore `AsyncClient` API used by `FirestoreDB`, with an
+optional round-trip latency per operation.
+"""
+
+import asyncio
+import copy
+import datetime
+import itertools
+from typing import Any, AsyncIterator
+
+from google.api_core.exceptions import Conflict, FailedPrecondition, NotFound
+from google.cloud import firestore
+
+from src.schemas import Conversation, Message, Role
+from src.backend.model import Turn
+
+
+class FakeChatBot:
+    """ChatBot answering with filler text after a fixed latency, streamed at a
+    fixed token rate."""
+
+    structured_output = False
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        tokens_per_second: float = 50.0,
+        reply_tokens: int = 60,
+        chunk_tokens: int = 8,
+    ):
+        """Initializes the fake chat bot.
+
+        Parameters
+        ----------
+        latency : float
+            The seconds until the first token of a response.
+        tokens_per_second : float
+            The generation rate of the response tokens.
+        reply_tokens : int
+            The number of tokens (words) of a response.
+        chunk_tokens : int
+            The number of tokens per streamed chunk.
+        """
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.chunk_tokens = max(chunk_tokens, 1)
+
+    def _chunks(self) -> list[str]:
+        words = ["lorem"] * self.reply_tokens
+        return [
+            " ".join(words[start : start + self.chunk_tokens]) + " "
+            for start in range(0, len(words), self.chunk_tokens)
+        ]
+
+    async def warmup(self):
+        pass
+
+    async def update_context(self, conversation: Conversation) -> Conversation:
+        return conversation
+
+    async def generate_response(self, conversation: Conversation) -> Message:
+        await asyncio.sleep(self.latency + self.reply_tokens / self.tokens_per_second)
+        return Message(text="".join(self._chunks()).strip())
+
+    async def generate_turn(self, conversation: Conversation) -> Turn:
+        response = await self.generate_response(conversation)
+        return Turn(reply=response.text)
+
+    async def stream_response(self, conversation: Conversation) -> AsyncIterator[str]:
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks():
+            await asyncio.sleep(self.chunk_tokens / self.tokens_per_second)
+            yield chunk
+
+    async def add_summary(self, conversation: Conversation) -> Conversation:
+        summary = next(
+            hist.parts[0].text
+            for hist in reversed(conversation.history)
+            if hist.role == Role.MODEL
+        )
+        await asyncio.sleep(self.latency)
+        return conversation.add_summary(summary=summary, summary_english=summary)
+
+
+class _Snapshot:
+    def __init__(self, reference, data: dict | None, update_time):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.update_time = update_time
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> dict | None:
+        return copy.deepcopy(self._data)
+
+    def get(self, field: str) -> Any:
+        if self._data is None or field not in self._data:
+            raise KeyError(field)
+        return copy.deepcopy(self._data[field])
+
+
+def _matches(filter, value: Any) -> bool:
+    match filter.op_string:
+        case "==":
+            return value == filter.value
+        case ">=":
+            return value is not None and value >= filter.value
+    raise NotImplementedError(f"Unsupported filter operator {filter.op_string}")
+
+
+class _Query:
+    def __init__(self, client, path, filters=(), order=None, after=None, limit=None):
+        self.client = client
+        self.path = path
+        self.filters = filters
+        self.order = order
+        self.after = after
+        self.count = limit
+
+    def _with(self, **kwargs) -> "_Query":
+        query = copy.copy(self)
+        query.__dict__.update(kwargs)
+        return query
+
+    def select(self, field_paths) -> "_Query":
+        return self
+
+    def where(self, filter) -> "_Query":
+        return self._with(filters=self.filters + (filter,))
+
+    def order_by(self, field_path: str) -> "_Query":
+        return self._with(order=field_path)
+
+    def start_after(self, snapshot) -> "_Query":
+        return self._with(after=snapshot.id)
+
+    def limit(self, count: int) -> "_Query":
+        return self._with(count=count)
+
+    def _snapshots(self) -> list[_Snapshot]:
+        depth = len(self.path)
+        snapshots = [
+            _Snapshot(_Document(self.client, path), copy.deepcopy(data), update_time)
+            for path, (data, update_time) in self.client.documents.items()
+            if len(path) == depth + 1
+            and path[:depth] == self.path
+            and all(_matches(f, data.get(f.field_path)) for f in self.filters)
+        ]
+        if self.order in (None, "__name__"):
+            snapshots.sort(key=lambda snapshot: snapshot.id)
+        else:
+            snapshots.sort(key=lambda snapshot: snapshot._data.get(self.order))
+        if self.after is not None:
+            snapshots = [snapshot for snapshot in snapshots if snapshot.id > self.after]
+        if self.count is not None:
+            snapshots = snapshots[: self.count]
+        return snapshots
+
+    async def get(self) -> list[_Snapshot]:
+        await self.client.round_trip()
+        return self._snapshots()
+
+    async def stream(self) -> AsyncIterator[_Snapshot]:
+        await self.client.round_trip()
+        for snapshot in self._snapshots():
+            yield snapshot
+
+
+class _Collection(_Query):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.id = path[-1]
+
+    def document(self, document_id: str) -> "_Document":
+        return _Document(self.client, self.path + (document_id,))
+
+
+class _Document:
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.id = path[-1]
+
+    def collection(self, name: str) -> _Collection:
+        return _Collection(self.client, self.path + (name,))
+
+    async def get(self, field_paths=None) -> _Snapshot:
+        await self.client.round_trip()
+        data, update_time = self.client.documents.get(self.path, (None, None))
+        if data is not None and field_paths is not None:
+            data = {key: value for key, value in data.items() if key in field_paths}
+        return _Snapshot(self, copy.deepcopy(data), update_time)
+
+
+class _WriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class _Batch:
+    def __init__(self, client):
+        self.client = client
+        self.writes = []
+
+    def set(self, reference, data):
+        self.writes.append(("set", reference, data, None))
+
+    def create(self, reference, data):
+        self.writes.append(("create", reference, data, None))
+
+    def update(self, reference, data, option=None):
+        self.writes.append(("update", reference, data, option))
+
+    def delete(self, reference):
+        self.writes.append(("delete", reference, None, None))
+
+    async def commit(self) -> list[_WriteResult]:
+        await self.client.round_trip()
+        if len(self.writes) > 500:
+            raise ValueError("A batch can contain at most 500 writes")
+        documents = self.client.documents
+
+        # Check all preconditions first, the batch is atomic
+        for kind, reference, _, option in self.writes:
+            current = documents.get(reference.path)
+            if kind == "create" and current is not None:
+                raise Conflict(f"Document {reference.path} already exists")
+            if kind == "update" and current is None:
+                raise NotFound(f"Document {reference.path} not found")
+            if kind == "update" and option is not None and current[1] != option:
+                raise FailedPrecondition(f"Document {reference.path} was modified")
+
+        update_time = self.client.now()
+        for kind, reference, data, _ in self.writes:
+            if kind == "delete":
+                documents.pop(reference.path, None)
+                continue
+            if kind == "update":
+                merged = dict(documents[reference.path][0])
+                for key, value in data.items():
+                    if value is firestore.DELETE_FIELD:
+                        merged.pop(key, None)
+                    else:
+                        merged[key] = value
+                data = merged
+            documents[reference.path] = (copy.deepcopy(data), update_time)
+        return [_WriteResult(update_time) for _ in self.writes]
+
+
+class FirestoreStub:
+    """In-memory stand-in of the Firestore `AsyncClient` used by `FirestoreDB`.
+
+    All instances share the same documents, so it can replace the client class
+    (`google.cloud.firestore.AsyncClient`) before the store is created.
+    """
+
+    documents: dict[tuple[str, ...], tuple[dict, datetime.datetime]] = {}
+    latency: float = 0.0
+    _clock = itertools.count(1)
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    @classmethod
+    def reset(cls, latency: float = 0.0):
+        """Drops all documents and sets the simulated round-trip latency."""
+        cls.documents = {}
+        cls.latency = latency
+
+    @classmethod
+    def now(cls) -> datetime.datetime:
+        """Returns a strictly increasing update time."""
+        return datetime.datetime.now(datetime.UTC) + datetime.timedelta(
+            microseconds=next(cls._clock)
+        )
+
+    async def round_trip(self):
+        await asyncio.sleep(self.latency)
+
+    def collection(self, name: str) -> _Collection:
+        return _Collection(self, (name,))
+
+    def batch(self) -> _Batch:
+        return _Batch(self)
+
+    def write_option(self, last_update_time: datetime.datetime) -> datetime.datetime:
+        return last_update_time
+
+    def close(self):
+        pass
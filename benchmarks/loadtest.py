@@ -0,0 +1,452 @@
+"""Load test of the backend with local stand-ins for Vertex AI and Firestore.
+
+Boots `src.backend.app:app` in-process with `FakeChatBot` (configurable
+latency and token rate) and the in-memory `FirestoreStub`, the Firestore
+emulator (`FIRESTORE_EMULATOR_HOST`) or SQLite, and drives concurrent
+simulated users through multi-turn conversations the way the frontend does:
+a turn, an incremental history poll with `If-None-Match`, and the summary
+once the conversation is done. `--url` drives a running server instead.
+
+Latency percentiles and throughput are reported per route and the results
+are stored as JSON in `benchmarks/results/`, named after the app version and
+git commit. Every run is compared with the latest stored run of the same
+parameters, and `--check` fails if a percentile or the throughput regressed
+by more than `--tolerance`.
+
+`--cassette` replaces the fake model with the real `ChatBot` replaying the
+model calls of a cassette recorded with `GENAI_CASSETTE_MODE=record`, in
+sequence and with the recorded timings times `--timing-scale`.
+
+In-process, responses are buffered by the ASGI transport, so the time to the
+first streamed event is only reported against a running server.
+
+Usage
+-----
+python -m benchmarks.loadtest [--users 50] [--turns 10] [--stream]
+    [--store stub|emulator|sqlite] [--latency 0.5] [--tokens-per-second 50]
+    [--cassette cassette.jsonl] [--url http://localhost:8000] [--check]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import logging
+import math
+import os
+import pathlib
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from unittest import mock
+
+import httpx
+from google.cloud import firestore
+
+from src.backend import app as app_module
+from src.backend.config import settings, CassetteMatch, CassetteMode, StoreBackend
+from src.schemas import SummaryStatus
+
+from .fakes import FakeChatBot, FirestoreStub
+
+RESULTS_DIR = pathlib.Path(__file__).parent / "results"
+PERCENTILES = (50, 95, 99)
+
+# Parameters that must match for two runs to be compared
+COMPARED_PARAMETERS = (
+    "users",
+    "turns",
+    "polls",
+    "think_time",
+    "stream",
+    "store",
+    "store_latency",
+    "latency",
+    "tokens_per_second",
+    "reply_tokens",
+    "cassette",
+    "timing_scale",
+    "url",
+)
+
+
+class Recorder:
+    """Collects the latencies and errors of the requests per route."""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    @contextlib.asynccontextmanager
+    async def request(self, route: str):
+        """Times the enclosed request; it fails on an exception."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.errors[route] += 1
+            logging.debug(f"{route} failed: {e!r}")
+        else:
+            self.latencies[route].append(time.perf_counter() - start)
+
+    def record(self, route: str, seconds: float):
+        """Records a latency measured by the caller."""
+        self.latencies[route].append(seconds)
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Returns the nearest-rank percentile `q` of sorted values."""
+    if not sorted_values:
+        return math.nan
+    rank = math.ceil(q / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+async def simulate_user(
+    client: httpx.AsyncClient, recorder: Recorder, args: argparse.Namespace
+):
+    """Runs the conversation of one simulated user."""
+    user_id = f"loadtest-{uuid.uuid4().hex[:12]}"
+    cursor, etag = 0, None
+
+    for index in range(args.turns):
+        last = index == args.turns - 1
+        text = "DONE" if last else f"Message {index}: " + "lorem ipsum " * 20
+        if args.stream:
+            await stream_turn(client, recorder, user_id, text, timed=bool(args.url))
+        else:
+            async with recorder.request("POST /chat/{user_id}"):
+                response = await client.post(f"/chat/{user_id}", json={"text": text})
+                response.raise_for_status()
+
+        # Every rerun of the frontend polls the history
+        for _ in range(args.polls):
+            async with recorder.request("GET /chat/{user_id}"):
+                headers = {"If-None-Match": etag} if etag else {}
+                response = await client.get(
+                    f"/chat/{user_id}", params={"cursor": cursor}, headers=headers
+                )
+                if response.status_code != 304:
+                    response.raise_for_status()
+                    etag = response.headers.get("ETag")
+                    cursor = response.json()["cursor"]
+        await asyncio.sleep(args.think_time)
+
+    deadline = time.monotonic() + args.summary_timeout
+    while time.monotonic() < deadline:
+        async with recorder.request("GET /chat/{user_id}/summary"):
+            response = await client.get(f"/chat/{user_id}/summary")
+            response.raise_for_status()
+            status = response.json()["status"]
+        if status in (SummaryStatus.DONE, SummaryStatus.FAILED):
+            break
+        await asyncio.sleep(0.1)
+
+
+async def stream_turn(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    user_id: str,
+    text: str,
+    timed: bool = True,
+):
+    """Runs a streamed turn and, if `timed`, records the time to the first
+    event."""
+    route = "POST /chat/{user_id}/stream"
+    async with recorder.request(route):
+        start = time.perf_counter()
+        first = None
+        async with client.stream(
+            "POST", f"/chat/{user_id}/stream", json={"text": text}
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if first is None and line.startswith("data:"):
+                    first = time.perf_counter() - start
+                if line.startswith("event: error"):
+                    raise RuntimeError("The stream ended with an error event")
+        if timed and first is not None:
+            recorder.record(f"{route} (first event)", first)
+
+
+async def drive(client: httpx.AsyncClient, args: argparse.Namespace) -> dict:
+    """Runs all simulated users and summarizes the latencies per route."""
+    recorder = Recorder()
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(simulate_user(client, recorder, args) for _ in range(args.users))
+    )
+    duration = time.perf_counter() - start
+
+    routes = {}
+    for route in sorted(set(recorder.latencies) | set(recorder.errors)):
+        latencies = sorted(recorder.latencies[route])
+        routes[route] = {
+            "count": len(latencies),
+            "errors": recorder.errors[route],
+            "throughput": len(latencies) / duration,
+            "mean_ms": 1000 * sum(latencies) / len(latencies) if latencies else None,
+            **{
+                f"p{q}_ms": 1000 * percentile(latencies, q) if latencies else None
+                for q in PERCENTILES
+            },
+            "max_ms": 1000 * latencies[-1] if latencies else None,
+        }
+
+    requests = sum(len(latencies) for latencies in recorder.latencies.values())
+    return {
+        "duration": duration,
+        "requests": requests,
+        "errors": sum(recorder.errors.values()),
+        "throughput": requests / duration,
+        "turns_per_second": args.users * args.turns / duration,
+        "routes": routes,
+    }
+
+
+async def run_in_process(args: argparse.Namespace) -> dict:
+    """Boots the app in-process with the stand-ins and drives it."""
+    app = app_module.app
+    if args.cassette:
+        # The real ChatBot, answering from the recorded model calls
+        settings.genai_cassette_mode = CassetteMode.REPLAY
+        settings.genai_cassette = args.cassette
+        settings.genai_cassette_match = CassetteMatch.SEQUENCE
+        settings.genai_cassette_timing_scale = args.timing_scale
+    else:
+        app.state.model = FakeChatBot(
+            latency=args.latency,
+            tokens_per_second=args.tokens_per_second,
+            reply_tokens=args.reply_tokens,
+        )
+
+    with contextlib.ExitStack() as patches:
+        patches.enter_context(
+            mock.patch.object(
+                app_module,
+                "init_gcp_credentials",
+                return_value=(None, settings.project_id),
+            )
+        )
+        match args.store:
+            case "stub":
+                FirestoreStub.reset(latency=args.store_latency)
+                settings.conversation_store = StoreBackend.FIRESTORE
+                patches.enter_context(
+                    mock.patch.object(firestore, "AsyncClient", FirestoreStub)
+                )
+            case "emulator":
+                if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+                    raise SystemExit("FIRESTORE_EMULATOR_HOST is not set")
+                settings.conversation_store = StoreBackend.FIRESTORE
+            case "sqlite":
+                settings.conversation_store = StoreBackend.SQLITE
+                settings.sqlite_path = args.sqlite_path
+
+        async with app.lifespan():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://loadtest", timeout=None
+            ) as client:
+                return await drive(client, args)
+
+
+async def run_remote(args: argparse.Namespace) -> dict:
+    """Drives a running server."""
+    limits = httpx.Limits(max_connections=args.users)
+    async with httpx.AsyncClient(
+        base_url=args.url, limits=limits, timeout=None
+    ) as client:
+        return await drive(client, args)
+
+
+def git_commit() -> str:
+    """Returns the short hash of the checked out commit, if any."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def find_baseline(parameters: dict) -> tuple[pathlib.Path, dict] | None:
+    """Returns the latest stored run with the same parameters, if any."""
+    if not RESULTS_DIR.is_dir():
+        return None
+    for path in sorted(RESULTS_DIR.glob("loadtest-*.json"), reverse=True):
+        result = json.loads(path.read_text())
+        if all(
+            result["parameters"].get(key) == parameters.get(key)
+            for key in COMPARED_PARAMETERS
+        ):
+            return path, result
+    return None
+
+
+def print_report(result: dict):
+    """Prints the latencies and throughput per route."""
+    print(
+        f"{result['requests']} requests in {result['duration']:.2f}s: "
+        f"{result['throughput']:.1f} req/s, "
+        f"{result['turns_per_second']:.1f} turns/s, {result['errors']} errors"
+    )
+    print(
+        f"{'route':<42}{'count':>7}{'errors':>7}{'req/s':>9}"
+        + "".join(f"{f'p{q} ms':>10}" for q in PERCENTILES)
+        + f"{'max ms':>10}"
+    )
+    for route, stats in result["routes"].items():
+        print(
+            f"{route:<42}{stats['count']:>7}{stats['errors']:>7}"
+            f"{stats['throughput']:>9.1f}"
+            + "".join(f"{stats[f'p{q}_ms'] or math.nan:>10.1f}" for q in PERCENTILES)
+            + f"{stats['max_ms'] or math.nan:>10.1f}"
+        )
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Prints the latency changes of every route and the throughput change
+    against the baseline and returns the regressions beyond the tolerance."""
+    print(f"\nCompared with {baseline['version']} ({baseline['commit']}):")
+    regressions = []
+
+    def change(name: str, after: float, before: float, higher_is_worse: bool = True):
+        delta = after / before - 1
+        worse = delta if higher_is_worse else -delta
+        if worse <= tolerance:
+            return f"{name} {delta:+.1%}"
+        regressions.append(f"{name} {delta:+.1%}")
+        return f"{name} {delta:+.1%} !"
+
+    for route, stats in result["routes"].items():
+        before = baseline["routes"].get(route)
+        if before is None:
+            continue
+        changes = [
+            change(f"{route} {key}", stats[key], before[key]).removeprefix(route)
+            for key in (f"p{q}_ms" for q in PERCENTILES)
+            if stats[key] and before[key]
+        ]
+        print(f"  {route:<42}" + ",".join(changes))
+    print(
+        "  "
+        + change(
+            "turns/s",
+            result["turns_per_second"],
+            baseline["turns_per_second"],
+            higher_is_worse=False,
+        )
+    )
+    return regressions
+
+
+def build_parser(**kwargs) -> argparse.ArgumentParser:
+    """Returns the parser of the load test options."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0], **kwargs)
+    parser.add_argument("--users", type=int, default=50, help="concurrent users")
+    parser.add_argument("--turns", type=int, default=10, help="turns per user")
+    parser.add_argument(
+        "--polls", type=int, default=2, help="history polls after every turn"
+    )
+    parser.add_argument(
+        "--think-time", type=float, default=0.0, help="seconds between turns"
+    )
+    parser.add_argument(
+        "--stream", action="store_true", help="use the streaming chat route"
+    )
+    parser.add_argument(
+        "--store", choices=("stub", "emulator", "sqlite"), default="stub"
+    )
+    parser.add_argument(
+        "--store-latency",
+        type=float,
+        default=0.005,
+        help="round-trip seconds of the Firestore stub",
+    )
+    parser.add_argument("--sqlite-path", default="loadtest.db")
+    parser.add_argument(
+        "--latency", type=float, default=0.5, help="model time to first token"
+    )
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument(
+        "--cassette", help="replay the model calls of a recorded cassette instead"
+    )
+    parser.add_argument(
+        "--timing-scale",
+        type=float,
+        default=1.0,
+        help="factor of the recorded cassette timings",
+    )
+    parser.add_argument(
+        "--summary-timeout",
+        type=float,
+        default=30.0,
+        help="seconds to wait for the summary",
+    )
+    parser.add_argument("--url", help="drive a running server instead")
+    parser.add_argument(
+        "--no-save", action="store_true", help="don't store the results"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="relative change counted as a regression",
+    )
+    parser.add_argument(
+        "--check", action="store_true", help="exit with 1 on a regression"
+    )
+    parser.add_argument("--log-level", default="WARNING")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    runner = run_remote if args.url else run_in_process
+    result = asyncio.run(runner(args))
+
+    parameters = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in ("no_save", "tolerance", "check", "log_level")
+    }
+    result = {
+        "version": settings.version,
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.UTC).isoformat(),
+        "python": sys.version.split()[0],
+        "parameters": parameters,
+        **result,
+    }
+
+    print_report(result)
+    baseline = find_baseline(parameters)
+    regressions = compare(result, baseline[1], args.tolerance) if baseline else []
+
+    if not args.no_save:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        stamp = datetime.datetime.now(datetime.UTC).strftime("%Y%m%dT%H%M%S")
+        path = (
+            RESULTS_DIR
+            / f"loadtest-{stamp}-{result['version']}-{result['commit']}.json"
+        )
+        path.write_text(json.dumps(result, indent=2) + "\n")
+        print(f"\nResults stored in {path}")
+
+    if regressions and args.check:
+        print("Regressions: " + "; ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
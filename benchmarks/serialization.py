@@ -0,0 +1,110 @@
+"""Microbenchmark of the conversation serialization paths.
+
+Compares the pydantic models of `src/schemas.py` with the hot path of
+`src/backend/codec.py` at the store and HTTP boundaries, for conversations of
+growing length.
+
+Usage
+-----
+python -m benchmarks.serialization [--turns 10 100 1000] [--repeat 5]
+"""
+
+import argparse
+import datetime
+import timeit
+from typing import Callable
+
+import msgspec
+
+from src.schemas import Role, Message, HistoryEntry, Conversation
+from src.backend import codec
+
+
+def make_conversation(turns: int) -> Conversation:
+    """Builds a conversation of `turns` history entries of realistic length."""
+    conversation = Conversation(
+        history=[],
+        created=datetime.datetime.now(datetime.UTC),
+        updated=datetime.datetime.now(datetime.UTC),
+    )
+    for index in range(turns):
+        role = Role.USER if index % 2 == 0 else Role.MODEL
+        text = f"Message {index}: " + "lorem ipsum dolor sit amet " * 10
+        conversation.add_message(parts=[Message(text=text)], role=role)
+    return conversation
+
+
+def cases(conversation: Conversation) -> dict[str, tuple[Callable, Callable]]:
+    """Returns the benchmarked operations as (pydantic, codec) pairs."""
+    header = conversation.model_dump(exclude={"history"})
+    entries = [entry.model_dump() for entry in conversation.history]
+    rows = [entry.model_dump_json() for entry in conversation.history]
+    encoder = msgspec.json.Encoder()
+
+    return {
+        # FirestoreDB.load_conversation
+        "load (dicts)": (
+            lambda: Conversation(
+                history=[HistoryEntry(**entry) for entry in entries], **header
+            ),
+            lambda: codec.conversation_from_header(
+                header, codec.history_from_dicts(entries)
+            ),
+        ),
+        # SQLiteDB.load_conversation
+        "load (json rows)": (
+            lambda: Conversation(
+                history=[HistoryEntry.model_validate_json(row) for row in rows],
+                **header,
+            ),
+            lambda: codec.conversation_from_header(
+                header, codec.history_from_json(rows)
+            ),
+        ),
+        # FirestoreDB.save_conversation
+        "save (dicts)": (
+            lambda: [entry.model_dump() for entry in conversation.history],
+            lambda: [codec.entry_to_builtins(e) for e in conversation.history],
+        ),
+        # SQLiteDB.save_conversation
+        "save (json rows)": (
+            lambda: [entry.model_dump_json() for entry in conversation.history],
+            lambda: [codec.encode_entry(entry) for entry in conversation.history],
+        ),
+        # GET /chat/{user_id} response body
+        "http response": (
+            lambda: encoder.encode(conversation.model_dump(mode="json")),
+            lambda: encoder.encode(codec.conversation_to_builtins(conversation)),
+        ),
+    }
+
+
+def measure(func: Callable, repeat: int) -> float:
+    """Returns the best time of a call of `func` in microseconds."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f"{'operation':<18} {'turns':>6} {'pydantic µs':>12} {'codec µs':>10} {'speedup':>8}"
+    )
+    for turns in args.turns:
+        conversation = make_conversation(turns)
+        for name, (baseline, fast) in cases(conversation).items():
+            baseline_us = measure(baseline, args.repeat)
+            fast_us = measure(fast, args.repeat)
+            print(
+                f"{name:<18} {turns:>6} {baseline_us:>12.1f} {fast_us:>10.1f} "
+                f"{baseline_us / fast_us:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Benchmark of the ASGI server engines against each other.
+
+Launches the backend with every installed server engine in turn through
+`src/backend/main.py`, the way it runs in production, and drives it with the
+load test (`benchmarks/loadtest.py`). The model calls are replayed from a
+cassette and conversations are stored in SQLite, so no GCP access is needed.
+Every server is stopped with SIGTERM afterwards.
+
+Reported per engine: the seconds until the server answers, the load test
+throughput and chat latency percentiles, and the seconds the graceful
+shutdown took. The results are stored as JSON in `benchmarks/results/`.
+
+Usage
+-----
+python -m benchmarks.servers --cassette cassette.jsonl
+    [--engines uvicorn granian gunicorn] [--workers 0] [--port 8100]
+    [load test options, e.g. --users 50 --turns 10 --stream]
+"""
+
+import asyncio
+import datetime
+import json
+import os
+import pathlib
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from src.backend.config import settings, ServerEngine
+from src.backend.server import available_engines
+
+from .loadtest import PERCENTILES, RESULTS_DIR, build_parser, git_commit, run_remote
+
+
+def wait_ready(process: subprocess.Popen, url: str, timeout: float) -> float:
+    """Waits until the server answers and returns the seconds it took."""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"The server exited with {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return time.perf_counter() - start
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"The server did not answer within {timeout}s")
+
+
+def stop(process: subprocess.Popen, timeout: float) -> float:
+    """Stops the server with SIGTERM and returns the seconds it took, killing
+    it after `timeout`."""
+    start = time.perf_counter()
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    return time.perf_counter() - start
+
+
+def run_engine(engine: ServerEngine, args, directory: str) -> dict:
+    """Launches the backend on an engine, load tests it and stops it."""
+    url = f"http://127.0.0.1:{args.port}"
+    env = {
+        **os.environ,
+        "BACKEND_HOST": "127.0.0.1",
+        "BACKEND_PORT": str(args.port),
+        "CONVERSATION_STORE": "sqlite",
+        "SQLITE_PATH": str(pathlib.Path(directory) / f"{engine}.db"),
+        "GENAI_CASSETTE_MODE": "replay",
+        "GENAI_CASSETTE": str(pathlib.Path(args.cassette).resolve()),
+        "GENAI_CASSETTE_MATCH": "sequence",
+        "GENAI_CASSETTE_TIMING_SCALE": str(args.timing_scale),
+    }
+    # Vertex AI validates the location even when the calls are replayed
+    env.setdefault("LOCATION", "us-central1")
+    command = [
+        sys.executable,
+        "src/backend/main.py",
+        "--engine",
+        engine,
+        "--workers",
+        str(args.workers),
+        "--max_requests",
+        "0",
+        "--graceful_timeout",
+        str(args.graceful_timeout),
+    ]
+
+    log_path = pathlib.Path(directory) / f"{engine}.log"
+    with log_path.open("w") as log:
+        process = subprocess.Popen(
+            command, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        try:
+            ready = wait_ready(process, url, args.ready_timeout)
+            args.url = url
+            result = asyncio.run(run_remote(args))
+        except Exception:
+            print(log_path.read_text()[-4000:], file=sys.stderr)
+            raise
+        finally:
+            shutdown = stop(process, args.graceful_timeout + 10)
+    return {"ready_seconds": ready, "shutdown_seconds": shutdown, **result}
+
+
+def print_report(results: dict[str, dict], route: str):
+    """Prints the results of the engines side by side."""
+    print(
+        f"{'engine':<10}{'ready s':>9}{'turns/s':>9}{'req/s':>9}{'errors':>8}"
+        + "".join(f"{f'p{q} ms':>10}" for q in PERCENTILES)
+        + f"{'stop s':>8}"
+    )
+    for engine, result in results.items():
+        stats = result["routes"].get(route, {})
+        print(
+            f"{engine:<10}{result['ready_seconds']:>9.2f}"
+            f"{result['turns_per_second']:>9.1f}{result['throughput']:>9.1f}"
+            f"{result['errors']:>8}"
+            + "".join(f"{stats.get(f'p{q}_ms') or 0:>10.1f}" for q in PERCENTILES)
+            + f"{result['shutdown_seconds']:>8.2f}"
+        )
+    print(f"(latencies of {route})")
+
+
+def main():
+    parser = build_parser(add_help=False)
+    parser.description = __doc__.split("\n")[0]
+    parser.add_argument("-h", "--help", action="help")
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        type=ServerEngine,
+        choices=list(ServerEngine),
+        default=list(ServerEngine),
+    )
+    parser.add_argument(
+        "--workers", type=int, default=0, help="0 for one per available CPU"
+    )
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument(
+        "--ready-timeout",
+        type=float,
+        default=60.0,
+        help="seconds to wait for the server to answer",
+    )
+    parser.add_argument(
+        "--graceful-timeout",
+        type=float,
+        default=settings.server_graceful_timeout,
+        help="seconds the open requests get to finish on SIGTERM",
+    )
+    args = parser.parse_args()
+    if not args.cassette:
+        parser.error("--cassette is required to replay the model calls")
+
+    installed = available_engines()
+    engines = []
+    for engine in args.engines:
+        if engine in installed:
+            engines.append(engine)
+        else:
+            print(f"Skipping {engine}, it is not installed")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for engine in engines:
+            print(f"Benchmarking {engine}...")
+            results[engine] = run_engine(engine, args, directory)
+    if not results:
+        return
+
+    route = "POST /chat/{user_id}/stream" if args.stream else "POST /chat/{user_id}"
+    print_report(results, route)
+
+    if not args.no_save:
+        parameters = {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("no_save", "tolerance", "check", "log_level", "url")
+        }
+        result = {
+            "version": settings.version,
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now(datetime.UTC).isoformat(),
+            "python": sys.version.split()[0],
+            "parameters": parameters,
+            "engines": results,
+        }
+        RESULTS_DIR.mkdir(exist_ok=True)
+        stamp = datetime.datetime.now(datetime.UTC).strftime("%Y%m%dT%H%M%S")
+        path = (
+            RESULTS_DIR / f"servers-{stamp}-{result['version']}-{result['commit']}.json"
+        )
+        path.write_text(json.dumps(result, indent=2) + "\n")
+        print(f"\nResults stored in {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Helpers of the ASGI middlewares of the backend."""
+
+import functools
+from typing import Any
+
+
+@functools.lru_cache(maxsize=1024)
+def _handler_templates(app: Any, handler: Any) -> tuple[str, ...]:
+    """Returns the path templates of the routes of a route handler."""
+    return tuple(
+        route.path_format
+        for route in app.routes
+        if any(h is handler for h in getattr(route, "route_handlers", ()))
+    )
+
+
+def route_template(scope: dict[str, Any]) -> str | None:
+    """Returns the path template of the route a request matched, e.g.
+    `/chat/{user_id}`, so metrics, spans and limits are kept per route rather
+    than per path.
+
+    Newer Litestar releases set `path_template` in the scope. Older ones only
+    set the matched `route_handler`, whose templates are looked up in the
+    routes of the app.
+
+    Parameters
+    ----------
+    scope : dict[str, Any]
+        The ASGI scope of the request, after routing.
+
+    Returns
+    -------
+    str | None
+        The path template, or None if the request matched no route.
+    """
+    template = scope.get("path_template")
+    if template:
+        return template
+    handler = scope.get("route_handler")
+    app = scope.get("app")
+    if handler is None or app is None:
+        return None
+    templates = _handler_templates(app, handler)
+    if len(templates) <= 1:
+        return templates[0] if templates else None
+
+    # A route handler with several paths: the template matching the path
+    segments = scope["path"].strip("/").split("/")
+    for template in templates:
+        parts = template.strip("/").split("/")
+        if len(parts) == len(segments) and all(
+            part.startswith("{") or part == segment
+            for part, segment in zip(parts, segments)
+        ):
+            return template
+    return None
+
+
+def route_key(scope: dict[str, Any]) -> str:
+    """Returns the method and the path template of the route of a request
+    (`"POST /chat/{user_id}"`), with the fixed template `unmatched` if it
+    matched no route."""
+    return f"{scope.get('method')} {route_template(scope) or 'unmatched'}"
@@ -0,0 +1,166 @@
+"""Admission control of the chat turns within a worker.
+
+A chat turn holds a model call open for seconds, so a worker that accepts
+every turn of a burst makes all of them slow before any fails. The
+`AdmissionController` runs at most a fixed number of turns at once and queues
+a bounded number of others in arrival order. Turns that find the queue full or
+wait in it too long are shed with 429 Too Many Requests and a Retry-After
+estimated from the recent turn durations, so clients back off and the turns
+that are admitted keep their latency.
+"""
+
+import asyncio
+import collections
+import time
+
+from litestar.types import ASGIApp, Receive, Scope, Send
+
+from src.asgi import route_key
+
+from .metrics import (
+    ADMISSION_IN_FLIGHT,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_QUEUE_TIME,
+    ADMISSION_SHED,
+)
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a request is shed by admission control."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Server is overloaded ({reason}), retry later")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded, FIFO wait queue."""
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        routes: list[str],
+        queue_size: int = 0,
+        queue_timeout: float = 5.0,
+        alpha: float = 0.1,
+    ):
+        """Initializes the admission controller.
+
+        Parameters
+        ----------
+        max_concurrency : int
+            The maximum number of admitted requests, 0 for no limit.
+        routes : list[str]
+            The routes under admission control (`"POST /chat/{user_id}"`).
+        queue_size : int
+            The maximum number of requests waiting to be admitted.
+        queue_timeout : float
+            The maximum seconds a request waits to be admitted.
+        alpha : float
+            The smoothing factor of the average duration of the admitted
+            requests, for the Retry-After estimate.
+        """
+        self.max_concurrency = max_concurrency
+        self.routes = set(routes)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.alpha = alpha
+        self.active = 0
+        self.waiting = 0
+        self.waiters: collections.deque[asyncio.Future] = collections.deque()
+        self.duration = 1.0
+
+    def retry_after(self) -> float:
+        """Estimates the seconds until a request would be admitted: the time
+        to work off the queue at the average request duration."""
+        return self.duration * (self.waiting + 1) / max(self.max_concurrency, 1)
+
+    def _shed(self, reason: str) -> AdmissionRejectedError:
+        ADMISSION_SHED.inc(reason)
+        return AdmissionRejectedError(reason, retry_after=self.retry_after())
+
+    async def acquire(self):
+        """Waits until the request is admitted.
+
+        Raises
+        ------
+        AdmissionRejectedError
+            If the queue is full or the request waited longer than the queue
+            timeout.
+        """
+        if self.max_concurrency <= 0:
+            return
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+            ADMISSION_IN_FLIGHT.labels().set(self.active)
+            ADMISSION_QUEUE_TIME.observe(value=0.0)
+            return
+        if self.waiting >= self.queue_size:
+            raise self._shed("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.waiting += 1
+        ADMISSION_QUEUE_DEPTH.labels().set(self.waiting)
+        start = time.monotonic()
+        try:
+            # A released slot is handed over to the waiter, see `release`
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except TimeoutError:
+            raise self._shed("queue_timeout") from None
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Cancelled after the slot was handed over
+                self.release()
+            raise
+        finally:
+            self.waiting -= 1
+            ADMISSION_QUEUE_DEPTH.labels().set(self.waiting)
+        ADMISSION_QUEUE_TIME.observe(value=time.monotonic() - start)
+
+    def release(self, duration: float | None = None):
+        """Releases the slot of an admitted request, handing it over to the
+        next waiting request if any.
+
+        Parameters
+        ----------
+        duration : float | None
+            The seconds the request held the slot, for the Retry-After estimate.
+        """
+        if self.max_concurrency <= 0:
+            return
+        if duration is not None:
+            self.duration += self.alpha * (duration - self.duration)
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+        ADMISSION_IN_FLIGHT.labels().set(self.active)
+
+
+class AdmissionMiddleware:
+    """ASGI middleware admitting the requests of the routes under admission
+    control through the `AdmissionController` in `app.state.admission`."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        admission: AdmissionController | None = (
+            getattr(scope["app"].state, "admission", None)
+            if scope["type"] == "http"
+            else None
+        )
+        if admission is None or route_key(scope) not in admission.routes:
+            await self.app(scope, receive, send)
+            return
+
+        await admission.acquire()
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release(time.monotonic() - start)
@@ -1,23 +1,59 @@
 """Minimal Litestar application."""
 
 import os
+import math
+import asyncio
 import logging
+import contextlib
+import datetime
+from typing import Annotated, Any, AsyncIterator
 
 from litestar import Litestar, get, post, delete, Request, Response, status_codes
+from litestar.background_tasks import BackgroundTask
 from litestar.datastructures import State
+from litestar.params import Parameter
+from litestar.response import ServerSentEvent, ServerSentEventMessage
 from litestar.config.cors import CORSConfig
 
 import google.auth
 
-from src.backend.config import settings
-from src.config import LogLevel
-from src.schemas import Message, Conversation, Role
-
-from .db import FirestoreDB
-from .model import ChatBot
+from src.backend.config import settings, CassetteMode, StoreBackend
+from src.logs import LoggingMiddleware, log_pipeline
+from src.tracing import TracingMiddleware, tracer
+from src.schemas import (
+    Message,
+    Conversation,
+    ConversationPage,
+    Role,
+    Summary,
+    SummaryStatus,
+)
 
-logging.basicConfig(
-    level=LogLevel.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s"
+from .admission import AdmissionController, AdmissionMiddleware, AdmissionRejectedError
+from .model import ChatBot, Turn
+from .session import ConversationSession
+from .cache import ConversationCache
+from .codec import TYPE_ENCODERS
+from .metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware, record_startup
+from .jobs import SummaryJobQueue
+from .locks import StripedLock
+from .ratelimit import (
+    RateLimitExceededError,
+    RateLimitMiddleware,
+    RequestRateLimiter,
+    create_counter_store,
+)
+from .router import ModelRouter
+from .scheduler import ModelQueueTimeoutError, ModelScheduler
+from .startup import STARTUP
+from .store import ConversationConflictError, ConversationStore, create_store
+
+log_pipeline.configure(
+    level=settings.log_level,
+    format=settings.log_format,
+    sample_rate=settings.log_sample_rate,
+    route_sample_rates=settings.log_route_sample_rates,
+    queue_size=settings.log_queue_size,
 )
 
 
@@ -50,6 +86,130 @@ def internal_server_error_handler(request: Request, exc: Exception) -> Response:
     )
 
 
+def conflict_error_handler(
+    request: Request, exc: ConversationConflictError
+) -> Response:
+    """This function will handle concurrent turns on the same conversation
+
+    Parameters
+    ----------
+    request: Request
+        The request object
+    exc: ConversationConflictError
+        The exception that was raised
+
+    Returns
+    -------
+    Response
+        The response object
+    """
+    logging.warning(
+        {
+            "path": request.url.path,
+            "method": request.method,
+            "reason": str(exc),
+        }
+    )
+    return Response(
+        status_code=status_codes.HTTP_409_CONFLICT,
+        content={"detail": str(exc)},
+    )
+
+
+def rate_limit_exceeded_handler(
+    request: Request, exc: RateLimitExceededError
+) -> Response:
+    """This function will handle requests over a rate limit
+
+    Parameters
+    ----------
+    request: Request
+        The request object
+    exc: RateLimitExceededError
+        The exception that was raised
+
+    Returns
+    -------
+    Response
+        The response object
+    """
+    logging.warning(
+        {
+            "path": request.url.path,
+            "method": request.method,
+            "reason": str(exc),
+        }
+    )
+    return Response(
+        status_code=status_codes.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(math.ceil(exc.retry_after), 1))},
+    )
+
+
+def admission_rejected_handler(
+    request: Request, exc: AdmissionRejectedError
+) -> Response:
+    """This function will handle requests shed by admission control
+
+    Parameters
+    ----------
+    request: Request
+        The request object
+    exc: AdmissionRejectedError
+        The exception that was raised
+
+    Returns
+    -------
+    Response
+        The response object
+    """
+    logging.warning(
+        {
+            "path": request.url.path,
+            "method": request.method,
+            "reason": str(exc),
+        }
+    )
+    return Response(
+        status_code=status_codes.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(math.ceil(exc.retry_after), 1))},
+    )
+
+
+def model_queue_timeout_handler(
+    request: Request, exc: ModelQueueTimeoutError
+) -> Response:
+    """This function will handle model calls that timed out waiting for the
+    rate limit of the model
+
+    Parameters
+    ----------
+    request: Request
+        The request object
+    exc: ModelQueueTimeoutError
+        The exception that was raised
+
+    Returns
+    -------
+    Response
+        The response object
+    """
+    logging.warning(
+        {
+            "path": request.url.path,
+            "method": request.method,
+            "reason": str(exc),
+        }
+    )
+    return Response(
+        status_code=status_codes.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(math.ceil(exc.retry_after), 1))},
+    )
+
+
 def init_gcp_credentials():
     """This function initializes the Google Cloud Platform credentials.
     It will check if there is a *.json file in the keys directory and set the
@@ -77,9 +237,211 @@ def init_gcp_credentials():
     return google.auth.default()
 
 
+# ETag of a conversation that doesn't exist, whose `updated` changes on every read
+EMPTY_ETAG = '"0"'
+
+
+def conversation_etag(conversation: Conversation) -> str:
+    """This function derives the ETag of a conversation from its `updated`
+    timestamp, which changes on every write.
+
+    Parameters
+    ----------
+    conversation : Conversation
+        The conversation data.
+
+    Returns
+    -------
+    str
+        The quoted entity tag.
+    """
+    return f'"{conversation.updated.timestamp():.6f}"'
+
+
+def since_index(conversation: Conversation, since: datetime.datetime) -> int:
+    """This function finds the first history entry created after a timestamp.
+
+    Entries stored before entries were timestamped count as created after it
+    if the conversation was updated after it, so they are never missed.
+
+    Parameters
+    ----------
+    conversation : Conversation
+        The conversation data.
+    since : datetime.datetime
+        The timestamp, in UTC if it is naive.
+
+    Returns
+    -------
+    int
+        The index of the first entry created after the timestamp, the length
+        of the history if there is none.
+    """
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=datetime.UTC)
+    updated = conversation.updated > since
+    return next(
+        (
+            index
+            for index, entry in enumerate(conversation.history)
+            if (entry.created > since if entry.created is not None else updated)
+        ),
+        len(conversation.history),
+    )
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """This function checks an `If-None-Match` header against an ETag.
+
+    Parameters
+    ----------
+    if_none_match : str | None
+        The `If-None-Match` request header.
+    etag : str
+        The current quoted entity tag.
+
+    Returns
+    -------
+    bool
+        Whether the client copy is still current.
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def finish_turn(session: ConversationSession, data: Message, turn: Turn) -> bool:
+    """This function adds the model turn to the conversation and, once the
+    conversation is done, its summary.
+
+    Parameters
+    ----------
+    session : ConversationSession
+        The conversation session.
+    data : Message
+        The user message of the turn.
+    turn : Turn
+        The model turn.
+
+    Returns
+    -------
+    bool
+        Whether the summary still has to be generated by a summary job.
+    """
+    user_id = session.user_id
+    logging.debug("Adding MODEL message to conversation for User ID %s...", user_id)
+    session.add_message(message=Message(text=turn.reply), role=Role.MODEL)
+
+    if not (turn.done or "DONE" in data.text):
+        return False
+
+    if turn.summary and turn.summary_english:
+        logging.debug("Conversation for User ID %s is DONE! Adding Summary...", user_id)
+        session.conversation.add_summary(
+            summary=turn.summary, summary_english=turn.summary_english
+        )
+        return False
+
+    logging.debug("Conversation for User ID %s is DONE! Requesting Summary...", user_id)
+    session.conversation.request_summary()
+    return True
+
+
+def create_model() -> ChatBot:
+    """This function creates the chat bot from the settings.
+
+    Creating the first chat bot imports the Vertex AI SDK, which takes seconds,
+    so it is run in a thread during the startup.
+
+    Returns
+    -------
+    ChatBot
+        The chat bot.
+    """
+    return ChatBot(
+        project_id=settings.project_id,
+        location=settings.location,
+        genai_id=settings.genai_id,
+        genai_instructions=(
+            settings.genai_structured_instructions
+            if settings.genai_structured_output
+            else settings.genai_instructions
+        ),
+        genai_config=settings.genai_config,
+        genai_safety_config=settings.genai_safety_config,
+        context_recent_turns=settings.context_recent_turns,
+        context_max_tokens=settings.context_max_tokens,
+        structured_output=settings.genai_structured_output,
+        cassette_mode=settings.genai_cassette_mode,
+        cassette_path=settings.genai_cassette,
+        cassette_match=settings.genai_cassette_match,
+        cassette_timing_scale=settings.genai_cassette_timing_scale,
+        genai_fallbacks=settings.genai_fallbacks,
+        router=ModelRouter(
+            scheduler=ModelScheduler(
+                rpm=settings.genai_rpm,
+                tpm=settings.genai_tpm,
+                limits=settings.genai_rate_limits,
+                queue_timeout=settings.genai_queue_timeout,
+                output_tokens=settings.genai_output_tokens_estimate,
+            ),
+            strategy=settings.genai_routing,
+            deadline=settings.genai_deadline,
+            attempt_timeout=settings.genai_attempt_timeout,
+            max_retries=settings.genai_max_retries,
+            retry_delay=settings.genai_retry_delay,
+            max_retry_delay=settings.genai_max_retry_delay,
+            hedge_percentile=settings.genai_hedge_percentile,
+            hedge_min_samples=settings.genai_hedge_min_samples,
+            error_threshold=settings.genai_error_threshold,
+        ),
+    )
+
+
+async def warm_up(db: ConversationStore, model: ChatBot):
+    """This function opens the connections of the conversation store and the
+    model endpoints and fetches their credentials before the app is ready, so
+    the first request doesn't pay for them. Failures are only logged.
+
+    Parameters
+    ----------
+    db : ConversationStore
+        The conversation store.
+    model : ChatBot
+        The chat bot.
+
+    Returns
+    -------
+    None
+    """
+
+    async def warm_up_store():
+        with STARTUP.phase("warmup_store"):
+            await db.fetch_version(user_id="warmup")
+
+    async def warm_up_model():
+        with STARTUP.phase("warmup_model"):
+            await model.warmup()
+
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(warm_up_store(), warm_up_model(), return_exceptions=True),
+            timeout=settings.startup_warmup_timeout,
+        )
+    except TimeoutError:
+        logging.warning(
+            f"Warm-up did not finish within {settings.startup_warmup_timeout}s"
+        )
+        return
+    for name, result in zip(("store", "model"), results):
+        if isinstance(result, Exception):
+            logging.warning(f"Warm-up of the {name} failed: {result}")
+
+
 ### STARTUP ###
 async def app_startup(app: Litestar):
-    """This function initializes the database and models.
+    """This function initializes the database and models and warms them up.
 
     It is called before the app has started.
 
@@ -94,50 +456,135 @@ async def app_startup(app: Litestar):
     """
     logging.info("Initializing Application...")
 
-    # Initialize Google Cloud Credentials
-    _, project_id = init_gcp_credentials()
-    assert (
-        project_id == settings.project_id
-    ), f"Project ID mismatch: {project_id} != {settings.project_id}"
-    logging.info(
-        f"Using project `{project_id}`, location `{settings.location}`, and service account `{settings.service_account_email}`"
-    )
-
-    # Initialize Firestore
-    logging.info(
-        f"Initializing database connections to {settings.firestore_db} in project {settings.project_id}..."
-    )
-    if not getattr(app.state, "db", None):
-        app.state.db = FirestoreDB(
-            project_id=settings.project_id,
-            database=settings.firestore_db,
-            collection_name="conversations",
+    with STARTUP.phase("startup"):
+        # Initialize Tracing
+        tracer.configure(
+            service_name="backend",
+            exporter=settings.tracing_exporter,
+            path=settings.tracing_file,
+            sample_rate=settings.tracing_sample_rate,
         )
 
-    # Initialize Generative Model
-    logging.info(f"Initializing model {settings.genai_id}...")
-    if not getattr(app.state, "model", None):
-        app.state.model = ChatBot(
-            project_id=settings.project_id,
-            location=settings.location,
-            genai_id=settings.genai_id,
-            genai_instructions=settings.genai_instructions,
-            genai_config=settings.genai_config,
-            genai_safety_config=settings.genai_safety_config,
-        )
+        # Initialize Generative Model in a thread, while the credentials and
+        # the conversation store are initialized
+        model_task = None
+        if not getattr(app.state, "model", None):
+            logging.info(f"Initializing model {settings.genai_id}...")
+
+            async def init_model() -> ChatBot:
+                with STARTUP.phase("model"):
+                    return await asyncio.to_thread(create_model)
+
+            model_task = asyncio.create_task(init_model())
+
+        try:
+            # Initialize Google Cloud Credentials, unless both the model calls
+            # and the conversation store are local
+            with STARTUP.phase("credentials"):
+                if (
+                    settings.genai_cassette_mode == CassetteMode.REPLAY
+                    and settings.conversation_store != StoreBackend.FIRESTORE
+                ):
+                    logging.info(
+                        "Replaying model calls offline, skipping GCP credentials"
+                    )
+                else:
+                    _, project_id = await asyncio.to_thread(init_gcp_credentials)
+                    assert (
+                        project_id == settings.project_id
+                    ), f"Project ID mismatch: {project_id} != {settings.project_id}"
+                    logging.info(
+                        f"Using project `{project_id}`, location `{settings.location}`, and service account `{settings.service_account_email}`"
+                    )
+
+            # Initialize Conversation Store
+            logging.info(
+                f"Initializing {settings.conversation_store} conversation store..."
+            )
+            with STARTUP.phase("store"):
+                if not getattr(app.state, "db", None):
+                    app.state.db = create_store(settings)
+
+            if model_task is not None:
+                app.state.model = await model_task
+        except BaseException:
+            if model_task is not None:
+                model_task.cancel()
+            raise
+
+        # Initialize per-user chat locks
+        if not getattr(app.state, "locks", None):
+            app.state.locks = StripedLock(stripes=settings.chat_lock_stripes)
+
+        # Initialize the rate limits of the chat requests
+        if not getattr(app.state, "rate_limiter", None):
+            app.state.rate_limiter = RequestRateLimiter(
+                store=create_counter_store(settings),
+                routes=settings.rate_limit_routes,
+                user_limit=settings.rate_limit_user,
+                global_limit=settings.rate_limit_global,
+                window=settings.rate_limit_window,
+            )
+
+        # Initialize admission control of the chat turns
+        if not getattr(app.state, "admission", None):
+            app.state.admission = AdmissionController(
+                max_concurrency=settings.admission_max_concurrency,
+                routes=settings.admission_routes,
+                queue_size=settings.admission_queue_size,
+                queue_timeout=settings.admission_queue_timeout,
+            )
+
+        # Prime the connections and credentials before the app is ready
+        if settings.startup_warmup:
+            await warm_up(db=app.state.db, model=app.state.model)
+
+        # Initialize background summary jobs and resume the ones left pending
+        if not getattr(app.state, "summaries", None):
+            app.state.summaries = SummaryJobQueue(
+                db=app.state.db,
+                model=app.state.model,
+                workers=settings.summary_workers,
+                max_size=settings.summary_queue_size,
+                max_retries=settings.summary_max_retries,
+                retry_delay=settings.summary_retry_delay,
+                claim_timeout=settings.summary_claim_timeout,
+            )
+            await app.state.summaries.start()
+            resumed = await app.state.summaries.resume()
+            logging.info(f"Resumed {resumed} unfinished summaries")
+
+    STARTUP.mark("ready")
+    record_startup()
+    STARTUP.log()
 
 
 ### SHUTDOWN ###
-async def app_shutdown():
+async def app_shutdown(app: Litestar):
     """This function closes things.
 
     It is called after the app has shutdown.
 
+    Parameters
+    ----------
+    app : Litestar
+        The Litestar app instance.
+
     Returns
     -------
     None
     """
     logging.info("Closing...")
+    if getattr(app.state, "summaries", None):
+        await app.state.summaries.stop()
+        app.state.summaries = None
+    if getattr(app.state, "db", None):
+        await app.state.db.close()
+        app.state.db = None
+    if getattr(app.state, "rate_limiter", None):
+        await app.state.rate_limiter.close()
+        app.state.rate_limiter = None
+    tracer.shutdown()
 
 
 @get("/")
@@ -147,23 +594,94 @@ async def root() -> dict[str, str]:
 
 
 @get("/chat/{user_id:str}")
-async def get_chat_history(state: State, user_id: str) -> Conversation:
+async def get_chat_history(
+    state: State,
+    request: Request,
+    user_id: str,
+    cursor: Annotated[int, Parameter(ge=0)] = 0,
+    limit: Annotated[int | None, Parameter(ge=1)] = None,
+    since: datetime.datetime | None = None,
+) -> Response[ConversationPage]:
     """Route Handler that retrieves the chat history for a user.
 
+    Only the history entries from `cursor` on are returned, so a client that
+    already has the first entries passes the `cursor` of its last response
+    to receive the new ones. The response carries an ETag derived from the
+    `updated` timestamp of the conversation (a constant one while it doesn't
+    exist), and a request whose `If-None-Match` header holds the current ETag
+    is answered with 304 Not Modified and no body.
+
     Parameters
     ----------
     state : State
         The state of the application.
+    request : Request
+        The request object.
     user_id : str
         The user ID.
+    cursor : int
+        The index of the first history entry to return.
+    limit : int | None
+        The maximum number of history entries to return, None for all.
+    since : datetime.datetime | None
+        Only return the history entries created after this timestamp, which
+        is taken as UTC if it has no timezone.
 
     Returns
     -------
-    Conversation
-        The chat history.
+    Response[ConversationPage]
+        The chat history page, with the cursor of the next page and the
+        length of the full history.
     """
-    db: FirestoreDB = state.db
-    return await db.fetch_conversation(user_id=user_id)
+    db: ConversationStore = state.db
+    conversation, _, version = await db.load_conversation(user_id=user_id)
+
+    etag = conversation_etag(conversation) if version is not None else EMPTY_ETAG
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(
+            content=None,
+            status_code=status_codes.HTTP_304_NOT_MODIFIED,
+            headers=headers,
+        )
+
+    if since is not None:
+        cursor = max(cursor, since_index(conversation, since))
+    page = ConversationPage.from_conversation(
+        conversation=conversation, start=cursor, limit=limit
+    )
+    return Response(content=page, headers=headers)
+
+
+@get("/chat/{user_id:str}/summary")
+async def get_chat_summary(state: State, user_id: str) -> Summary:
+    """Route Handler that retrieves the summary of the chat of a user and the
+    status of its generation.
+
+    Parameters
+    ----------
+    state : State
+        The state of the application.
+    user_id : str
+        The user ID.
+
+    Returns
+    -------
+    Summary
+        The summary status and, once done, the summaries.
+    """
+    db: ConversationStore = state.db
+    summaries: SummaryJobQueue = state.summaries
+
+    conversation = await db.fetch_conversation(user_id=user_id)
+    status = conversation.summary_status
+    if status == SummaryStatus.PENDING:
+        status = summaries.status(user_id) or status
+    return Summary(
+        status=status,
+        summary=conversation.summary,
+        summary_english=conversation.summary_english,
+    )
 
 
 @post("/test/chat/{user_id:str}")
@@ -185,13 +703,13 @@ async def test_chat(state: State, user_id: str, data: Message) -> Message:
     Message
         The response message.
     """
-    logging.debug(f"Request: {data}")
+    logging.debug("Request: %s", data)
 
     # Generate response
-    logging.debug(f"Echoing response for User ID {user_id}...")
+    logging.debug("Echoing response for User ID %s...", user_id)
     response = data
 
-    logging.debug(f"Response: {response.text}")
+    logging.debug("Response: %s", response.text)
     return Message(text=response.text)
 
 
@@ -213,42 +731,124 @@ async def chat(state: State, user_id: str, data: Message) -> Message:
     Message
         The response message.
     """
-    logging.debug(f"Request: {data}")
+    logging.debug("Request: %s", data)
 
     doctor_fresh: ChatBot = state.model
-    db: FirestoreDB = state.db
+    db: ConversationStore = state.db
+    locks: StripedLock = state.locks
+    summaries: SummaryJobQueue = state.summaries
 
-    # Add user message to history
-    logging.debug(
-        f"Updating conversation for User ID {user_id} with USER message in firestore..."
-    )
-    await db.add_message(user_id=user_id, message=data, role=Role.USER)
+    # Serialize turns of the same user, load the conversation once,
+    # apply the turn in memory and commit once
+    async with (
+        locks.lock(user_id=user_id, timeout=settings.chat_lock_timeout),
+        db.session(user_id=user_id) as session,
+    ):
+        # Add user message to history
+        logging.debug("Adding USER message to conversation for User ID %s...", user_id)
+        session.add_message(message=data, role=Role.USER)
 
-    # Generate response
-    logging.debug(f"Generating GenAI response for User ID {user_id}...")
-    response = await doctor_fresh.generate_response(
-        conversation=await db.fetch_conversation(user_id=user_id)
-    )
+        # Generate response
+        logging.debug("Generating GenAI response for User ID %s...", user_id)
+        turn = await doctor_fresh.generate_turn(conversation=session.conversation)
 
-    # Add model message to history
-    logging.debug(
-        f"Updating conversation for User ID {user_id} with MODEL message in firestore..."
-    )
-    await db.add_message(user_id=user_id, message=response, role=Role.MODEL)
+        # Add model message (and summary) to history
+        summary_job = finish_turn(session=session, data=data, turn=turn)
 
-    if "DONE" in response.text or "DONE" in data.text:
-        logging.debug(
-            f"Conversation for User ID {user_id} is DONE! Generating Summary..."
-        )
-        await db.update_conversation(
-            user_id=user_id,
-            conversation_data=await doctor_fresh.add_summary(
-                conversation=await db.fetch_conversation(user_id=user_id)
-            ),
-        )
+        logging.debug("Committing conversation for User ID %s...", user_id)
 
-    logging.debug(f"Response: {response.text}")
-    return Message(text=response.text)
+    # Generate the summary after the response is sent
+    if summary_job:
+        summaries.submit(user_id)
+
+    logging.debug("Response: %s", turn.reply)
+    return Message(text=turn.reply)
+
+
+@post("/chat/{user_id:str}/stream")
+async def chat_stream(state: State, user_id: str, data: Message) -> ServerSentEvent:
+    """Route Handler that starts/continues a chat with a user and streams the
+    response as Server-Sent Events while it is generated.
+
+    Every text chunk is sent as a message event. Once the response is complete
+    and the conversation is stored, a `done` event is sent (or an `error` event
+    if the turn failed). Nothing is stored if the client disconnects early.
+
+    Parameters
+    ----------
+    state : State
+        The state of the application.
+    user_id : str
+        The user ID.
+    data : Message
+        The POST request data.
+
+    Returns
+    -------
+    ServerSentEvent
+        The stream of response chunks.
+    """
+    logging.debug("Request: %s", data)
+
+    doctor_fresh: ChatBot = state.model
+    db: ConversationStore = state.db
+    locks: StripedLock = state.locks
+    summaries: SummaryJobQueue = state.summaries
+
+    # Take the lock and load the conversation before the response starts,
+    # so a concurrent turn is still answered with 409 Conflict
+    stack = contextlib.AsyncExitStack()
+    await stack.enter_async_context(
+        locks.lock(user_id=user_id, timeout=settings.chat_lock_timeout)
+    )
+    try:
+        session = await stack.enter_async_context(db.session(user_id=user_id))
+    except BaseException:
+        await stack.aclose()
+        raise
+
+    async def events() -> AsyncIterator[ServerSentEventMessage]:
+        try:
+            async with stack:
+                session.add_message(message=data, role=Role.USER)
+
+                logging.debug("Streaming GenAI response for User ID %s...", user_id)
+                if doctor_fresh.structured_output:
+                    # A structured turn can only be parsed once it is complete
+                    turn = await doctor_fresh.generate_turn(
+                        conversation=session.conversation
+                    )
+                    yield ServerSentEventMessage(data=turn.reply)
+                else:
+                    chunks = []
+                    async for chunk in doctor_fresh.stream_response(
+                        conversation=session.conversation
+                    ):
+                        chunks.append(chunk)
+                        yield ServerSentEventMessage(data=chunk)
+                    reply = "".join(chunks)
+                    turn = Turn(reply=reply, done="DONE" in reply)
+
+                summary_job = finish_turn(session=session, data=data, turn=turn)
+
+                logging.debug("Committing conversation for User ID %s...", user_id)
+        except ConversationConflictError as e:
+            yield ServerSentEventMessage(event="error", data=str(e))
+            return
+        except Exception as e:
+            logging.error(f"Error streaming response for User ID {user_id}: {e}")
+            yield ServerSentEventMessage(event="error", data="Internal Server Error")
+            return
+
+        # Generate the summary after the response is sent
+        if summary_job:
+            summaries.submit(user_id)
+
+        logging.debug("Response: %s", turn.reply)
+        yield ServerSentEventMessage(event="done", data="")
+
+    # Releases the lock if the stream never ran
+    return ServerSentEvent(events(), background=BackgroundTask(stack.aclose))
 
 
 @delete("/chat/{user_id:str}")
@@ -267,10 +867,53 @@ async def delete_chat(state: State, user_id: str) -> None:
     dict[str, Any]
         The response message.
     """
-    db: FirestoreDB = state.db
+    db: ConversationStore = state.db
     await db.delete_conversation(user_id=user_id)
 
 
+@get("/stats/cache")
+async def get_cache_stats(state: State) -> dict[str, int]:
+    """Route Handler that outputs the conversation cache counters.
+
+    Parameters
+    ----------
+    state : State
+        The state of the application.
+
+    Returns
+    -------
+    dict[str, int]
+        The cache size and hit/miss/eviction counters (empty if the cache is disabled).
+    """
+    cache: ConversationCache | None = getattr(state.db, "cache", None)
+    return cache.stats() if cache is not None else {}
+
+
+@get("/stats/startup")
+async def get_startup_stats() -> dict[str, Any]:
+    """Route Handler that outputs the startup profile of the worker process.
+
+    Returns
+    -------
+    dict[str, Any]
+        The seconds from the process start to the startup milestones and the
+        durations of the startup phases.
+    """
+    return STARTUP.report()
+
+
+@get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response[str]:
+    """Route Handler that outputs the metrics in the Prometheus text format.
+
+    Returns
+    -------
+    Response[str]
+        The metrics of this worker process.
+    """
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 @delete("/chat")
 async def delete_all_chats(state: State) -> None:
     """Route Handler that deletes all chat histories.
@@ -285,8 +928,11 @@ async def delete_all_chats(state: State) -> None:
     dict[str, str]
         The response message.
     """
-    db: FirestoreDB = state.db
-    await db.clear_collection(batch_size=100)
+    db: ConversationStore = state.db
+    await db.clear_collection(
+        batch_size=settings.purge_batch_size,
+        concurrency=settings.purge_concurrency,
+    )
 
 
 # Initialize the Litestar app
@@ -294,15 +940,37 @@ app = Litestar(
     route_handlers=[
         root,
         get_chat_history,
+        get_chat_summary,
         chat,
+        chat_stream,
         delete_chat,
         delete_all_chats,
         test_chat,
+        get_cache_stats,
+        get_startup_stats,
+        get_metrics,
     ],
     on_startup=[app_startup],
     on_shutdown=[app_shutdown],
     cors_config=CORSConfig(allow_origins=settings.cors_allow_origins),
+    type_encoders=TYPE_ENCODERS,
+    middleware=[
+        TracingMiddleware,
+        LoggingMiddleware,
+        MetricsMiddleware,
+        RateLimitMiddleware,
+        AdmissionMiddleware,
+    ],
+    # Logging is configured by `log_pipeline`
+    logging_config=None,
     exception_handlers={
         status_codes.HTTP_500_INTERNAL_SERVER_ERROR: internal_server_error_handler,
+        ConversationConflictError: conflict_error_handler,
+        ModelQueueTimeoutError: model_queue_timeout_handler,
+        AdmissionRejectedError: admission_rejected_handler,
+        RateLimitExceededError: rate_limit_exceeded_handler,
     },
 )
+
+# The app module is imported, the first milestone of the startup
+STARTUP.mark("imported")
@@ -0,0 +1,380 @@
+"""In-process conversation cache."""
+
+import time
+import logging
+from typing import Any
+from collections import OrderedDict
+
+from src.schemas import Role, Message, Conversation, SummaryStatus
+
+from .session import ConversationSession
+from .store import ConversationStore, is_complete
+
+
+class CacheEntry:
+    """A cached conversation together with its store bookkeeping."""
+
+    __slots__ = ("conversation", "persisted", "version", "expires_at", "complete")
+
+    def __init__(
+        self,
+        conversation: Conversation,
+        persisted: int,
+        version: Any,
+        expires_at: float,
+    ):
+        self.conversation = conversation
+        self.persisted = persisted
+        self.version = version
+        self.expires_at = expires_at
+        # Whether the whole history is loaded, see `ConversationStore`
+        self.complete = is_complete(conversation)
+
+
+def copy_conversation(conversation: Conversation) -> Conversation:
+    """Copies a conversation so that appending to the copy doesn't touch the
+    original. History entries are never mutated in place, so a new history list
+    is enough."""
+    return conversation.model_copy(update={"history": list(conversation.history)})
+
+
+class ConversationCache:
+    """Bounded LRU cache of conversations with a time-to-live per entry."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        """Initializes the cache.
+
+        Parameters
+        ----------
+        max_size : int
+            The maximum number of cached conversations.
+        ttl : float
+            The number of seconds an entry is kept after it was stored.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: str, version: Any, full: bool = True) -> CacheEntry | None:
+        """Returns the entry of the user if it is fresh and matches the version.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        version : Any
+            The current version of the conversation in the store.
+        full : bool
+            Whether the entry must hold the whole history. A partially loaded
+            conversation is a miss then.
+
+        Returns
+        -------
+        CacheEntry | None
+            The cached entry, or None on a miss.
+        """
+        entry = self.entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry.version != version or entry.expires_at < time.monotonic():
+            del self.entries[user_id]
+            self.misses += 1
+            return None
+        if full and not entry.complete:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(user_id)
+        self.hits += 1
+        return entry
+
+    def put(self, user_id: str, conversation: Conversation, persisted: int, version):
+        """Stores an entry, evicting the least recently used ones if needed.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        conversation : Conversation
+            The conversation data.
+        persisted : int
+            The number of persisted history entries.
+        version : Any
+            The version of the conversation in the store.
+        """
+        if self.max_size <= 0:
+            return
+
+        self.entries[user_id] = CacheEntry(
+            conversation=conversation,
+            persisted=persisted,
+            version=version,
+            expires_at=time.monotonic() + self.ttl,
+        )
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: str):
+        """Removes the entry of the user."""
+        self.entries.pop(user_id, None)
+
+    def clear(self):
+        """Removes all entries."""
+        self.entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        """Returns the cache counters."""
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class CachedStore:
+    """Write-through cache in front of a `ConversationStore`.
+
+    Reads only fetch the version of the conversation from the store and serve
+    the cached conversation when the version matches, so a stale entry is
+    never returned even when another worker wrote to the store. Writes go to
+    the store first and then update the cache with the new version.
+    """
+
+    def __init__(self, store: ConversationStore, cache: ConversationCache):
+        """Initializes the cached store.
+
+        Parameters
+        ----------
+        store : ConversationStore
+            The underlying conversation store.
+        cache : ConversationCache
+            The conversation cache.
+        """
+        self.store = store
+        self.cache = cache
+
+    async def load_conversation(
+        self, user_id: str, full: bool = True
+    ) -> tuple[Conversation, int, Any]:
+        """Loads the conversation from the cache, or from the store on a miss.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        full : bool
+            Whether the whole history is needed, see `ConversationStore`.
+
+        Returns
+        -------
+        tuple[Conversation, int, Any]
+            The conversation data, the number of persisted history entries and
+            the version of the conversation.
+        """
+        version = await self.store.fetch_version(user_id=user_id)
+        # Entries always have a version, so a missing conversation is a miss
+        # that also drops the entry of a deleted conversation
+        entry = self.cache.get(user_id=user_id, version=version, full=full)
+        if entry is not None:
+            logging.debug("Conversation Cache hit for User ID %s", user_id)
+            return (
+                copy_conversation(entry.conversation),
+                entry.persisted,
+                entry.version,
+            )
+
+        conversation, persisted, version = await self.store.load_conversation(
+            user_id=user_id, full=full
+        )
+        if version is not None:
+            self.cache.put(
+                user_id=user_id,
+                conversation=copy_conversation(conversation),
+                persisted=persisted,
+                version=version,
+            )
+        return conversation, persisted, version
+
+    async def fetch_version(self, user_id: str) -> Any | None:
+        """Fetches the version of the conversation from the store."""
+        return await self.store.fetch_version(user_id=user_id)
+
+    async def fetch_conversation(self, user_id: str) -> Conversation:
+        """Fetches the conversation for the specified user.
+        If the conversation doesn't exist, will return an empty conversation.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+
+        Returns
+        -------
+        Conversation
+            The conversation data
+        """
+        conversation, _, _ = await self.load_conversation(user_id=user_id)
+        return conversation
+
+    async def save_conversation(
+        self,
+        user_id: str,
+        conversation: Conversation,
+        persisted: int = 0,
+        version: Any | None = None,
+    ) -> Any:
+        """Writes the conversation to the store and then to the cache.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        conversation : Conversation
+            The conversation data.
+        persisted : int
+            The number of history entries already stored.
+        version : Any | None
+            The version of the conversation when it was loaded.
+
+        Returns
+        -------
+        Any
+            The new version of the conversation.
+
+        Raises
+        ------
+        ConversationConflictError
+            If the conversation was written since it was loaded.
+        """
+        try:
+            version = await self.store.save_conversation(
+                user_id=user_id,
+                conversation=conversation,
+                persisted=persisted,
+                version=version,
+            )
+        except Exception:
+            self.cache.invalidate(user_id=user_id)
+            raise
+
+        self._put(user_id=user_id, conversation=conversation, version=version)
+        return version
+
+    def _put(self, user_id: str, conversation: Conversation, version: Any):
+        self.cache.put(
+            user_id=user_id,
+            conversation=copy_conversation(conversation),
+            persisted=len(conversation.history),
+            version=version,
+        )
+
+    def session(self, user_id: str) -> ConversationSession:
+        """Opens a unit of work over the conversation of the specified user.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+
+        Returns
+        -------
+        ConversationSession
+            The conversation session, to be used as an async context manager.
+        """
+        return ConversationSession(db=self, user_id=user_id)
+
+    async def add_message(self, user_id: str, message: Message, role: Role):
+        """Adds a message to the conversation.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        message : Message
+            The message data.
+        role : Role
+            The role of the message.
+        """
+        async with self.session(user_id=user_id) as session:
+            session.add_message(message=message, role=role)
+
+    async def update_conversation(
+        self, user_id: str, conversation_data: Conversation
+    ) -> Any:
+        """Updates the conversation data in the store and then in the cache.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        conversation_data : Conversation
+            The conversation data.
+
+        Returns
+        -------
+        Any
+            The new version of the conversation.
+        """
+        try:
+            version = await self.store.update_conversation(
+                user_id=user_id, conversation_data=conversation_data
+            )
+        except Exception:
+            self.cache.invalidate(user_id=user_id)
+            raise
+
+        self._put(user_id=user_id, conversation=conversation_data, version=version)
+        return version
+
+    async def delete_conversation(self, user_id: str):
+        """Deletes the conversation data.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        """
+        await self.store.delete_conversation(user_id=user_id)
+        self.cache.invalidate(user_id=user_id)
+
+    async def fetch_user_ids(self, summary_status: SummaryStatus) -> list[str]:
+        """Fetches the IDs of the users whose conversation has the summary status."""
+        return await self.store.fetch_user_ids(summary_status=summary_status)
+
+    async def clear_collection(
+        self, batch_size: int = 500, concurrency: int = 8
+    ) -> dict[str, int]:
+        """Clears all conversations.
+
+        Parameters
+        ----------
+        batch_size : int
+            The batch size for deletion.
+        concurrency : int
+            The maximum number of parallel deletions.
+
+        Returns
+        -------
+        dict[str, int]
+            The number of deleted conversations and messages.
+        """
+        try:
+            return await self.store.clear_collection(
+                batch_size=batch_size, concurrency=concurrency
+            )
+        finally:
+            self.cache.clear()
+
+    async def close(self):
+        """Closes the underlying store."""
+        self.cache.clear()
+        await self.store.close()
@@ -0,0 +1,267 @@
+"""Record and replay of the generative model calls.
+
+`CassetteModel` stands in for the `GenerativeModel` of the `ChatBot`. When
+recording, it forwards `generate_content_async` calls to the model and appends
+every request with its response chunks and their timings to a JSON lines
+cassette file. When replaying, it answers from the cassette without network
+access, waiting the recorded timings multiplied by `timing_scale` (1 for the
+original timing, 0 for none).
+
+Interactions are matched by a hash of the request (contents, generation and
+safety config, and streaming). Repeated identical requests replay their
+recordings in turn. In `sequence` mode any request replays the next recorded
+interaction with the same streaming mode, so recorded timings can drive
+conversations that differ from the recorded ones, e.g. in load tests.
+
+Calls that raise and streams that are not consumed to the end are not
+recorded.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import pathlib
+import threading
+import time
+from collections import defaultdict
+from enum import Enum, StrEnum
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterator
+
+from src.backend.config import CassetteMatch, CassetteMode
+
+if TYPE_CHECKING:
+    from vertexai.preview.generative_models import (
+        GenerationConfig,
+        GenerationResponse,
+        GenerativeModel,
+    )
+
+CASSETTE_VERSION = 1
+
+
+class CassetteMissError(LookupError):
+    """Raised when a replayed request is not in the cassette."""
+
+
+def _to_builtins(value: Any) -> Any:
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    if isinstance(value, StrEnum):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, dict):
+        return {
+            str(_to_builtins(key)): _to_builtins(item) for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [_to_builtins(item) for item in value]
+    return value
+
+
+def request_key(
+    contents: Any,
+    generation_config: "GenerationConfig | None",
+    safety_settings: Any,
+    stream: bool,
+) -> tuple[str, dict[str, Any]]:
+    """Returns the hash and the JSON-serializable form of a request.
+
+    Parameters
+    ----------
+    contents : Any
+        The model contents (strings, content dicts or `Content` objects).
+    generation_config : GenerationConfig | None
+        The generation config.
+    safety_settings : Any
+        The safety settings.
+    stream : bool
+        Whether the response is streamed.
+
+    Returns
+    -------
+    tuple[str, dict[str, Any]]
+        The request hash and the request.
+    """
+    request = {
+        "contents": _to_builtins(contents),
+        "generation_config": _to_builtins(generation_config),
+        "safety_settings": _to_builtins(safety_settings),
+        "stream": stream,
+    }
+    encoded = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest(), request
+
+
+class Cassette:
+    """Interactions of a cassette file, indexed for replay."""
+
+    # Serializes the appends of all cassettes, which may share a file
+    lock = threading.Lock()
+
+    def __init__(self, path: str):
+        """Initializes the cassette.
+
+        Parameters
+        ----------
+        path : str
+            The JSON lines file of the interactions.
+        """
+        self.path = pathlib.Path(path)
+        self.interactions: list[dict[str, Any]] = []
+        self._by_key: dict[str, Iterator[dict]] = {}
+        self._by_stream: dict[bool, Iterator[dict]] = {}
+
+    def load(self) -> "Cassette":
+        """Reads the interactions of the cassette file."""
+        with self.path.open(encoding="utf-8") as file:
+            self.interactions = [json.loads(line) for line in file if line.strip()]
+
+        by_key, by_stream = defaultdict(list), defaultdict(list)
+        for interaction in self.interactions:
+            by_key[interaction["key"]].append(interaction)
+            by_stream[interaction["request"]["stream"]].append(interaction)
+        self._by_key = {key: itertools.cycle(items) for key, items in by_key.items()}
+        self._by_stream = {
+            stream: itertools.cycle(items) for stream, items in by_stream.items()
+        }
+        return self
+
+    def find(self, key: str, stream: bool, match: CassetteMatch) -> dict[str, Any]:
+        """Returns the next recorded interaction of a request.
+
+        Raises
+        ------
+        CassetteMissError
+            If the cassette has no matching interaction.
+        """
+        interactions = (
+            self._by_key.get(key)
+            if match == CassetteMatch.EXACT
+            else self._by_stream.get(stream)
+        )
+        if interactions is None:
+            raise CassetteMissError(
+                f"No {'streamed ' if stream else ''}interaction {key[:12]} "
+                f"in cassette {self.path}"
+            )
+        return next(interactions)
+
+    def append(self, interaction: dict[str, Any]):
+        """Appends an interaction to the cassette file."""
+        line = json.dumps(interaction, ensure_ascii=False, default=str) + "\n"
+        with self.lock, self.path.open("a", encoding="utf-8") as file:
+            file.write(line)
+
+
+class CassetteModel:
+    """Drop-in for `GenerativeModel.generate_content_async` that records the
+    calls to a cassette or replays them from it."""
+
+    def __init__(
+        self,
+        path: str,
+        mode: CassetteMode,
+        model: "GenerativeModel | None" = None,
+        match: CassetteMatch = CassetteMatch.EXACT,
+        timing_scale: float = 1.0,
+    ):
+        """Initializes the cassette model.
+
+        Parameters
+        ----------
+        path : str
+            The cassette file.
+        mode : CassetteMode
+            Whether the calls are recorded or replayed.
+        model : GenerativeModel | None
+            The model the recorded calls are forwarded to.
+        match : CassetteMatch
+            How replayed requests are matched with the recorded ones.
+        timing_scale : float
+            The factor of the recorded timings when replaying, 0 for no delay.
+        """
+        if mode == CassetteMode.RECORD and model is None:
+            raise ValueError("Recording a cassette requires a model")
+        self.mode = mode
+        self.model = model
+        self.match = match
+        self.timing_scale = max(timing_scale, 0.0)
+        self.cassette = Cassette(path)
+        if mode == CassetteMode.REPLAY:
+            self.cassette.load()
+
+    async def generate_content_async(
+        self,
+        contents: Any,
+        *,
+        generation_config: "GenerationConfig | None" = None,
+        safety_settings: Any = None,
+        stream: bool = False,
+        **kwargs: Any,
+    ) -> "GenerationResponse | AsyncIterator[GenerationResponse]":
+        """Generates content like `GenerativeModel.generate_content_async`."""
+        key, request = request_key(contents, generation_config, safety_settings, stream)
+        if self.mode == CassetteMode.REPLAY:
+            return await self._replay(self.cassette.find(key, stream, self.match))
+
+        start = time.perf_counter()
+        response = await self.model.generate_content_async(
+            contents,
+            generation_config=generation_config,
+            safety_settings=safety_settings,
+            stream=stream,
+            **kwargs,
+        )
+        latency = time.perf_counter() - start
+        interaction = {
+            "version": CASSETTE_VERSION,
+            "key": key,
+            "model": getattr(self.model, "_model_name", None),
+            "request": request,
+            "latency": latency,
+            "chunks": [],
+        }
+        if stream:
+            return self._record_stream(response, interaction, start)
+
+        interaction["chunks"].append(
+            {"offset": latency, "response": response.to_dict()}
+        )
+        await asyncio.to_thread(self.cassette.append, interaction)
+        return response
+
+    async def _record_stream(
+        self,
+        responses: "AsyncIterator[GenerationResponse]",
+        interaction: dict[str, Any],
+        start: float,
+    ) -> "AsyncIterator[GenerationResponse]":
+        async for response in responses:
+            interaction["chunks"].append(
+                {"offset": time.perf_counter() - start, "response": response.to_dict()}
+            )
+            yield response
+        await asyncio.to_thread(self.cassette.append, interaction)
+
+    async def _replay(
+        self, interaction: dict[str, Any]
+    ) -> "GenerationResponse | AsyncIterator[GenerationResponse]":
+        from vertexai.preview.generative_models import GenerationResponse
+
+        await asyncio.sleep(interaction["latency"] * self.timing_scale)
+        if interaction["request"]["stream"]:
+            return self._replay_stream(interaction)
+        return GenerationResponse.from_dict(interaction["chunks"][-1]["response"])
+
+    async def _replay_stream(
+        self, interaction: dict[str, Any]
+    ) -> "AsyncIterator[GenerationResponse]":
+        from vertexai.preview.generative_models import GenerationResponse
+
+        previous = interaction["latency"]
+        for chunk in interaction["chunks"]:
+            await asyncio.sleep(max(chunk["offset"] - previous, 0) * self.timing_scale)
+            previous = chunk["offset"]
+            yield GenerationResponse.from_dict(chunk["response"])
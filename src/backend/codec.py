@@ -0,0 +1,109 @@
+"""Fast conversion of conversations at the store and HTTP boundaries.
+
+A history is validated exactly once, when it is read from the store, in a
+single call of the pydantic core validator for the whole list instead of one
+per entry. Conversations are then assembled without revalidating their
+history, and turned into plain builtins that `msgspec` (and the Firestore
+client) encode directly instead of going through `model_dump`.
+
+Only the history is handled this way: it grows with every turn, while the
+header fields are few and keep the regular validation.
+"""
+
+import zlib
+from typing import Any
+
+import msgspec
+from pydantic import TypeAdapter
+
+from src.schemas import HistoryEntry, Conversation
+
+_history = TypeAdapter(list[HistoryEntry])
+_encoder = msgspec.json.Encoder()
+
+
+def history_from_dicts(entries: list[dict[str, Any]]) -> list[HistoryEntry]:
+    """Validates stored history entries (e.g. Firestore documents) in one pass.
+    Unknown fields (e.g. the Firestore `index`) are ignored.
+
+    Raises
+    ------
+    pydantic.ValidationError
+        If an entry is not a valid history entry.
+    """
+    return _history.validate_python(entries)
+
+
+def history_from_json(entries: list[str]) -> list[HistoryEntry]:
+    """Decodes and validates JSON history entries (e.g. SQLite rows) in one pass.
+
+    Raises
+    ------
+    pydantic.ValidationError
+        If an entry is not a valid history entry.
+    """
+    return _history.validate_json(f"[{','.join(entries)}]")
+
+
+def entry_to_content(entry: HistoryEntry) -> dict[str, Any]:
+    """Converts a history entry into a model content dict (role and parts)."""
+    return {
+        "role": entry.role,
+        "parts": [{"text": part.text} for part in entry.parts],
+    }
+
+
+def entry_to_builtins(entry: HistoryEntry) -> dict[str, Any]:
+    """Converts a history entry into a dict of builtins, like `model_dump()`
+    but without the timestamp of an entry that has none."""
+    data = entry_to_content(entry)
+    if entry.created is not None:
+        data["created"] = entry.created
+    return data
+
+
+def encode_entry(entry: HistoryEntry) -> str:
+    """Encodes a history entry as JSON, like `model_dump_json()`."""
+    return _encoder.encode(entry_to_builtins(entry)).decode()
+
+
+def encode_segment(entries: list[HistoryEntry], level: int = 6) -> bytes:
+    """Encodes consecutive history entries as a zlib-compressed JSON array."""
+    data = _encoder.encode([entry_to_builtins(entry) for entry in entries])
+    return zlib.compress(data, level)
+
+
+def decode_segment(data: bytes) -> list[dict[str, Any]]:
+    """Decompresses a segment of history entries into dicts, to be validated
+    together with the other entries by `history_from_dicts`."""
+    return msgspec.json.decode(zlib.decompress(data))
+
+
+def conversation_from_header(
+    header: dict[str, Any], history: list[HistoryEntry]
+) -> Conversation:
+    """Builds a conversation from its header fields, which are validated, and
+    its already validated history, which is not."""
+    conversation = Conversation.model_validate({**header, "history": []})
+    conversation.history = history
+    return conversation
+
+
+def conversation_to_builtins(conversation: Conversation) -> dict[str, Any]:
+    """Converts a conversation (or a subclass, e.g. `ConversationPage`) into a
+    dict of builtins, datetimes and enums that `msgspec` encodes natively."""
+    data = {
+        name: getattr(conversation, name)
+        for name in type(conversation).model_fields
+        if name != "history"
+    }
+    data["history"] = [entry_to_builtins(entry) for entry in conversation.history]
+    return data
+
+
+# Litestar response encoders of the hot-path models, which take precedence
+# over the generic pydantic encoder
+TYPE_ENCODERS = {
+    HistoryEntry: entry_to_builtins,
+    Conversation: conversation_to_builtins,
+}
@@ -1,6 +1,14 @@
 """Configuration module for the backend."""
 
-from .config import BackendSettings  # noqa: F401
+from .config import (  # noqa: F401
+    BackendSettings,
+    CassetteMatch,
+    CassetteMode,
+    RateLimitStore,
+    RoutingStrategy,
+    ServerEngine,
+    StoreBackend,
+)
 
 # Instantiate the Settings class
 # Automatically places the ENV variables into the settings attributes
@@ -1,14 +1,65 @@
 """Configuration file for the backend"""
 
-from vertexai.preview.generative_models import (
-    Part,
-    GenerationConfig,
-    HarmCategory,
-    HarmBlockThreshold,
-)
+from enum import StrEnum
+from typing import TYPE_CHECKING
 
 from src.config import AppSettings
 
+# The Vertex AI SDK takes seconds to import, so it is only imported once the
+# model settings are used (see `app_startup`)
+if TYPE_CHECKING:
+    from vertexai.preview.generative_models import (
+        Part,
+        GenerationConfig,
+        HarmCategory,
+        HarmBlockThreshold,
+    )
+
+
+class StoreBackend(StrEnum):
+    """Enum class for the conversation store backend."""
+
+    FIRESTORE = "firestore"
+    SQLITE = "sqlite"
+
+
+class ServerEngine(StrEnum):
+    """Enum class for the ASGI server running the backend."""
+
+    UVICORN = "uvicorn"
+    GRANIAN = "granian"
+    GUNICORN = "gunicorn"
+
+
+class RateLimitStore(StrEnum):
+    """Enum class for the store of the request rate limit counts."""
+
+    MEMORY = "memory"
+    REDIS = "redis"
+    SQLITE = "sqlite"
+
+
+class RoutingStrategy(StrEnum):
+    """Enum class for how the model endpoints are ranked."""
+
+    LATENCY = "latency"
+    ORDERED = "ordered"
+
+
+class CassetteMode(StrEnum):
+    """Enum class for the record/replay mode of the generative model calls."""
+
+    OFF = "off"
+    RECORD = "record"
+    REPLAY = "replay"
+
+
+class CassetteMatch(StrEnum):
+    """Enum class for how replayed model calls are matched with recorded ones."""
+
+    EXACT = "exact"
+    SEQUENCE = "sequence"
+
 
 class BackendSettings(AppSettings):
     """
@@ -25,6 +76,88 @@ class BackendSettings(AppSettings):
     cloud_storage_bucket: str = "gs://BUCKET-URI-GOES-HERE"
     service_account_email: str = "SERVICE-ACCOUNT-EMAIL-GOES-HERE"
 
+    # Conversation Store Settings
+    conversation_store: StoreBackend = StoreBackend.FIRESTORE
+    sqlite_path: str = "conversations.db"
+
+    # Firestore History Segment Settings
+    # Older history entries are packed into zlib-compressed segments of
+    # `history_segment_size` entries; the last `history_recent_turns` stay plain
+    history_segment_size: int = 100
+    history_recent_turns: int = 50
+
+    # Server Settings
+    # `server_workers` 0 runs a worker per CPU of the container's CPU quota. On
+    # SIGTERM, workers stop accepting connections and drain the open requests for
+    # at most `server_graceful_timeout` seconds. `server_max_requests` > 0
+    # restarts a worker after that many requests (uvicorn and gunicorn)
+    server_engine: ServerEngine = ServerEngine.UVICORN
+    server_workers: int = 0
+    server_max_requests: int = 500
+    server_graceful_timeout: float = 30.0
+
+    # Startup Settings
+    # Before the app is ready, the store and model connections and credentials
+    # are primed for at most `startup_warmup_timeout` seconds
+    startup_warmup: bool = True
+    startup_warmup_timeout: float = 10.0
+
+    # Bulk delete (DELETE /chat) Settings
+    purge_batch_size: int = 500
+    purge_concurrency: int = 8
+
+    # Conversation Cache Settings (a max size of 0 disables the cache)
+    cache_max_size: int = 1024
+    cache_ttl: float = 300.0
+
+    # Chat Concurrency Settings
+    # Turns of the same user are serialized per worker; a turn queues for at most
+    # `chat_lock_timeout` seconds (0 fails fast) before answering 409 Conflict
+    chat_lock_stripes: int = 256
+    chat_lock_timeout: float = 30.0
+
+    # Admission Control Settings
+    # A worker runs at most `admission_max_concurrency` requests of the
+    # `admission_routes` at once (0 for no limit). Up to `admission_queue_size`
+    # more wait for at most `admission_queue_timeout` seconds, the others are
+    # answered 429 with Retry-After. On Cloud Run, a container concurrency of
+    # workers * (max concurrency + queue size) sends the excess to new instances
+    admission_max_concurrency: int = 40
+    admission_queue_size: int = 40
+    admission_queue_timeout: float = 5.0
+    admission_routes: list[str] = [
+        "POST /chat/{user_id}",
+        "POST /chat/{user_id}/stream",
+    ]
+
+    # Rate Limit Settings
+    # Requests of the `rate_limit_routes` are limited to `rate_limit_user` per
+    # user and `rate_limit_global` in total per sliding window of
+    # `rate_limit_window` seconds (0 for no limit), and answered 429 with
+    # Retry-After beyond. The counts are kept per worker (`memory`), shared in
+    # Redis at `redis_url`, or shared by the workers of one host in the
+    # `rate_limit_sqlite_path` file (`sqlite`)
+    rate_limit_store: RateLimitStore = RateLimitStore.MEMORY
+    rate_limit_user: int = 30
+    rate_limit_global: int = 0
+    rate_limit_window: float = 60.0
+    rate_limit_routes: list[str] = [
+        "POST /chat/{user_id}",
+        "POST /chat/{user_id}/stream",
+        "POST /test/chat/{user_id}",
+    ]
+    rate_limit_sqlite_path: str = "rate_limits.db"
+    redis_url: str = "redis://localhost:6379/0"
+
+    # Summary Job Settings
+    # A job claims the summary before generating it; a claim not finished within
+    # `summary_claim_timeout` seconds (e.g. of a crashed worker) can be taken over
+    summary_workers: int = 2
+    summary_queue_size: int = 1000
+    summary_max_retries: int = 3
+    summary_retry_delay: float = 2.0
+    summary_claim_timeout: float = 300.0
+
     # GenAI Model Settings
     temperature: float = 0.7
     top_p: float = 1.0
@@ -32,6 +165,57 @@ class BackendSettings(AppSettings):
     candidate_count: int = 1
     max_output_tokens: int = 8192
 
+    # GenAI Structured Output Settings
+    # When enabled, every turn is generated in one call as a JSON object holding the
+    # reply, a `done` flag and the summaries. Requires a model with JSON mode (gemini-1.5)
+    genai_structured_output: bool = False
+
+    # GenAI Context Window Settings
+    # The last `context_recent_turns` turns are sent verbatim within a budget of
+    # `context_max_tokens` (estimated) tokens, older turns as a rolling summary
+    context_recent_turns: int = 20
+    context_max_tokens: int = 8000
+
+    # GenAI Rate Limit Settings
+    # Model calls are queued client-side to stay within `genai_rpm` requests and
+    # `genai_tpm` tokens per minute (0 for no limit), or the (RPM, TPM) limits of
+    # the model in `genai_rate_limits`. The limits apply per worker process.
+    # Live turns wait at most `genai_queue_timeout` seconds, summaries indefinitely
+    genai_rpm: int = 0
+    genai_tpm: int = 0
+    genai_rate_limits: dict[str, tuple[int, int]] = {
+        "gemini-1.5-pro-preview-0409": (5, 0),
+    }
+    genai_queue_timeout: float = 30.0
+    genai_output_tokens_estimate: int = 256
+
+    # GenAI Routing Settings
+    # Calls go to `genai_id` and the `genai_fallbacks` ("model" or
+    # "model@location"), healthy ones first, ranked by observed latency or in
+    # this order. A call has a deadline over all its attempts, failed attempts
+    # are retried on the next endpoint after a jittered backoff, and a hedge
+    # percentile > 0 starts a second attempt once an attempt is slower than
+    # that percentile of its endpoint
+    genai_fallbacks: list[str] = []
+    genai_routing: RoutingStrategy = RoutingStrategy.LATENCY
+    genai_deadline: float = 90.0
+    genai_attempt_timeout: float = 60.0
+    genai_max_retries: int = 2
+    genai_retry_delay: float = 0.5
+    genai_max_retry_delay: float = 8.0
+    genai_hedge_percentile: float = 0.0
+    genai_hedge_min_samples: int = 20
+    genai_error_threshold: float = 0.5
+
+    # GenAI Cassette Settings
+    # `record` appends every model call (with its chunks and timings) to the
+    # `genai_cassette` file, `replay` answers from it offline with the recorded
+    # timings multiplied by `genai_cassette_timing_scale` (0 for no delay)
+    genai_cassette_mode: CassetteMode = CassetteMode.OFF
+    genai_cassette: str = "cassette.jsonl"
+    genai_cassette_match: CassetteMatch = CassetteMatch.EXACT
+    genai_cassette_timing_scale: float = 1.0
+
     @property
     def genai_instructions(self) -> list[str]:
         """Get the GenAI model instructions."""
@@ -53,8 +237,22 @@ class BackendSettings(AppSettings):
         ]
 
     @property
-    def genai_config(self) -> GenerationConfig:
+    def genai_structured_instructions(self) -> list[str]:
+        """Get the GenAI model instructions for structured turns."""
+        return self.genai_instructions[:-1] + [
+            """When replying to the teenager, always answer with a JSON object with the fields 
+            `reply` (string, your message to the teenager), `done` (boolean), `summary` (string or null) 
+            and `summary_english` (string or null).""",
+            """Set `done` to true once enough details are gathered or when the answer contains 'DONE'. 
+            Then also fill `summary` with a professional summary of all gathered information in the 
+            language of the conversation and `summary_english` with the same summary in English.""",
+        ]
+
+    @property
+    def genai_config(self) -> "GenerationConfig":
         """Get the GenAI model configuration."""
+        from vertexai.preview.generative_models import GenerationConfig
+
         return GenerationConfig(
             temperature=self.temperature,
             top_p=self.top_p,
@@ -64,8 +262,29 @@ class BackendSettings(AppSettings):
         )
 
     @property
-    def genai_safety_config(self) -> dict[HarmCategory, HarmBlockThreshold]:
+    def genai_turn_config(self) -> "GenerationConfig":
+        """Get the GenAI model configuration for conversation turns."""
+        from vertexai.preview.generative_models import GenerationConfig
+
+        if not self.genai_structured_output:
+            return self.genai_config
+        return GenerationConfig(
+            temperature=self.temperature,
+            top_p=self.top_p,
+            top_k=self.top_k,
+            candidate_count=self.candidate_count,
+            max_output_tokens=self.max_output_tokens,
+            response_mime_type="application/json",
+        )
+
+    @property
+    def genai_safety_config(self) -> "dict[HarmCategory, HarmBlockThreshold]":
         """Get the GenAI safety configuration."""
+        from vertexai.preview.generative_models import (
+            HarmCategory,
+            HarmBlockThreshold,
+        )
+
         return {
             HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_LOW_AND_ABOVE,
             HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_LOW_AND_ABOVE,
@@ -84,6 +303,8 @@ class BackendSettings(AppSettings):
         return f"{self.cloud_storage_bucket}/medical-form.pdf"
 
     @property
-    def pdf_file(self) -> Part:
+    def pdf_file(self) -> "Part":
         """Get the PDF file."""
+        from vertexai.preview.generative_models import Part
+
         return Part.from_uri(self.pdf_file_uri, mime_type="application/pdf")
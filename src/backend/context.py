@@ -0,0 +1,106 @@
+"""Bounded context window for the generative model."""
+
+from src.schemas import Role, HistoryEntry, Conversation
+
+from .codec import entry_to_content
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) that needs no model call."""
+    return len(text) // 4 + 1
+
+
+def entry_tokens(entry: HistoryEntry) -> int:
+    """Estimated number of tokens of a history entry."""
+    return sum(estimate_tokens(part.text) for part in entry.parts)
+
+
+class ContextWindow:
+    """Selects which part of a conversation is sent to the model.
+
+    The most recent turns are sent verbatim. Older turns are folded into the
+    rolling `context_summary` of the conversation, which is sent in front of
+    them. Folding happens in chunks: once the verbatim window exceeds
+    `recent_turns` entries or the token budget, it is shrunk to half of both,
+    so the summary is only updated every few turns.
+    """
+
+    def __init__(self, recent_turns: int = 20, max_tokens: int = 8000):
+        """Initializes the context window.
+
+        Parameters
+        ----------
+        recent_turns : int
+            The maximum number of history entries sent verbatim.
+        max_tokens : int
+            The (estimated) token budget of the summary and the verbatim turns.
+        """
+        self.recent_turns = max(recent_turns, 2)
+        self.max_tokens = max_tokens
+
+    def turns_to_fold(self, conversation: Conversation) -> list[HistoryEntry]:
+        """Returns the history entries that have to be folded into the summary
+        before the next request, or an empty list if the window still fits.
+
+        Parameters
+        ----------
+        conversation : Conversation
+            The conversation data.
+
+        Returns
+        -------
+        list[HistoryEntry]
+            The entries following the already folded ones that have to be folded.
+        """
+        start = conversation.context_summary_turns
+        window = conversation.history[start:]
+        budget = self.max_tokens - estimate_tokens(conversation.context_summary or "")
+        tokens = [entry_tokens(entry) for entry in window]
+        if len(window) <= self.recent_turns and sum(tokens) <= budget:
+            return []
+
+        # Shrink the window to half of the limits, keeping at least the last turn
+        keep, kept_tokens = 0, 0
+        for count in reversed(tokens):
+            if keep >= self.recent_turns // 2 or kept_tokens + count > budget // 2:
+                break
+            keep, kept_tokens = keep + 1, kept_tokens + count
+
+        # The verbatim window has to start with a user turn
+        cut = len(window) - max(keep, 1)
+        while cut > 0 and window[cut].role != Role.USER:
+            cut -= 1
+        return window[:cut]
+
+    def contents(self, conversation: Conversation) -> list[dict]:
+        """Builds the model contents: the context summary followed by the turns
+        that were not folded into it.
+
+        Parameters
+        ----------
+        conversation : Conversation
+            The conversation data.
+
+        Returns
+        -------
+        list[dict]
+            The contents to send to the model.
+        """
+        contents = []
+        if conversation.context_summary:
+            contents = [
+                {
+                    "role": Role.USER,
+                    "parts": [
+                        {
+                            "text": "Summary of our conversation so far: "
+                            f"{conversation.context_summary}"
+                        }
+                    ],
+                },
+                {"role": Role.MODEL, "parts": [{"text": "Understood."}]},
+            ]
+        return contents + [
+            entry_to_content(hist)
+            for hist in conversation.history[conversation.context_summary_turns :]
+        ]
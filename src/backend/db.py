@@ -1,14 +1,61 @@
+import asyncio
 import logging
 import datetime
 
 from google.cloud import firestore
+from google.cloud.firestore import FieldFilter
+from google.api_core.exceptions import Conflict, FailedPrecondition, NotFound
 
 from src.backend.config import settings
-from src.schemas import Role, Message, Conversation, generate_empty_conv
+from src.schemas import (
+    Role,
+    Message,
+    Conversation,
+    SummaryStatus,
+    generate_empty_conv,
+)
+from src.tracing import tracer, traced
+
+from .codec import (
+    conversation_from_header,
+    decode_segment,
+    encode_segment,
+    entry_to_builtins,
+    history_from_dicts,
+)
+from .metrics import store_timed
+from .session import ConversationSession
+from .store import UNLOADED, ConversationConflictError
+
+# Firestore allows at most 500 writes per batch
+MAX_BATCH_WRITES = 500
+
+# Attempts to read a conversation while it is written concurrently
+LOAD_ATTEMPTS = 3
 
 
 class FirestoreDB:
-    """Class for Firestore Database interaction."""
+    """Class for Firestore Database interaction.
+
+    Conversations are stored append-only: a small header document per user
+    (`created`, `updated`, `summary`, `summary_english`, `length`) with a
+    `messages` subcollection holding one document per `HistoryEntry`. Each
+    history entry is written exactly once.
+
+    Once a conversation grows past `recent_turns + segment_size` entries, its
+    oldest entries are packed into zlib-compressed segment documents of
+    `segment_size` entries (the `segments` subcollection), and their message
+    documents are deleted. The header field `segmented` holds the number of
+    entries covered by segments, so a long conversation is read as a handful
+    of small blobs plus its recent messages. Sessions only fetch and decompress
+    the segments holding entries that are not folded into the context summary,
+    usually none; the full history is only decoded for readers of the whole
+    transcript.
+
+    Header documents that still contain the full `history` list (the legacy
+    single-document layout) are read transparently and migrated on their next
+    write, or eagerly through `migrate_collection`.
+    """
 
     client: firestore.AsyncClient
     collection: firestore.AsyncCollectionReference
@@ -18,6 +65,10 @@ class FirestoreDB:
         project_id: str = settings.project_id,
         database: str = settings.firestore_db,
         collection_name: str = "conversations",
+        messages_collection_name: str = "messages",
+        segments_collection_name: str = "segments",
+        segment_size: int = 100,
+        recent_turns: int = 50,
     ):
         """Initializes Firestore Database connection and
         references the specified collection.
@@ -30,6 +81,16 @@ class FirestoreDB:
             The Firestore Database name.
         collection_name : str
             The Firestore Collection name.
+        messages_collection_name : str
+            The name of the per-conversation subcollection holding the messages.
+        segments_collection_name : str
+            The name of the per-conversation subcollection holding the
+            compressed segments of older messages.
+        segment_size : int
+            The number of history entries per compressed segment.
+        recent_turns : int
+            The minimum number of most recent history entries kept as plain
+            message documents.
 
         """
         # Initialize Firestore
@@ -38,6 +99,189 @@ class FirestoreDB:
             database=database,
         )
         self.collection = self.client.collection(collection_name)
+        self.messages_collection_name = messages_collection_name
+        self.segments_collection_name = segments_collection_name
+        self.segment_size = max(min(segment_size, MAX_BATCH_WRITES - 1), 1)
+        self.recent_turns = max(recent_turns, 1)
+
+    def _messages(self, user_id: str) -> firestore.AsyncCollectionReference:
+        """Returns the messages subcollection of the specified user."""
+        return self.collection.document(user_id).collection(
+            self.messages_collection_name
+        )
+
+    def _segments(self, user_id: str) -> firestore.AsyncCollectionReference:
+        """Returns the compressed segments subcollection of the specified user."""
+        return self.collection.document(user_id).collection(
+            self.segments_collection_name
+        )
+
+    def _segment_target(self, length: int) -> int:
+        """Returns the number of entries of a history of `length` entries that
+        belong into compressed segments."""
+        cold = max(length - self.recent_turns, 0)
+        return cold // self.segment_size * self.segment_size
+
+    @traced("firestore.load_conversation")
+    @store_timed("firestore", "load_conversation")
+    async def load_conversation(
+        self, user_id: str, full: bool = True
+    ) -> tuple[Conversation, int, datetime.datetime | None]:
+        """Loads the conversation for the specified user together with the number
+        of history entries already stored in the append-only layout and the
+        version of the header document.
+
+        The header document and the messages are read concurrently, and with
+        `full` the compressed segments too. Otherwise only the segments holding
+        entries from `context_summary_turns` on are read afterwards, if any;
+        the entries before them are `UNLOADED`. A read that overlaps a
+        concurrent write can see a header that points past the messages and
+        segments it read; such a read is repeated, so the returned history
+        always has `length` entries.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        full : bool
+            Whether the entries folded into the context summary are loaded.
+
+        Returns
+        -------
+        tuple[Conversation, int, datetime.datetime | None]
+            The conversation data, the number of persisted history entries and
+            the `update_time` of the header document (None if it doesn't exist).
+            Legacy single-document conversations report 0 persisted entries so
+            that their history is moved to the subcollection on the next save.
+
+        Raises
+        ------
+        ConversationConflictError
+            If every read overlapped a concurrent write.
+        """
+        for _ in range(LOAD_ATTEMPTS):
+            try:
+                header = self.collection.document(user_id).get()
+                messages = self._messages(user_id).order_by("index").get()
+                if full:
+                    first = 0
+                    doc, messages, segments = await asyncio.gather(
+                        header, messages, self._fetch_segments(user_id)
+                    )
+                else:
+                    doc, messages = await asyncio.gather(header, messages)
+                    first, segments = await self._fetch_unfolded_segments(user_id, doc)
+            except NotFound:
+                doc = None
+            if doc is None or not doc.exists:
+                logging.debug("Conversation Not Found for User ID %s", user_id)
+                return generate_empty_conv(), 0, None
+
+            logging.debug("Conversation Found for User ID %s", user_id)
+            loaded = self._assemble(doc, messages, segments, first)
+            if loaded is not None:
+                return loaded
+            logging.debug(
+                "Conversation for User ID %s was written while it was read", user_id
+            )
+
+        raise ConversationConflictError(
+            f"Conversation for User ID {user_id} was modified while it was read"
+        )
+
+    async def _fetch_segments(
+        self, user_id: str, start: int = 0
+    ) -> list[firestore.DocumentSnapshot]:
+        """Fetches the compressed segments from the one starting at `start` on."""
+        query = self._segments(user_id)
+        if start > 0:
+            query = query.where(filter=FieldFilter("start", ">=", start))
+        return await query.order_by("start").get()
+
+    async def _fetch_unfolded_segments(
+        self, user_id: str, doc: firestore.DocumentSnapshot
+    ) -> tuple[int, list[firestore.DocumentSnapshot]]:
+        """Fetches the compressed segments holding entries that are not folded
+        into the context summary, and returns the start of the first one (or
+        `segmented` if there are none) together with them."""
+        header = doc.to_dict() if doc.exists else {}
+        segmented = header.get("segmented", 0)
+        folded = header.get("context_summary_turns", 0)
+        if folded >= segmented:
+            return segmented, []
+
+        start = folded // self.segment_size * self.segment_size
+        if start > 0:
+            segments = await self._fetch_segments(user_id, start)
+            if segments and segments[0].get("start") == start:
+                return start, segments
+        # Packed with another segment size, all segments are read
+        return 0, await self._fetch_segments(user_id)
+
+    @staticmethod
+    def _assemble(
+        doc: firestore.DocumentSnapshot,
+        messages: list[firestore.DocumentSnapshot],
+        segments: list[firestore.DocumentSnapshot],
+        first: int = 0,
+    ) -> tuple[Conversation, int, datetime.datetime] | None:
+        """Assembles a conversation from its header, messages and the segments
+        from the one starting at `first` on, or returns None if they don't hold
+        all `length` entries of the header. The entries before `first` are
+        `UNLOADED`."""
+        data = doc.to_dict()
+        if "history" in data:
+            logging.debug("Conversation %s has legacy layout", doc.id)
+            return Conversation(**data), 0, doc.update_time
+
+        length = data.pop("length", 0)
+        segmented = data.pop("segmented", 0)
+
+        # Segments left behind by failed or older writes may overlap, only the
+        # chain of segments from `first` up to `segmented` is used
+        entries = []
+        for segment in segments:
+            if first + len(entries) >= segmented:
+                break
+            if segment.get("start") == first + len(entries):
+                entries.extend(decode_segment(segment.get("data")))
+        if first + len(entries) < segmented:
+            return None
+        entries = entries[: segmented - first]
+
+        # Messages packed into segments may not be deleted yet
+        for message in messages:
+            index = message.get("index")
+            if index < segmented:
+                continue
+            if index != first + len(entries):
+                break
+            entries.append(message.to_dict())
+        if first + len(entries) < length:
+            return None
+
+        history = history_from_dicts(entries[: length - first])
+        if first > 0:
+            history[:0] = [UNLOADED] * first
+        return conversation_from_header(data, history), length, doc.update_time
+
+    @traced("firestore.fetch_version")
+    @store_timed("firestore", "fetch_version")
+    async def fetch_version(self, user_id: str) -> datetime.datetime | None:
+        """Fetches the version of the conversation without reading its messages.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+
+        Returns
+        -------
+        datetime.datetime | None
+            The `update_time` of the header document (None if it doesn't exist).
+        """
+        doc = await self.collection.document(user_id).get(field_paths=["length"])
+        return doc.update_time if doc.exists else None
 
     async def fetch_conversation(self, user_id: str):
         """Fetches the conversation for the specified user.
@@ -53,18 +297,193 @@ class FirestoreDB:
         Conversation
             The conversation data
         """
-        doc_ref = self.collection.document(user_id)
-        doc = await doc_ref.get()
+        conversation, _, _ = await self.load_conversation(user_id=user_id)
+        return conversation
+
+    async def _write(
+        self,
+        user_id: str,
+        conversation: Conversation,
+        persisted: int,
+        version: datetime.datetime | None,
+        conditional: bool,
+    ) -> datetime.datetime:
+        """Writes the header document and the history entries past `persisted`.
+
+        When `conditional`, the header write only succeeds if the header still
+        has the given `update_time` (or doesn't exist yet when `version` is
+        None), which makes the whole batch fail on a concurrent write.
+        """
+        # Pack the entries that grew cold into compressed segments. Only
+        # entries that are already stored (or a full rewrite) are packed, and
+        # the current `segmented` is only read when a segment boundary is crossed
+        length = len(conversation.history)
+        target = self._segment_target(length)
+        if persisted == 0:
+            segmented = 0
+        elif self._segment_target(persisted) < target <= persisted:
+            with tracer.span("firestore.fetch_segmented"):
+                doc = await self.collection.document(user_id).get(
+                    field_paths=["segmented"]
+                )
+            segmented = (doc.to_dict() or {}).get("segmented", 0)
+            if segmented >= target:
+                segmented = target = None
+        else:
+            segmented = target = None
+
+        writes = []
+        if target is not None:
+            segments = self._segments(user_id)
+            writes = [
+                (
+                    segments.document(f"{start:08d}"),
+                    {
+                        "start": start,
+                        "count": min(self.segment_size, target - start),
+                        "data": encode_segment(
+                            conversation.history[
+                                start : min(start + self.segment_size, target)
+                            ]
+                        ),
+                    },
+                )
+                for start in range(segmented, target, self.segment_size)
+            ]
+
+        messages = self._messages(user_id)
+        writes += [
+            (
+                messages.document(f"{index:08d}"),
+                {**entry_to_builtins(entry), "index": index},
+            )
+            for index, entry in enumerate(conversation.history)
+            if index >= max(persisted, target or 0)
+        ]
+
+        # The header goes into the last batch so that `length` and `segmented`
+        # never point past the messages and segments that are actually stored
+        header_ref = self.collection.document(user_id)
+        header = conversation.model_dump(exclude={"history"})
+        header["length"] = length
+        if target is not None:
+            header["segmented"] = target
+
+        batches = [
+            writes[start : start + MAX_BATCH_WRITES - 1]
+            for start in range(0, len(writes), MAX_BATCH_WRITES - 1)
+        ] or [[]]
         try:
-            if doc.exists:
-                logging.debug(f"Conversation Found for User ID {user_id}")
-                return Conversation(**doc.to_dict())
-            else:
-                logging.debug(f"Conversation Not Found for User ID {user_id}")
-        except Exception as e:
-            logging.error(f"Error fetching conversation for User ID {user_id}: {e}")
+            for i, batch_writes in enumerate(batches):
+                batch = self.client.batch()
+                for doc_ref, data in batch_writes:
+                    batch.set(doc_ref, data)
+                if i < len(batches) - 1:
+                    with tracer.span(
+                        "firestore.batch_commit", writes=len(batch_writes)
+                    ):
+                        await batch.commit()
+                    continue
 
-        return generate_empty_conv()
+                if not conditional:
+                    batch.set(header_ref, header)
+                elif version is None:
+                    batch.create(header_ref, header)
+                else:
+                    # Drops the `history` field of legacy documents
+                    header["history"] = firestore.DELETE_FIELD
+                    batch.update(
+                        header_ref,
+                        header,
+                        option=self.client.write_option(last_update_time=version),
+                    )
+                with tracer.span(
+                    "firestore.batch_commit", writes=len(batch_writes) + 1, header=True
+                ):
+                    results = await batch.commit()
+        except (Conflict, FailedPrecondition, NotFound) as e:
+            raise ConversationConflictError(
+                f"Conversation for User ID {user_id} was modified concurrently"
+            ) from e
+
+        # The packed messages are only deleted once the header points to their
+        # segments. Leftovers of a failed deletion are ignored on load.
+        if target is not None and persisted > 0 and segmented < target:
+            try:
+                await self._delete_refs(
+                    [
+                        messages.document(f"{index:08d}")
+                        for index in range(segmented, target)
+                    ]
+                )
+            except Exception as e:
+                logging.warning(
+                    f"Error deleting packed messages for User ID {user_id}: {e}"
+                )
+
+        return results[-1].update_time
+
+    @traced("firestore.save_conversation")
+    @store_timed("firestore", "save_conversation")
+    async def save_conversation(
+        self,
+        user_id: str,
+        conversation: Conversation,
+        persisted: int = 0,
+        version: datetime.datetime | None = None,
+    ) -> datetime.datetime:
+        """Writes the header document and the history entries that are not yet
+        persisted. Already persisted entries are never rewritten.
+
+        The write is conditional on the header document still having the
+        `update_time` it had when the conversation was loaded.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        conversation : Conversation
+            The conversation data.
+        persisted : int
+            The number of history entries already stored in the subcollection.
+        version : datetime.datetime | None
+            The `update_time` of the header document when it was loaded, or
+            None if it didn't exist.
+
+        Returns
+        -------
+        datetime.datetime
+            The new `update_time` of the header document.
+
+        Raises
+        ------
+        ConversationConflictError
+            If the conversation was written since it was loaded.
+        """
+        return await self._write(
+            user_id=user_id,
+            conversation=conversation,
+            persisted=persisted,
+            version=version,
+            conditional=True,
+        )
+
+    def session(self, user_id: str) -> ConversationSession:
+        """Opens a unit of work over the conversation of the specified user.
+
+        The conversation is read once on enter and written once on exit.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+
+        Returns
+        -------
+        ConversationSession
+            The conversation session, to be used as an async context manager.
+        """
+        return ConversationSession(db=self, user_id=user_id)
 
     async def add_message(self, user_id: str, message: Message, role: Role):
         """Adds a message to the conversation.
@@ -78,69 +497,223 @@ class FirestoreDB:
         role : Role
             The role of the message.
         """
-        doc_ref = self.collection.document(user_id)
-        conversation_data = await self.fetch_conversation(user_id)
-
-        # Role checks
-        if len(conversation_data.history) > 0:
-            last_role = conversation_data.history[-1].role
-            if last_role == role:
-                logging.error(
-                    f"Role {role} is the same as the last message role {last_role}, skipping..."
-                )
-                return
+        async with self.session(user_id=user_id) as session:
+            session.add_message(message=message, role=role)
 
-        # Add message to history
-        conversation_data.add_message(
-            parts=[message],
-            role=role,
-        )
-        await doc_ref.set(conversation_data.model_dump())
-
-    async def update_conversation(self, user_id: str, conversation_data: Conversation):
+    @traced("firestore.update_conversation")
+    @store_timed("firestore", "update_conversation")
+    async def update_conversation(
+        self, user_id: str, conversation_data: Conversation
+    ) -> datetime.datetime:
         """Updates the conversation data.
 
+        All history entries are (re)written unconditionally. Use a `session`
+        to only append the entries that were added.
+
         Parameters
         ----------
         user_id : str
             The user ID.
         conversation_data : Conversation
             The conversation data.
+
+        Returns
+        -------
+        datetime.datetime
+            The new `update_time` of the header document.
         """
         conversation_data.updated = datetime.datetime.now(datetime.UTC)
-        doc_ref = self.collection.document(user_id)
-        await doc_ref.set(conversation_data.model_dump())
+        return await self._write(
+            user_id=user_id,
+            conversation=conversation_data,
+            persisted=0,
+            version=None,
+            conditional=False,
+        )
 
+    @traced("firestore.delete_conversation")
+    @store_timed("firestore", "delete_conversation")
     async def delete_conversation(self, user_id: str):
-        """Deletes the conversation data.
+        """Deletes the conversation data, including its messages.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        """
+        await self._purge_conversation(self.collection.document(user_id))
+
+    @traced("firestore.fetch_user_ids")
+    @store_timed("firestore", "fetch_user_ids")
+    async def fetch_user_ids(self, summary_status: SummaryStatus) -> list[str]:
+        """Fetches the IDs of the users whose conversation has the summary status.
+
+        Parameters
+        ----------
+        summary_status : SummaryStatus
+            The summary status.
+
+        Returns
+        -------
+        list[str]
+            The user IDs.
+        """
+        query = self.collection.where(
+            filter=FieldFilter("summary_status", "==", summary_status)
+        ).select([])
+        return [doc.id async for doc in query.stream()]
+
+    @traced("firestore.migrate_conversation")
+    @store_timed("firestore", "migrate_conversation")
+    async def migrate_conversation(self, user_id: str) -> bool:
+        """Moves a legacy single-document conversation to the append-only layout.
 
         Parameters
         ----------
         user_id : str
             The user ID.
+
+        Returns
+        -------
+        bool
+            Whether the conversation was migrated.
+        """
+        doc = await self.collection.document(user_id).get()
+        data = doc.to_dict() if doc.exists else {}
+        if "history" not in data:
+            return False
+
+        logging.info(f"Migrating conversation for User ID {user_id}...")
+        await self.save_conversation(
+            user_id=user_id,
+            conversation=Conversation(**data),
+            persisted=0,
+            version=doc.update_time,
+        )
+        return True
+
+    async def migrate_collection(self) -> int:
+        """Moves all legacy single-document conversations to the append-only layout.
+
+        Returns
+        -------
+        int
+            The number of migrated conversations.
         """
-        doc_ref = self.collection.document(user_id)
-        await doc_ref.delete()
+        migrated = 0
+        async for doc in self.collection.stream():
+            data = doc.to_dict()
+            if "history" in data:
+                logging.info(f"Migrating conversation for User ID {doc.id}...")
+                await self.save_conversation(
+                    user_id=doc.id,
+                    conversation=Conversation(**data),
+                    persisted=0,
+                    version=doc.update_time,
+                )
+                migrated += 1
+
+        logging.info(f"Migrated {migrated} conversations")
+        return migrated
+
+    async def _delete_refs(self, refs: list[firestore.AsyncDocumentReference]):
+        """Deletes documents with batched writes, in order."""
+        for start in range(0, len(refs), MAX_BATCH_WRITES):
+            batch = self.client.batch()
+            for ref in refs[start : start + MAX_BATCH_WRITES]:
+                batch.delete(ref)
+            await batch.commit()
+
+    async def _purge_conversation(
+        self, doc_ref: firestore.AsyncDocumentReference
+    ) -> int:
+        """Deletes a header document, its messages and its segments with
+        batched writes.
 
-    async def clear_collection(self, batch_size: int = 100):
+        The header is deleted in the last batch, so an interrupted purge never
+        leaves messages behind without a header pointing to them.
+        """
+        refs = [
+            doc.reference
+            for name in (self.messages_collection_name, self.segments_collection_name)
+            async for doc in doc_ref.collection(name).select([]).stream()
+        ]
+        await self._delete_refs(refs + [doc_ref])
+        return len(refs)
+
+    @traced("firestore.clear_collection")
+    @store_timed("firestore", "clear_collection")
+    async def clear_collection(
+        self, batch_size: int = 500, concurrency: int = 8
+    ) -> dict[str, int]:
         """Clears the collection.
 
+        Header documents are listed page by page (ids only) and the
+        conversations of a page are deleted with batched writes, at most
+        `concurrency` at a time. Deleted documents no longer show up in the
+        listing, so an interrupted purge resumes where it stopped when it is
+        started again.
+
         Parameters
         ----------
         batch_size : int
-            The batch size for deletion.
+            The number of header documents listed per page.
+        concurrency : int
+            The maximum number of conversations deleted in parallel.
+
+        Returns
+        -------
+        dict[str, int]
+            The number of deleted conversations and messages.
         """
-        deleted = 0
-        if batch_size == 0:
-            return
+        progress = {"conversations": 0, "messages": 0}
+        if batch_size <= 0:
+            return progress
 
-        docs = self.collection.limit(count=batch_size).stream()
-        async for doc in docs:
-            logging.debug(
-                f"Deleting document {doc.id} => {Conversation(**doc.to_dict())}"
-            )
-            await doc.reference.delete()
-            deleted += 1
+        pending: set[asyncio.Task] = set()
+
+        async def wait(return_when: str):
+            nonlocal pending
+            done, pending = await asyncio.wait(pending, return_when=return_when)
+            for task in done:
+                progress["messages"] += task.result()
+                progress["conversations"] += 1
+
+        last = None
+        try:
+            while True:
+                query = self.collection.select([]).order_by("__name__")
+                if last is not None:
+                    query = query.start_after(last)
+                docs = await query.limit(batch_size).get()
+                if not docs:
+                    break
+                last = docs[-1]
+
+                for doc in docs:
+                    if len(pending) >= max(concurrency, 1):
+                        await wait(asyncio.FIRST_COMPLETED)
+                    pending.add(
+                        asyncio.create_task(self._purge_conversation(doc.reference))
+                    )
+
+                logging.info(
+                    f"Purging collection: {progress['conversations']} conversations "
+                    f"and {progress['messages']} messages deleted"
+                )
+
+            if pending:
+                await wait(asyncio.ALL_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        logging.info(
+            f"Purged collection: {progress['conversations']} conversations "
+            f"and {progress['messages']} messages deleted"
+        )
+        return progress
 
-        if deleted >= batch_size:
-            return await self.clear_collection(batch_size=batch_size)
+    async def close(self):
+        """Closes the Firestore client."""
+        self.client.close()
@@ -0,0 +1,232 @@
+"""In-process background job queues."""
+
+import abc
+import asyncio
+import datetime
+import logging
+
+from src.schemas import Conversation, SummaryStatus
+from src.tracing import tracer
+
+from .model import ChatBot
+from .store import ConversationConflictError, ConversationStore
+
+
+class JobQueue(abc.ABC):
+    """Bounded queue of keyed jobs processed by a fixed pool of worker tasks.
+
+    A key is queued at most once at a time. Failed jobs are retried with an
+    exponential backoff before `fail` is called.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_size: int = 1000,
+        max_retries: int = 3,
+        retry_delay: float = 2.0,
+    ):
+        """Initializes the job queue.
+
+        Parameters
+        ----------
+        workers : int
+            The number of jobs processed concurrently.
+        max_size : int
+            The maximum number of queued jobs.
+        max_retries : int
+            The number of retries of a failed job.
+        retry_delay : float
+            The delay in seconds before the first retry, doubled on every retry.
+        """
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_size)
+        self.queued: set[str] = set()
+        self.running: set[str] = set()
+        self.tasks: list[asyncio.Task] = []
+
+    @abc.abstractmethod
+    async def run(self, key: str):
+        """Runs the job of the specified key."""
+
+    async def fail(self, key: str, exc: Exception):
+        """Called when the job of the specified key failed all its retries."""
+        logging.error(f"Job {key} failed: {exc}")
+
+    def submit(self, key: str) -> bool:
+        """Queues the job of the specified key.
+
+        Parameters
+        ----------
+        key : str
+            The job key.
+
+        Returns
+        -------
+        bool
+            Whether the job was queued. Jobs that are already queued or whose
+            queue is full are not queued again.
+        """
+        if key in self.queued:
+            return False
+        try:
+            self.queue.put_nowait(key)
+        except asyncio.QueueFull:
+            logging.warning(f"Job queue is full, dropping job {key}")
+            return False
+        self.queued.add(key)
+        return True
+
+    async def _work(self):
+        while True:
+            key = await self.queue.get()
+            self.queued.discard(key)
+            self.running.add(key)
+            try:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        with tracer.span(
+                            f"{type(self).__name__}.run", key=key, attempt=attempt
+                        ):
+                            await self.run(key)
+                        break
+                    except Exception as e:
+                        if attempt == self.max_retries:
+                            await self.fail(key, e)
+                            break
+                        delay = self.retry_delay * 2**attempt
+                        logging.warning(
+                            f"Job {key} failed (attempt {attempt + 1}), retrying in {delay}s: {e}"
+                        )
+                        await asyncio.sleep(delay)
+            except Exception as e:
+                logging.error(f"Job {key} could not be completed: {e}")
+            finally:
+                self.running.discard(key)
+                self.queue.task_done()
+
+    async def start(self):
+        """Starts the worker tasks."""
+        self.tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancels the worker tasks. Unfinished jobs keep their persisted state."""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+
+class SummaryJobQueue(JobQueue):
+    """Generates conversation summaries after the chat response has been sent.
+
+    The job state is persisted in the `summary_status` of the conversation: a
+    chat turn marks it `pending`, the job claims it by marking it `running`
+    with a conditional write before calling the model, and marks it `done` (or
+    `failed`) when it commits the summary. As the claim is conditional, only
+    one worker generates a summary even when several of them queued it. Claims
+    older than `claim_timeout` are taken over, and unfinished summaries are
+    queued again on startup.
+    """
+
+    def __init__(
+        self,
+        db: ConversationStore,
+        model: ChatBot,
+        claim_timeout: float = 300.0,
+        **kwargs,
+    ):
+        """Initializes the summary job queue.
+
+        Parameters
+        ----------
+        db : ConversationStore
+            The conversation store.
+        model : ChatBot
+            The chat bot generating the summaries.
+        claim_timeout : float
+            The seconds after which the claim of another worker is taken over.
+        **kwargs
+            The `JobQueue` parameters.
+        """
+        super().__init__(**kwargs)
+        self.db = db
+        self.model = model
+        self.claim_timeout = claim_timeout
+        self.claimed: set[str] = set()
+
+    def _claimable(self, key: str, conversation: Conversation) -> bool:
+        """Whether this worker may claim the summary of the conversation."""
+        match conversation.summary_status:
+            case SummaryStatus.PENDING:
+                return True
+            case SummaryStatus.RUNNING:
+                age = datetime.datetime.now(datetime.UTC) - conversation.updated
+                return key in self.claimed or age.total_seconds() > self.claim_timeout
+            case _:
+                return False
+
+    async def run(self, key: str):
+        """Claims, generates and stores the summary of the conversation of the
+        user.
+
+        A concurrent write makes the claim or the commit fail with a conflict,
+        in which case the job is retried on the new version of the
+        conversation; the retry returns if another worker holds the claim.
+        """
+        async with self.db.session(user_id=key) as session:
+            if not self._claimable(key, session.conversation):
+                self.claimed.discard(key)
+                return
+            session.conversation.start_summary()
+        self.claimed.add(key)
+
+        async with self.db.session(user_id=key) as session:
+            if session.conversation.summary_status != SummaryStatus.RUNNING:
+                # A new turn requested another summary, which is queued again
+                self.claimed.discard(key)
+                return
+            logging.debug("Generating Summary for User ID %s...", key)
+            await self.model.add_summary(conversation=session.conversation)
+        self.claimed.discard(key)
+
+    async def fail(self, key: str, exc: Exception):
+        """Marks the summary of the conversation of the user as failed, unless
+        another worker holds the claim."""
+        logging.error(f"Summary for User ID {key} failed: {exc}")
+        for _ in range(self.max_retries + 1):
+            try:
+                async with self.db.session(user_id=key) as session:
+                    if self._claimable(key, session.conversation):
+                        session.conversation.fail_summary()
+                break
+            except ConversationConflictError:
+                continue
+        self.claimed.discard(key)
+
+    def status(self, key: str) -> SummaryStatus | None:
+        """Returns the in-memory status of the job of the user, if any."""
+        if key in self.running:
+            return SummaryStatus.RUNNING
+        if key in self.queued:
+            return SummaryStatus.PENDING
+        return None
+
+    async def resume(self) -> int:
+        """Queues the summaries left unfinished, e.g. by a previous instance.
+
+        Pending summaries and claims that may have been left by a crashed
+        worker are queued; summaries claimed by a live worker are skipped when
+        their job runs.
+
+        Returns
+        -------
+        int
+            The number of queued summaries.
+        """
+        user_ids = []
+        for status in (SummaryStatus.PENDING, SummaryStatus.RUNNING):
+            user_ids += await self.db.fetch_user_ids(summary_status=status)
+        return sum(self.submit(user_id) for user_id in user_ids)
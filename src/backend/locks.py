@@ -0,0 +1,77 @@
+"""Per-user locking of chat turns within a worker."""
+
+import asyncio
+import contextlib
+import zlib
+from typing import AsyncIterator
+
+from src.tracing import tracer
+
+from .store import ConversationConflictError
+
+
+class ConversationBusyError(ConversationConflictError):
+    """Raised when another turn of the same user holds the lock for too long."""
+
+
+class StripedLock:
+    """A fixed set of asyncio locks shared by all users.
+
+    Each user ID is hashed onto one of the stripes, so turns of the same user
+    never run concurrently in this worker while memory stays bounded no matter
+    how many users there are. Unrelated users may occasionally share a stripe.
+    """
+
+    def __init__(self, stripes: int = 256):
+        """Initializes the locks.
+
+        Parameters
+        ----------
+        stripes : int
+            The number of locks.
+        """
+        self.stripes = [asyncio.Lock() for _ in range(max(stripes, 1))]
+
+    def stripe(self, user_id: str) -> asyncio.Lock:
+        """Returns the lock of the specified user."""
+        return self.stripes[zlib.crc32(user_id.encode()) % len(self.stripes)]
+
+    @contextlib.asynccontextmanager
+    async def lock(
+        self, user_id: str, timeout: float | None = None
+    ) -> AsyncIterator[None]:
+        """Holds the lock of the specified user.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        timeout : float | None
+            The number of seconds to queue for the lock. 0 fails immediately
+            when the lock is held, None waits indefinitely.
+
+        Raises
+        ------
+        ConversationBusyError
+            If the lock could not be acquired within the timeout.
+        """
+        lock = self.stripe(user_id)
+        with tracer.span("lock.acquire", contended=lock.locked()):
+            if timeout is not None and timeout <= 0:
+                if lock.locked():
+                    raise ConversationBusyError(
+                        f"Another turn for User ID {user_id} is in progress"
+                    )
+                await lock.acquire()
+            else:
+                try:
+                    await asyncio.wait_for(lock.acquire(), timeout=timeout)
+                except TimeoutError as e:
+                    raise ConversationBusyError(
+                        f"Another turn for User ID {user_id} is in progress"
+                    ) from e
+
+        try:
+            yield
+        finally:
+            lock.release()
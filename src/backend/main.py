@@ -1,107 +1,103 @@
 # flake8: noqa: E402 (module level import not at top of file)
-import os
 import sys
-import asyncio
-import psutil
-import uvloop
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
 # add total project layout to path
 sys.path.append(".")
 
-# set event loop policy
-asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())  # type: ignore
-
-from src.backend.config import settings
-from src.backend.app import app  # noqa: F401 (imported but unused)
+from src.backend.config import settings, ServerEngine
+from src.backend.server import serve
+from src.logs import log_pipeline
 
 
 def main(
-    workers: int = 1,
+    engine: ServerEngine = settings.server_engine,
+    workers: int = settings.server_workers,
     reload: bool = False,
-    max_requests: int = 500,
+    max_requests: int = settings.server_max_requests,
+    graceful_timeout: float = settings.server_graceful_timeout,
 ):
     """Method to launch the backend API server
 
     Parameters
     ----------
+    engine : ServerEngine
+        The `engine` parameter determines the ASGI server the backend API server
+        is launched with: Uvicorn, Granian or Gunicorn with Uvicorn workers.
     workers : int
         The `workers` parameter is an optional integer that determines the number
-        of workers to launch the backend API server with. If -1, then the
-        number of workers will be equal to the number of physical cores.
-
-        Workers rule of thumb:
-            workers = 2 * physical_num_cores + 1
+        of workers to launch the backend API server with. If 0 (or -1), then the
+        number of workers will be equal to the number of CPUs available to the
+        process.
 
-        However, physical cores can have multiple logical cores running at once due
-        to hyperthreading. As a result, the number of workers should be equal to
-        the number of logical cores.
-        Default is 1.
+        The workers are async, so one worker per CPU keeps all CPUs busy. In a
+        container, the available CPUs are its CPU quota (cgroup) rather than the
+        cores of the host.
     reload : bool
         The `reload` parameter is a boolean that determines if the backend API
-        server should be launched with auto-reload enabled. This is only
-        applicable when using Uvicorn or Granian.
+        server should be launched with auto-reload enabled, with one worker.
     max_requests : int
         The `max_requests` parameter is an optional integer that determines the
-        maximum number of requests a worker will process before restarting. Only
-        applicable when using Gunicorn.
+        maximum number of requests a worker will process before restarting. Not
+        applicable when using Granian.
+    graceful_timeout : float
+        The `graceful_timeout` parameter is the number of seconds the open
+        requests are given to finish when the server is stopped with SIGTERM.
 
     Returns
     -------
     None
     """
-    ## Workers
-    physical_cores = psutil.cpu_count(logical=False)
-    if physical_cores is None:
-        physical_cores = 1
-    if workers == -1:
-        workers = physical_cores
-    else:
-        assert (
-            workers <= (2 * physical_cores + 1)
-        ), "Number of workers must be less than or equal to the number of 2 * num physical cores + 1"
-
-    ## Launch string
-    launch_str = (
-        f"uvicorn src.backend.main:app "
-        "--loop uvloop "
-        "--http httptools "
-        f"--host {settings.backend_host} "
-        f"--port {settings.backend_port} "
-        f"--limit-max-requests {max_requests} "
-        f"--workers {workers if not reload else 1}"
+    serve(
+        engine=engine,
+        host=settings.backend_host,
+        port=settings.backend_port,
+        workers=workers,
+        reload=reload,
+        max_requests=max_requests,
+        graceful_timeout=graceful_timeout,
     )
 
-    # Add reload flag
-    if reload:
-        launch_str += " --reload"
-
-    ## Launch
-    os.system(launch_str)
-
 
 if __name__ == "__main__":
+    log_pipeline.configure(level=settings.log_level, format=settings.log_format)
+
     # Parse command line arguments
     parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "-e",
+        "--engine",
+        type=ServerEngine,
+        choices=list(ServerEngine),
+        default=settings.server_engine,
+        help="ASGI server to launch backend API server with.",
+    )
     parser.add_argument(
         "-w",
         "--workers",
         type=int,
-        default=1,
-        help="Number of workers to launch backend API server with.",
+        default=settings.server_workers,
+        help="Number of workers to launch backend API server with. 0 for one per available CPU.",
     )
     parser.add_argument(
         "-r",
         "--reload",
         action="store_true",
-        help="Launch backend API server with auto-reload enabled. Only applicable when using Uvicorn or Granian.",
+        help="Launch backend API server with auto-reload enabled and one worker.",
     )
     parser.add_argument(
         "-m",
         "--max_requests",
         type=int,
-        default=500,
-        help="Maximum number of requests a worker will process before restarting. Only applicable when using Gunicorn.",
+        default=settings.server_max_requests,
+        help="Maximum number of requests a worker will process before restarting. Not applicable when using Granian.",
+    )
+    parser.add_argument(
+        "-g",
+        "--graceful_timeout",
+        type=float,
+        default=settings.server_graceful_timeout,
+        help="Seconds the open requests are given to finish on SIGTERM.",
     )
     kwargs = vars(parser.parse_args())
     main(**kwargs)
@@ -0,0 +1,501 @@
+"""Prometheus metrics of the backend, without client library.
+
+Metrics live in the memory of the worker process and are rendered in the
+Prometheus text exposition format by the `/metrics` route. Recording a value
+is a dict lookup and an addition, so the instrumentation stays on in
+production. Every worker process exposes its own metrics.
+"""
+
+import abc
+import bisect
+import functools
+import inspect
+import time
+from typing import Any, Callable, Iterator
+
+from litestar.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.asgi import route_template
+
+from .startup import STARTUP
+
+# Latency buckets in seconds, from a cached store read to a long model call
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return f"{{{pairs}}}"
+
+
+class Metric(abc.ABC):
+    """Base class of a metric with a fixed set of label names."""
+
+    type: str = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        registry: "Registry | None" = None,
+    ):
+        """Initializes the metric and registers it.
+
+        Parameters
+        ----------
+        name : str
+            The metric name.
+        documentation : str
+            The metric help text.
+        labelnames : tuple[str, ...]
+            The label names, whose values are passed positionally.
+        registry : Registry | None
+            The registry of the metric, the default `REGISTRY` if None.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: dict[tuple[str, ...], Any] = {}
+        (registry or REGISTRY).register(self)
+
+    @abc.abstractmethod
+    def _child(self):
+        """Returns a new child metric of one set of label values."""
+
+    def labels(self, *values: str):
+        """Returns the child metric of the specified label values."""
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    f"Metric {self.name} expects labels {self.labelnames}, got {values}"
+                )
+            child = self.children[values] = self._child()
+        return child
+
+    @abc.abstractmethod
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        """Yields the (name suffix, formatted labels, value) samples."""
+
+    def render(self) -> str:
+        """Renders the metric in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        lines += [
+            f"{self.name}{suffix}{labels} {value}"
+            for suffix, labels, value in self.samples()
+        ]
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(Metric):
+    """Monotonically increasing counter."""
+
+    type = "counter"
+
+    def _child(self) -> _Value:
+        return _Value()
+
+    def inc(self, *values: str, amount: float = 1.0):
+        """Increments the counter of the specified label values."""
+        self.labels(*values).inc(amount)
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        for values, child in list(self.children.items()):
+            yield "_total", _format_labels(self.labelnames, values), child.value
+
+
+class Gauge(Metric):
+    """Value that goes up and down, e.g. the number of requests in progress."""
+
+    type = "gauge"
+
+    def _child(self) -> _Value:
+        return _Value()
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        for values, child in list(self.children.items()):
+            yield "", _format_labels(self.labelnames, values), child.value
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Histogram(Metric):
+    """Distribution of observed values (e.g. latencies in seconds) in buckets."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        registry: "Registry | None" = None,
+    ):
+        """Initializes the histogram and registers it.
+
+        Parameters
+        ----------
+        name : str
+            The metric name.
+        documentation : str
+            The metric help text.
+        labelnames : tuple[str, ...]
+            The label names, whose values are passed positionally.
+        buckets : tuple[float, ...]
+            The sorted upper bounds of the buckets (without +Inf).
+        registry : Registry | None
+            The registry of the metric, the default `REGISTRY` if None.
+        """
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _child(self) -> _Histogram:
+        return _Histogram(self.buckets)
+
+    def observe(self, *values: str, value: float):
+        """Records a value for the specified label values."""
+        self.labels(*values).observe(value)
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        names = self.labelnames + ("le",)
+        for values, child in list(self.children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield "_bucket", _format_labels(names, values + (le,)), cumulative
+            labels = _format_labels(self.labelnames, values)
+            yield "_sum", labels, child.sum
+            yield "_count", labels, cumulative
+
+
+class Registry:
+    """Collection of the metrics exposed together."""
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric):
+        """Adds a metric to the registry."""
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+# Exposition format content type
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently in progress",
+    ("method", "path"),
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request duration until the end of the response body, in seconds",
+    ("method", "path", "status_code"),
+)
+HTTP_REQUEST_ERRORS = Counter(
+    "http_request_errors",
+    "HTTP requests answered with a server error",
+    ("method", "path", "status_code"),
+)
+STORE_DURATION = Histogram(
+    "store_operation_duration_seconds",
+    "Conversation store operation duration, in seconds",
+    ("store", "method"),
+)
+STORE_ERRORS = Counter(
+    "store_operation_errors",
+    "Conversation store operations that raised an error",
+    ("store", "method"),
+)
+MODEL_DURATION = Histogram(
+    "model_call_duration_seconds",
+    "ChatBot call duration (including streaming), in seconds",
+    ("method",),
+)
+MODEL_ERRORS = Counter(
+    "model_call_errors",
+    "ChatBot calls that raised an error",
+    ("method",),
+)
+MODEL_IN_PROGRESS = Gauge(
+    "model_calls_in_progress",
+    "ChatBot calls currently in progress",
+    ("method",),
+)
+MODEL_QUEUE_TIME = Histogram(
+    "model_queue_time_seconds",
+    "Time ChatBot calls waited for the rate limit of the model, in seconds",
+    ("model", "priority"),
+)
+MODEL_QUEUE_DEPTH = Gauge(
+    "model_queue_depth",
+    "ChatBot calls currently waiting for the rate limit of the model",
+    ("model", "priority"),
+)
+MODEL_QUEUE_TIMEOUTS = Counter(
+    "model_queue_timeouts",
+    "ChatBot calls that gave up waiting for the rate limit of the model",
+    ("model", "priority"),
+)
+MODEL_ATTEMPTS = Counter(
+    "model_attempts",
+    "Attempts of the model calls, by endpoint and outcome (ok, error or timeout)",
+    ("endpoint", "outcome"),
+)
+MODEL_ATTEMPT_DURATION = Histogram(
+    "model_attempt_duration_seconds",
+    "Duration of the successful model call attempts (until the first chunk "
+    "if streamed), in seconds",
+    ("endpoint",),
+)
+MODEL_HEDGES = Counter(
+    "model_hedged_attempts",
+    "Second attempts started for model calls slower than the hedging threshold",
+    ("endpoint",),
+)
+MODEL_TOKENS = Counter(
+    "model_tokens",
+    "Tokens of the generative model calls, by kind (prompt or candidates)",
+    ("method", "kind"),
+)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight",
+    "Requests currently admitted by admission control",
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth",
+    "Requests currently waiting to be admitted by admission control",
+)
+ADMISSION_QUEUE_TIME = Histogram(
+    "admission_queue_time_seconds",
+    "Time the admitted requests waited to be admitted, in seconds",
+)
+ADMISSION_SHED = Counter(
+    "admission_shed_requests",
+    "Requests shed by admission control, by reason (queue_full or queue_timeout)",
+    ("reason",),
+)
+RATE_LIMITED = Counter(
+    "rate_limited_requests",
+    "Requests answered 429 for being over a rate limit, by limit (user or global)",
+    ("limit",),
+)
+
+STARTUP_MILESTONES = Gauge(
+    "startup_milestone_seconds",
+    "Seconds from the process start to the startup milestones (imported, "
+    "ready, first_response)",
+    ("milestone",),
+)
+STARTUP_PHASES = Gauge(
+    "startup_phase_duration_seconds",
+    "Duration of the startup phases of the worker process, in seconds",
+    ("phase",),
+)
+
+
+def record_startup():
+    """Copies the startup profile into the startup gauges."""
+    for milestone, seconds in STARTUP.milestones.items():
+        STARTUP_MILESTONES.labels(milestone).set(seconds)
+    for phase, seconds in STARTUP.phases.items():
+        STARTUP_PHASES.labels(phase).set(seconds)
+
+
+def timed(histogram: Histogram, errors: Counter, *values: str) -> Callable:
+    """Decorator recording the duration and the errors of an async function or
+    async generator with the specified label values.
+
+    Parameters
+    ----------
+    histogram : Histogram
+        The histogram of the durations.
+    errors : Counter
+        The counter of the errors.
+    *values : str
+        The label values.
+    """
+    duration = histogram.labels(*values)
+    error = errors.labels(*values)
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.isasyncgenfunction(func):
+
+            @functools.wraps(func)
+            async def generator(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    async for item in func(*args, **kwargs):
+                        yield item
+                except Exception:
+                    error.inc()
+                    raise
+                finally:
+                    duration.observe(time.perf_counter() - start)
+
+            return generator
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                error.inc()
+                raise
+            finally:
+                duration.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def store_timed(store: str, method: str) -> Callable:
+    """Decorator recording a conversation store operation."""
+    return timed(STORE_DURATION, STORE_ERRORS, store, method)
+
+
+def model_timed(method: str) -> Callable:
+    """Decorator recording a ChatBot call and the calls in progress."""
+    in_progress = MODEL_IN_PROGRESS.labels(method)
+    record = timed(MODEL_DURATION, MODEL_ERRORS, method)
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.isasyncgenfunction(func):
+
+            async def counted_generator(*args, **kwargs):
+                in_progress.inc()
+                try:
+                    async for item in func(*args, **kwargs):
+                        yield item
+                finally:
+                    in_progress.dec()
+
+            return record(functools.wraps(func)(counted_generator))
+
+        async def counted(*args, **kwargs):
+            in_progress.inc()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                in_progress.dec()
+
+        return record(functools.wraps(func)(counted))
+
+    return decorator
+
+
+def record_tokens(method: str, response: Any):
+    """Counts the prompt and candidates tokens of a model response, if it
+    reports its usage."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    MODEL_TOKENS.inc(method, "prompt", amount=usage.prompt_token_count)
+    MODEL_TOKENS.inc(method, "candidates", amount=usage.candidates_token_count)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the duration, the status and the number in
+    progress of the HTTP requests, per route template."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        # Never the raw path, which would make a series per user
+        path = route_template(scope) or "unmatched"
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method, path)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            if "first_response" not in STARTUP.milestones:
+                STARTUP.mark("first_response")
+                record_startup()
+            status = str(status_code)
+            HTTP_REQUEST_DURATION.observe(
+                method, path, status, value=time.perf_counter() - start
+            )
+            if status_code >= 500:
+                HTTP_REQUEST_ERRORS.inc(method, path, status)
@@ -1,17 +1,40 @@
-import vertexai
-from vertexai.preview.generative_models import GenerativeModel
-from vertexai.preview.generative_models import (
-    GenerationConfig,
-    HarmCategory,
-    HarmBlockThreshold,
-)
+import logging
+from typing import TYPE_CHECKING, AsyncIterator
 
-from src.schemas import Conversation, Message
-from src.backend.config import settings
+from pydantic import BaseModel, ValidationError
+
+from src.schemas import Role, Conversation, Message
+from src.backend.config import settings, CassetteMatch, CassetteMode
+from src.tracing import traced
+
+from .cassette import CassetteModel
+from .context import ContextWindow
+from .metrics import model_timed, record_tokens
+from .router import ModelRouter
+from .scheduler import Priority
+
+# The Vertex AI SDK is imported when the first ChatBot is created
+if TYPE_CHECKING:
+    from vertexai.preview.generative_models import (
+        GenerationConfig,
+        HarmCategory,
+        HarmBlockThreshold,
+    )
+
+
+class Turn(BaseModel):
+    """Structured model turn."""
+
+    reply: str
+    done: bool = False
+    summary: str | None = None
+    summary_english: str | None = None
 
 
 class ChatBot:
-    model: GenerativeModel
+    router: ModelRouter
+    context_window: ContextWindow
+    structured_output: bool
 
     def __init__(
         self,
@@ -19,10 +42,17 @@ class ChatBot:
         location: str = settings.location,
         genai_id: str = settings.genai_id,
         genai_instructions: list[str] = settings.genai_instructions,
-        genai_config: GenerationConfig = settings.genai_config,
-        genai_safety_config: dict[
-            HarmCategory, HarmBlockThreshold
-        ] = settings.genai_safety_config,
+        genai_config: "GenerationConfig | None" = None,
+        genai_safety_config: "dict[HarmCategory, HarmBlockThreshold] | None" = None,
+        context_recent_turns: int = settings.context_recent_turns,
+        context_max_tokens: int = settings.context_max_tokens,
+        structured_output: bool = settings.genai_structured_output,
+        cassette_mode: CassetteMode = settings.genai_cassette_mode,
+        cassette_path: str = settings.genai_cassette,
+        cassette_match: CassetteMatch = settings.genai_cassette_match,
+        cassette_timing_scale: float = settings.genai_cassette_timing_scale,
+        genai_fallbacks: list[str] = settings.genai_fallbacks,
+        router: ModelRouter | None = None,
     ):
         """Initializes the ChatBot.
 
@@ -36,24 +66,159 @@ class ChatBot:
             The GenAI model ID.
         genai_instructions : list[str]
             The GenAI model instructions.
-        genai_config : GenerationConfig
-            The GenAI model generation configuration.
-        genai_safety_config : dict
-            The GenAI model safety configuration.
+        genai_config : GenerationConfig | None
+            The GenAI model generation configuration, from the settings if None.
+        genai_safety_config : dict | None
+            The GenAI model safety configuration, from the settings if None.
+        context_recent_turns : int
+            The maximum number of history entries sent verbatim to the model.
+        context_max_tokens : int
+            The (estimated) token budget of the context sent to the model.
+            Older turns are folded into a rolling summary.
+        structured_output : bool
+            Whether turns are generated as JSON objects holding the reply, the
+            `done` flag and the summaries. The instructions need to ask for them.
+        cassette_mode : CassetteMode
+            Whether the model calls are recorded to or replayed from a cassette.
+        cassette_path : str
+            The cassette file.
+        cassette_match : CassetteMatch
+            How replayed model calls are matched with the recorded ones.
+        cassette_timing_scale : float
+            The factor of the recorded timings when replaying.
+        genai_fallbacks : list[str]
+            The fallback models, as `model` or `model@location`.
+        router : ModelRouter | None
+            The router of the model calls over the model and its fallbacks,
+            without timeouts, retries or rate limits if None.
         """
+        import vertexai
+        from vertexai.preview.generative_models import GenerativeModel
+
+        genai_config = genai_config or settings.genai_config
+        genai_safety_config = genai_safety_config or settings.genai_safety_config
+
         # Initialize Vertex AI
         vertexai.init(
             project=project_id,
             location=location,
         )
 
-        self.model = GenerativeModel(
-            model_name=genai_id,
-            system_instruction=genai_instructions,
-            generation_config=genai_config,
-            safety_settings=genai_safety_config,
+        self.router = router or ModelRouter()
+        for endpoint in [genai_id, *genai_fallbacks]:
+            model_id, _, model_location = endpoint.partition("@")
+            model_name = model_id
+            if model_location and model_location != location:
+                model_name = (
+                    f"projects/{project_id}/locations/{model_location}"
+                    f"/publishers/google/models/{model_id}"
+                )
+            model = GenerativeModel(
+                model_name=model_name,
+                system_instruction=genai_instructions,
+                generation_config=genai_config,
+                safety_settings=genai_safety_config,
+            )
+            if cassette_mode != CassetteMode.OFF:
+                logging.info(
+                    f"Model calls of {endpoint} are {cassette_mode}ed with {cassette_path}"
+                )
+                model = CassetteModel(
+                    path=cassette_path,
+                    mode=cassette_mode,
+                    model=model,
+                    match=cassette_match,
+                    timing_scale=cassette_timing_scale,
+                )
+            self.router.add_endpoint(endpoint, model)
+        self.context_window = ContextWindow(
+            recent_turns=context_recent_turns,
+            max_tokens=context_max_tokens,
+        )
+        self.structured_output = structured_output
+
+    async def warmup(self):
+        """Opens the connections of the model endpoints and fetches their
+        credentials, so the first turn doesn't pay for them."""
+        await self.router.warmup()
+
+    @traced("chatbot.update_context")
+    @model_timed("update_context")
+    async def update_context(self, conversation: Conversation) -> Conversation:
+        """Folds the turns that no longer fit the context window into the
+        rolling context summary of the conversation.
+
+        The summary is updated incrementally from the previous summary and the
+        newly folded turns only, and it is stored with the conversation.
+
+        Parameters
+        ----------
+        conversation : Conversation
+            The conversation data.
+
+        Returns
+        -------
+        Conversation
+            The conversation data with the context summary updated.
+        """
+        turns = self.context_window.turns_to_fold(conversation)
+        if not turns:
+            return conversation
+
+        transcript = "\n".join(
+            f"{turn.role}: {' '.join(part.text for part in turn.parts)}"
+            for turn in turns
+        )
+        response = await self.router.generate(
+            [
+                "You maintain a running summary of a conversation between a medical "
+                "AI agent (model) and a teenager (user). Update the summary with the "
+                "new turns. Keep every medical, personal and language detail, and "
+                "answer with the updated summary only.\n\n"
+                f"Current summary: {conversation.context_summary or 'None'}\n\n"
+                f"New turns:\n{transcript}"
+            ],
+            generation_config=settings.genai_config,
+            safety_settings=settings.genai_safety_config,
+        )
+        record_tokens("update_context", response)
+        return conversation.fold_context(
+            context_summary=response.text,
+            turns=conversation.context_summary_turns + len(turns),
+        )
+
+    async def _generate(
+        self, conversation: Conversation, generation_config, method: str
+    ) -> str:
+        """Generates the text of the next model message. Shared by the public
+        entry points, which alone are timed and traced, so a turn is counted
+        once.
+
+        Parameters
+        ----------
+        conversation : Conversation
+            The conversation data.
+        generation_config : GenerationConfig
+            The generation config of the call.
+        method : str
+            The public method the tokens are recorded for.
+
+        Returns
+        -------
+        str
+            The text of the response.
+        """
+        await self.update_context(conversation)
+        response = await self.router.generate(
+            self.context_window.contents(conversation),
+            generation_config=generation_config,
+            safety_settings=settings.genai_safety_config,
         )
+        record_tokens(method, response)
+        return response.text
 
+    @traced("chatbot.generate_response")
+    @model_timed("generate_response")
     async def generate_response(self, conversation: Conversation) -> Message:
         """Generates a response to the conversation.
 
@@ -67,34 +232,129 @@ class ChatBot:
         Message
             The response message.
         """
-        response = await self.model.generate_content_async(
-            [hist.model_dump() for hist in conversation.history],
+        text = await self._generate(
+            conversation, settings.genai_config, method="generate_response"
+        )
+        return Message(text=text)
+
+    @traced("chatbot.generate_turn")
+    @model_timed("generate_turn")
+    async def generate_turn(self, conversation: Conversation) -> Turn:
+        """Generates the next model turn of the conversation.
+
+        With structured output, the reply, the `done` flag and the summaries
+        are generated in a single call. Otherwise the turn is done when the
+        reply contains "DONE" and the summaries are left empty.
+
+        Parameters
+        ----------
+        conversation : Conversation
+            The conversation data.
+
+        Returns
+        -------
+        Turn
+            The model turn.
+        """
+        generation_config = (
+            settings.genai_turn_config
+            if self.structured_output
+            else settings.genai_config
+        )
+        text = await self._generate(
+            conversation, generation_config, method="generate_turn"
+        )
+        if not self.structured_output:
+            return Turn(reply=text, done="DONE" in text)
+        return self.parse_turn(text)
+
+    @staticmethod
+    def parse_turn(text: str) -> Turn:
+        """Parses a structured model turn, falling back to a plain text reply.
+
+        Parameters
+        ----------
+        text : str
+            The JSON text of the model response.
+
+        Returns
+        -------
+        Turn
+            The model turn.
+        """
+        try:
+            return Turn.model_validate_json(text)
+        except ValidationError as e:
+            logging.warning(f"Model turn is not valid JSON, using it as reply: {e}")
+            return Turn(reply=text, done="DONE" in text)
+
+    @traced("chatbot.stream_response")
+    @model_timed("stream_response")
+    async def stream_response(self, conversation: Conversation) -> AsyncIterator[str]:
+        """Streams a response to the conversation as it is generated.
+
+        Parameters
+        ----------
+        conversation : Conversation
+            The conversation data.
+
+        Yields
+        ------
+        str
+            The text chunks of the response message.
+        """
+        await self.update_context(conversation)
+        responses = await self.router.generate(
+            self.context_window.contents(conversation),
             generation_config=settings.genai_config,
             safety_settings=settings.genai_safety_config,
+            stream=True,
         )
-        return Message(text=response.text)
+        response = None
+        async for response in responses:
+            try:
+                text = response.text
+            except ValueError:
+                # Chunks without text, e.g. the final chunk with the finish reason
+                continue
+            if text:
+                yield text
+
+        # The usage is reported with the last chunk
+        if response is not None:
+            record_tokens("stream_response", response)
 
+    @traced("chatbot.add_summary")
+    @model_timed("add_summary")
     async def add_summary(self, conversation: Conversation) -> Conversation:
         """Adds a summary to the conversation.
 
         Parameters
         ----------
         conversation : Conversation
-            The conversation data. Assumes the last message in the conversation history
-            has the summary.
+            The conversation data. Assumes the last model message in the conversation
+            history has the summary.
 
         Returns
         -------
         Conversation
             The conversation data with the summary added.
         """
+        summary = next(
+            hist.parts[0].text
+            for hist in reversed(conversation.history)
+            if hist.role == Role.MODEL
+        )
+
         # Save the summaries
-        response = await self.model.generate_content_async(
-            [f"Translate the following text into English: {conversation.summary}"],
+        response = await self.router.generate(
+            [f"Translate the following text into English: {summary}"],
+            priority=Priority.BACKGROUND,
             generation_config=settings.genai_config,
             safety_settings=settings.genai_safety_config,
         )
+        record_tokens("add_summary", response)
         return conversation.add_summary(
-            summary=conversation.history[-1].parts[0].text,
+            summary=summary,
             summary_english=response.text,
         )
@@ -0,0 +1,330 @@
+"""Per-user and global rate limiting of the chat requests.
+
+`RateLimitMiddleware` counts the requests of the rate limited routes per user
+(the `user_id` path parameter) and in total, and answers those over the limit
+with 429 Too Many Requests and a Retry-After, so one user can't consume the
+model quota of everyone.
+
+The limits use sliding window counters: the count of the current fixed window
+plus the count of the previous window weighted by its overlap with the
+sliding window. That approximates a true sliding window with two counters per
+key, which any counter store can keep:
+
+- `memory`, in the worker process, so the limits apply per worker,
+- `redis`, shared by all workers and instances,
+- `sqlite`, a file shared by the workers of one host, a local stand-in for
+  Redis.
+
+Requests over the limit are not counted. When the counter store fails, the
+requests are let through.
+"""
+
+import abc
+import asyncio
+import logging
+import math
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from litestar.types import ASGIApp, Receive, Scope, Send
+
+from src.asgi import route_key
+from src.backend.config import BackendSettings, RateLimitStore
+
+from .metrics import RATE_LIMITED
+
+
+class RateLimitExceededError(Exception):
+    """Raised when a request is over a rate limit."""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Too many requests ({scope} rate limit), retry later")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def sliding_window_delay(
+    limit: int, window: float, elapsed: float, current: int, previous: int
+) -> float:
+    """Returns the seconds until a request fits in a sliding window limit, 0 if
+    it fits now.
+
+    Parameters
+    ----------
+    limit : int
+        The maximum number of requests per window.
+    window : float
+        The window length in seconds.
+    elapsed : float
+        The seconds since the start of the current fixed window.
+    current : int
+        The count of the current fixed window, including the request.
+    previous : int
+        The count of the previous fixed window.
+    """
+    if previous * (1 - elapsed / window) + current <= limit:
+        return 0.0
+    before = current - 1
+    if before < limit and previous > 0:
+        # The weight of the previous window has to decay
+        return max(window * (1 - (limit - 1 - before) / previous) - elapsed, 0.0)
+    # The current window is full; in the next one it becomes the previous one
+    return window - elapsed + max(window * (1 - (limit - 1) / before), 0.0)
+
+
+class CounterStore(abc.ABC):
+    """Counts of the requests per key and fixed window."""
+
+    @abc.abstractmethod
+    async def increment(self, key: str, index: int, window: float) -> tuple[int, int]:
+        """Increments the count of a key in a window.
+
+        Parameters
+        ----------
+        key : str
+            The counted key.
+        index : int
+            The index of the current fixed window.
+        window : float
+            The window length in seconds, for the expiry of the counts.
+
+        Returns
+        -------
+        tuple[int, int]
+            The count of the current window and of the previous window.
+        """
+
+    @abc.abstractmethod
+    async def decrement(self, key: str, index: int):
+        """Undoes an increment of the count of a key in a window."""
+
+    async def close(self):
+        """Closes the connections of the store."""
+
+
+class MemoryCounterStore(CounterStore):
+    """Counter store in the memory of the worker process."""
+
+    def __init__(self):
+        self.counts: dict[tuple[str, int], int] = {}
+        self.index = 0
+
+    async def increment(self, key: str, index: int, window: float) -> tuple[int, int]:
+        if index > self.index:
+            # Drops the windows that can't be the previous window anymore
+            self.index = index
+            self.counts = {k: v for k, v in self.counts.items() if k[1] >= index - 1}
+        current = self.counts[key, index] = self.counts.get((key, index), 0) + 1
+        return current, self.counts.get((key, index - 1), 0)
+
+    async def decrement(self, key: str, index: int):
+        if self.counts.get((key, index), 0) > 0:
+            self.counts[key, index] -= 1
+
+
+class RedisCounterStore(CounterStore):
+    """Counter store in Redis, shared by all workers and instances. The counts
+    expire after two windows."""
+
+    def __init__(self, url: str, prefix: str = "ratelimit"):
+        """Initializes the Redis client.
+
+        Parameters
+        ----------
+        url : str
+            The Redis URL, e.g. `redis://localhost:6379/0`.
+        prefix : str
+            The prefix of the Redis keys.
+        """
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def increment(self, key: str, index: int, window: float) -> tuple[int, int]:
+        current_key = f"{self.prefix}:{key}:{index}"
+        async with self.client.pipeline(transaction=True) as pipeline:
+            pipeline.incr(current_key)
+            pipeline.expire(current_key, math.ceil(2 * window))
+            pipeline.get(f"{self.prefix}:{key}:{index - 1}")
+            current, _, previous = await pipeline.execute()
+        return int(current), int(previous or 0)
+
+    async def decrement(self, key: str, index: int):
+        await self.client.decr(f"{self.prefix}:{key}:{index}")
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class SQLiteCounterStore(CounterStore):
+    """Counter store in an SQLite file, shared by the worker processes of a
+    host. Like `SQLiteDB`, all queries run on a dedicated thread."""
+
+    def __init__(self, path: str = "rate_limits.db"):
+        """Opens (and if needed creates) the SQLite database.
+
+        Parameters
+        ----------
+        path : str
+            The path of the database file.
+        """
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="ratelimit"
+        )
+        self.connection = self.executor.submit(self._connect, path).result()
+        self.index = 0
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        connection = sqlite3.connect(path, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=OFF")
+        connection.execute("PRAGMA busy_timeout=5000")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS counts ("
+            "key TEXT NOT NULL, idx INTEGER NOT NULL, count INTEGER NOT NULL, "
+            "PRIMARY KEY (key, idx)) WITHOUT ROWID"
+        )
+        return connection
+
+    async def _run(self, func, *args):
+        """Runs a blocking function on the database thread."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, func, *args
+        )
+
+    def _increment(self, key: str, index: int) -> tuple[int, int]:
+        if index > self.index:
+            self.index = index
+            self.connection.execute("DELETE FROM counts WHERE idx < ?", (index - 1,))
+        # Fetches all rows, so the statement and its write transaction end
+        [(current,)] = self.connection.execute(
+            "INSERT INTO counts (key, idx, count) VALUES (?, ?, 1) "
+            "ON CONFLICT (key, idx) DO UPDATE SET count = count + 1 RETURNING count",
+            (key, index),
+        ).fetchall()
+        previous = self.connection.execute(
+            "SELECT count FROM counts WHERE key = ? AND idx = ?", (key, index - 1)
+        ).fetchone()
+        return current, previous[0] if previous else 0
+
+    def _decrement(self, key: str, index: int):
+        self.connection.execute(
+            "UPDATE counts SET count = count - 1 WHERE key = ? AND idx = ?",
+            (key, index),
+        )
+
+    async def increment(self, key: str, index: int, window: float) -> tuple[int, int]:
+        return await self._run(self._increment, key, index)
+
+    async def decrement(self, key: str, index: int):
+        await self._run(self._decrement, key, index)
+
+    async def close(self):
+        await self._run(self.connection.close)
+        self.executor.shutdown()
+
+
+def create_counter_store(settings: BackendSettings) -> CounterStore:
+    """Creates the counter store of the rate limits selected in the settings."""
+    match settings.rate_limit_store:
+        case RateLimitStore.MEMORY:
+            return MemoryCounterStore()
+        case RateLimitStore.REDIS:
+            return RedisCounterStore(url=settings.redis_url)
+        case RateLimitStore.SQLITE:
+            return SQLiteCounterStore(path=settings.rate_limit_sqlite_path)
+        case _:
+            raise ValueError(f"Unknown rate limit store `{settings.rate_limit_store}`")
+
+
+class RequestRateLimiter:
+    """Per-user and global sliding window rate limits."""
+
+    def __init__(
+        self,
+        store: CounterStore,
+        routes: list[str],
+        user_limit: int = 0,
+        global_limit: int = 0,
+        window: float = 60.0,
+    ):
+        """Initializes the rate limiter.
+
+        Parameters
+        ----------
+        store : CounterStore
+            The store of the request counts.
+        routes : list[str]
+            The rate limited routes (`"POST /chat/{user_id}"`).
+        user_limit : int
+            The maximum requests of a user per window, 0 for no limit.
+        global_limit : int
+            The maximum requests of all users per window, 0 for no limit.
+        window : float
+            The window length in seconds.
+        """
+        self.store = store
+        self.routes = set(routes)
+        self.user_limit = user_limit
+        self.global_limit = global_limit
+        self.window = window
+
+    async def check(self, user_id: str | None):
+        """Counts a request of a user against the limits.
+
+        Raises
+        ------
+        RateLimitExceededError
+            If the request is over the user or the global limit.
+        """
+        index, elapsed = divmod(time.time(), self.window)
+        index = int(index)
+        limits = (
+            ("user", f"user:{user_id}", self.user_limit if user_id else 0),
+            ("global", "global", self.global_limit),
+        )
+        counted = []
+        for scope, key, limit in limits:
+            if limit <= 0:
+                continue
+            try:
+                current, previous = await self.store.increment(key, index, self.window)
+                counted.append(key)
+                delay = sliding_window_delay(
+                    limit, self.window, elapsed, current, previous
+                )
+                if delay > 0:
+                    # The rejected request counts against none of the limits
+                    for counted_key in counted:
+                        await self.store.decrement(counted_key, index)
+            except Exception as e:
+                logging.warning(f"Rate limit store failed, not limiting: {e!r}")
+                return
+            if delay > 0:
+                RATE_LIMITED.inc(scope)
+                raise RateLimitExceededError(scope, retry_after=delay)
+
+    async def close(self):
+        """Closes the counter store."""
+        await self.store.close()
+
+
+class RateLimitMiddleware:
+    """ASGI middleware checking the requests of the rate limited routes with the
+    `RequestRateLimiter` in `app.state.rate_limiter`."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        limiter: RequestRateLimiter | None = (
+            getattr(scope["app"].state, "rate_limiter", None)
+            if scope["type"] == "http"
+            else None
+        )
+        if limiter is not None and route_key(scope) in limiter.routes:
+            await limiter.check(scope.get("path_params", {}).get("user_id"))
+        await self.app(scope, receive, send)
@@ -0,0 +1,401 @@
+"""Routing of the generative model calls over several models and regions.
+
+`ModelRouter` sends every call to one of its endpoints (a model in a region),
+ranked by their observed latency and error rate, or in the configured order.
+A call has a deadline over all its attempts and every attempt a timeout.
+Every failed attempt counts in the error rate of its endpoint, but only those
+that time out, hit the rate limit or fail with a server error are retried on
+the next endpoint after a jittered exponential backoff.
+
+With hedging, an attempt still running after the given percentile of the
+observed latencies of its endpoint is raced against a second attempt on the
+next endpoint, and the first successful result is used. Streamed calls are
+retried and hedged until their first chunk, after which they stick to their
+endpoint.
+"""
+
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import deque
+from typing import Any, AsyncIterator
+
+from google.api_core.exceptions import ServerError, TooManyRequests
+
+from src.backend.config import RoutingStrategy
+from src.tracing import tracer
+
+from .metrics import MODEL_ATTEMPT_DURATION, MODEL_ATTEMPTS, MODEL_HEDGES
+from .scheduler import ModelQueueTimeoutError, ModelScheduler, Priority
+
+# Failures worth another attempt, possibly on another endpoint
+RETRYABLE_ERRORS = (TimeoutError, ModelQueueTimeoutError, ServerError, TooManyRequests)
+
+
+class _LatencyStats:
+    __slots__ = ("samples", "average")
+
+    def __init__(self, window: int):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.average: float | None = None
+
+    def observe(self, seconds: float, alpha: float):
+        self.samples.append(seconds)
+        if self.average is None:
+            self.average = seconds
+        else:
+            self.average += alpha * (seconds - self.average)
+
+    def percentile(self, q: float) -> float:
+        ordered = sorted(self.samples)
+        rank = math.ceil(q / 100 * len(ordered))
+        return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+class Endpoint:
+    """A model of the router and its observed latency and error rate."""
+
+    def __init__(
+        self,
+        name: str,
+        model: Any,
+        window: int = 100,
+        alpha: float = 0.2,
+        half_life: float = 30.0,
+    ):
+        """Initializes the endpoint.
+
+        Parameters
+        ----------
+        name : str
+            The endpoint name, `model` or `model@location`.
+        model : Any
+            The model, with a `generate_content_async` method.
+        window : int
+            The number of latencies kept for the percentiles.
+        alpha : float
+            The smoothing factor of the moving averages.
+        half_life : float
+            The seconds after which the error rate of an idle endpoint halves,
+            so failed endpoints are tried again.
+        """
+        self.name = name
+        self.model = model
+        self.alpha = alpha
+        self.half_life = half_life
+        # Calls and streams (time to the first chunk) have separate latencies
+        self.latency = {False: _LatencyStats(window), True: _LatencyStats(window)}
+        self._error_rate = 0.0
+        self._updated = time.monotonic()
+
+    @property
+    def error_rate(self) -> float:
+        """The moving average of the failed attempts, decaying while idle."""
+        idle = time.monotonic() - self._updated
+        return self._error_rate * 0.5 ** (idle / self.half_life)
+
+    def observe(self, seconds: float, stream: bool, ok: bool):
+        """Records the outcome of an attempt."""
+        self._error_rate = self.error_rate + self.alpha * (
+            (0.0 if ok else 1.0) - self.error_rate
+        )
+        self._updated = time.monotonic()
+        if ok:
+            self.latency[stream].observe(seconds, self.alpha)
+
+
+class ModelRouter:
+    """Sends model calls to the best endpoint with deadlines, retries and
+    hedging, within the rate limits of the scheduler."""
+
+    def __init__(
+        self,
+        scheduler: ModelScheduler | None = None,
+        strategy: RoutingStrategy = RoutingStrategy.LATENCY,
+        deadline: float | None = None,
+        attempt_timeout: float | None = None,
+        max_retries: int = 0,
+        retry_delay: float = 0.5,
+        max_retry_delay: float = 8.0,
+        hedge_percentile: float = 0.0,
+        hedge_min_samples: int = 20,
+        error_threshold: float = 0.5,
+    ):
+        """Initializes the router.
+
+        Parameters
+        ----------
+        scheduler : ModelScheduler | None
+            The rate limits of the endpoints, none if None.
+        strategy : RoutingStrategy
+            Whether healthy endpoints are ranked by their observed latency or
+            kept in the configured order.
+        deadline : float | None
+            The maximum seconds of a call over all its attempts, None for none.
+        attempt_timeout : float | None
+            The maximum seconds of an attempt, None for none.
+        max_retries : int
+            The number of retries of a failed call.
+        retry_delay : float
+            The maximum delay before the first retry, doubled on every retry.
+            The actual delay is drawn uniformly up to it (full jitter).
+        max_retry_delay : float
+            The cap of the maximum retry delay.
+        hedge_percentile : float
+            The latency percentile of an endpoint after which a second attempt
+            is started, 0 to disable hedging.
+        hedge_min_samples : int
+            The number of observed latencies an endpoint needs to be hedged.
+        error_threshold : float
+            The error rate above which an endpoint is only used as last resort.
+        """
+        self.scheduler = scheduler or ModelScheduler()
+        self.strategy = strategy
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.error_threshold = error_threshold
+        self.endpoints: list[Endpoint] = []
+
+    def add_endpoint(self, name: str, model: Any) -> Endpoint:
+        """Adds an endpoint, the first one is the primary endpoint."""
+        endpoint = Endpoint(name, model)
+        self.endpoints.append(endpoint)
+        return endpoint
+
+    async def warmup(self):
+        """Sends a free `count_tokens` request to every endpoint whose model
+        has one, which opens its connection and fetches its credentials."""
+
+        async def ping(endpoint: Endpoint):
+            count_tokens = getattr(endpoint.model, "count_tokens_async", None)
+            if count_tokens is None:
+                return
+            start = time.monotonic()
+            try:
+                await count_tokens(["warmup"])
+            except Exception as e:
+                logging.warning(
+                    f"Warm-up of model endpoint {endpoint.name} failed: {e}"
+                )
+                return
+            logging.info(
+                f"Warmed up model endpoint {endpoint.name} in {time.monotonic() - start:.3f}s"
+            )
+
+        await asyncio.gather(*(ping(endpoint) for endpoint in self.endpoints))
+
+    def ranked(self, stream: bool = False) -> list[Endpoint]:
+        """Returns the endpoints in the order they are tried: the healthy ones
+        by latency (endpoints without latencies first, to measure them) or in
+        the configured order, followed by the unhealthy ones."""
+
+        def rank(item: tuple[int, Endpoint]) -> tuple:
+            index, endpoint = item
+            unhealthy = endpoint.error_rate > self.error_threshold
+            if self.strategy == RoutingStrategy.ORDERED:
+                return unhealthy, index
+            return unhealthy, endpoint.latency[stream].average or 0.0, index
+
+        return [endpoint for _, endpoint in sorted(enumerate(self.endpoints), key=rank)]
+
+    def _hedge_after(self, endpoint: Endpoint, stream: bool) -> float | None:
+        stats = endpoint.latency[stream]
+        if self.hedge_percentile <= 0 or len(stats.samples) < self.hedge_min_samples:
+            return None
+        return stats.percentile(self.hedge_percentile)
+
+    async def generate(
+        self,
+        contents: list,
+        priority: Priority = Priority.INTERACTIVE,
+        stream: bool = False,
+        **kwargs: Any,
+    ) -> Any:
+        """Generates content on the best endpoint, retrying failed attempts.
+
+        Parameters
+        ----------
+        contents : list
+            The model contents.
+        priority : Priority
+            The scheduling priority of the call.
+        stream : bool
+            Whether the response is streamed.
+        **kwargs : Any
+            The other `generate_content_async` arguments.
+
+        Returns
+        -------
+        GenerationResponse | AsyncIterator[GenerationResponse]
+            The response, or the response chunks if streamed.
+
+        Raises
+        ------
+        TimeoutError
+            If the deadline passed before a successful attempt.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline if self.deadline else None
+        ranked = self.ranked(stream)
+        error: BaseException | None = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                cap = min(self.max_retry_delay, self.retry_delay * 2 ** (attempt - 1))
+                delay = random.uniform(0, cap)
+                if deadline is not None and loop.time() + delay >= deadline:
+                    break
+                logging.warning(
+                    f"Model call failed (attempt {attempt}), retrying in {delay:.2f}s: {error!r}"
+                )
+                await asyncio.sleep(delay)
+
+            index = attempt % len(ranked)
+            try:
+                return await self._hedged(
+                    ranked[index],
+                    ranked[(index + 1) % len(ranked)],
+                    contents,
+                    priority,
+                    stream,
+                    deadline,
+                    kwargs,
+                )
+            except RETRYABLE_ERRORS as e:
+                error = e
+
+        raise error or TimeoutError("Model call deadline exceeded")
+
+    async def _hedged(
+        self,
+        endpoint: Endpoint,
+        backup: Endpoint,
+        contents: list,
+        priority: Priority,
+        stream: bool,
+        deadline: float | None,
+        kwargs: dict[str, Any],
+    ) -> Any:
+        """Runs an attempt and, once it is slower than the hedging threshold of
+        its endpoint, a second one on the backup endpoint."""
+        hedge_after = self._hedge_after(endpoint, stream)
+        attempt = self._attempt(endpoint, contents, priority, stream, deadline, kwargs)
+        if hedge_after is None:
+            return await attempt
+
+        tasks = {asyncio.create_task(attempt)}
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                MODEL_HEDGES.inc(backup.name)
+                tasks.add(
+                    asyncio.create_task(
+                        self._attempt(
+                            backup, contents, priority, stream, deadline, kwargs, True
+                        )
+                    )
+                )
+
+            pending, error = tasks, None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            await self._cancel(tasks - {winner})
+
+    @staticmethod
+    async def _cancel(tasks: set[asyncio.Task]):
+        """Cancels the losing attempts and closes their streams."""
+        for task in tasks:
+            task.cancel()
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if hasattr(result, "aclose"):
+                await result.aclose()
+
+    async def _attempt(
+        self,
+        endpoint: Endpoint,
+        contents: list,
+        priority: Priority,
+        stream: bool,
+        deadline: float | None,
+        kwargs: dict[str, Any],
+        hedge: bool = False,
+    ) -> Any:
+        """Calls the model of an endpoint within its rate limit and the
+        timeouts, and records the outcome."""
+        loop = asyncio.get_running_loop()
+        tokens = self.scheduler.estimate(contents)
+        # The wait for the quota counts towards the deadline
+        await self.scheduler.acquire(
+            endpoint.name,
+            priority,
+            tokens,
+            timeout=None if deadline is None else max(deadline - loop.time(), 0.0),
+        )
+
+        timeout = self.attempt_timeout
+        if deadline is not None:
+            remaining = deadline - loop.time()
+            timeout = remaining if timeout is None else min(timeout, remaining)
+
+        with tracer.span(
+            "model.attempt", endpoint=endpoint.name, stream=stream, hedge=hedge
+        ) as span:
+            start = time.monotonic()
+            try:
+                async with asyncio.timeout(timeout):
+                    response = await endpoint.model.generate_content_async(
+                        contents, stream=stream, **kwargs
+                    )
+                    if stream:
+                        chunks = aiter(response)
+                        first = await anext(chunks, None)
+            except Exception as e:
+                # Whether the call is retried is up to `generate`
+                outcome = "timeout" if isinstance(e, TimeoutError) else "error"
+                MODEL_ATTEMPTS.inc(endpoint.name, outcome)
+                endpoint.observe(time.monotonic() - start, stream, ok=False)
+                raise
+
+            latency = time.monotonic() - start
+            span.set_attribute("latency", latency)
+            MODEL_ATTEMPTS.inc(endpoint.name, "ok")
+            MODEL_ATTEMPT_DURATION.observe(endpoint.name, value=latency)
+            endpoint.observe(latency, stream, ok=True)
+
+        if stream:
+            return self._settle_stream(endpoint, first, chunks, tokens)
+        self.scheduler.settle(endpoint.name, tokens, response)
+        return response
+
+    async def _settle_stream(
+        self,
+        endpoint: Endpoint,
+        first: Any,
+        chunks: AsyncIterator[Any],
+        tokens: int,
+    ) -> AsyncIterator[Any]:
+        # The usage is reported with the last chunk
+        response = first
+        if first is not None:
+            yield first
+            async for response in chunks:
+                yield response
+        if response is not None:
+            self.scheduler.settle(endpoint.name, tokens, response)
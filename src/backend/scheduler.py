@@ -0,0 +1,295 @@
+"""Client-side rate limiting of the generative model calls.
+
+Vertex AI enforces per-model quotas in requests and tokens per minute and
+answers bursts over quota with 429 errors. `ModelScheduler` keeps a request
+(RPM) and a token (TPM) bucket per model and queues the calls that don't fit
+in them, live turns ahead of background work such as summaries, so a model
+with a low quota can be used within it.
+
+The token cost of a call is estimated before it is sent (prompt plus the
+expected output) and settled with the usage reported in the response. The
+buckets live in the worker process, so with several workers the limits are
+the quota divided by the number of workers.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from typing import Any
+
+from .context import estimate_tokens
+from .metrics import MODEL_QUEUE_DEPTH, MODEL_QUEUE_TIME, MODEL_QUEUE_TIMEOUTS
+
+
+class Priority(IntEnum):
+    """Scheduling priority of a model call, lower is served first."""
+
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class ModelQueueTimeoutError(Exception):
+    """Raised when a model call waited for its quota longer than allowed."""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Model {model} is over its rate limit")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Bucket refilled continuously at a rate per minute, up to its capacity."""
+
+    def __init__(self, per_minute: float):
+        """Initializes a full bucket.
+
+        Parameters
+        ----------
+        per_minute : float
+            The refill rate per minute, which is also the capacity.
+        """
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Returns the seconds until `amount` tokens are available. Amounts over
+        the capacity only wait for a full bucket."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount: float):
+        """Takes tokens, possibly going into debt."""
+        self.tokens -= amount
+
+
+class _Waiter:
+    __slots__ = ("priority", "sequence", "tokens", "future")
+
+    def __init__(self, priority: Priority, sequence: int, tokens: int, future):
+        self.priority = priority
+        self.sequence = sequence
+        self.tokens = tokens
+        self.future = future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class RateLimiter:
+    """RPM and TPM buckets of a model, and the priority queue of the calls
+    waiting for them."""
+
+    def __init__(self, model: str, rpm: int = 0, tpm: int = 0):
+        """Initializes the rate limiter.
+
+        Parameters
+        ----------
+        model : str
+            The model ID, used as metric label.
+        rpm : int
+            The requests per minute, 0 for no limit.
+        tpm : int
+            The tokens per minute, 0 for no limit.
+        """
+        self.model = model
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.waiters: list[_Waiter] = []
+        self.sequence = itertools.count()
+        self.timer: asyncio.TimerHandle | None = None
+
+    def _delay(self, tokens: int, now: float) -> float:
+        delay = 0.0
+        if self.requests is not None:
+            delay = self.requests.delay(1, now)
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.delay(tokens, now))
+        return delay
+
+    def _take(self, tokens: int):
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+    def _dispatch(self):
+        """Admits the waiting calls in priority order while the buckets allow
+        and schedules the next attempt otherwise."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        now = time.monotonic()
+        while self.waiters:
+            waiter = self.waiters[0]
+            if waiter.future.done():
+                # Timed out or cancelled
+                heapq.heappop(self.waiters)
+                continue
+            delay = self._delay(waiter.tokens, now)
+            if delay > 0:
+                loop = asyncio.get_running_loop()
+                self.timer = loop.call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self.waiters)
+            self._take(waiter.tokens)
+            waiter.future.set_result(None)
+
+    async def acquire(
+        self, priority: Priority, tokens: int, timeout: float | None = None
+    ) -> float:
+        """Waits until the call fits in the buckets and takes its share.
+
+        Parameters
+        ----------
+        priority : Priority
+            The priority of the call.
+        tokens : int
+            The estimated tokens of the call.
+        timeout : float | None
+            The maximum seconds to wait, None to wait indefinitely.
+
+        Returns
+        -------
+        float
+            The seconds the call waited.
+
+        Raises
+        ------
+        ModelQueueTimeoutError
+            If the call waited longer than `timeout`.
+        """
+        label = priority.name.lower()
+        start = time.monotonic()
+        if self.requests is None and self.tokens is None:
+            MODEL_QUEUE_TIME.observe(self.model, label, value=0.0)
+            return 0.0
+
+        waiter = _Waiter(
+            priority,
+            next(self.sequence),
+            tokens,
+            asyncio.get_running_loop().create_future(),
+        )
+        heapq.heappush(self.waiters, waiter)
+        self._dispatch()
+
+        depth = MODEL_QUEUE_DEPTH.labels(self.model, label)
+        depth.inc()
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except TimeoutError:
+            MODEL_QUEUE_TIMEOUTS.inc(self.model, label)
+            raise ModelQueueTimeoutError(
+                self.model, retry_after=self._delay(tokens, time.monotonic())
+            )
+        finally:
+            depth.dec()
+            if not waiter.future.done():
+                waiter.future.cancel()
+            if self.waiters and self.waiters[0] is waiter:
+                self._dispatch()
+
+        waited = time.monotonic() - start
+        MODEL_QUEUE_TIME.observe(self.model, label, value=waited)
+        return waited
+
+    def settle(self, estimated: int, actual: int):
+        """Corrects the token bucket with the actual tokens of a call."""
+        if self.tokens is not None:
+            self.tokens.take(actual - estimated)
+
+
+class ModelScheduler:
+    """Rate limiters of the models, created on first use."""
+
+    def __init__(
+        self,
+        rpm: int = 0,
+        tpm: int = 0,
+        limits: dict[str, tuple[int, int]] | None = None,
+        queue_timeout: float | None = 30.0,
+        output_tokens: int = 256,
+    ):
+        """Initializes the scheduler.
+
+        Parameters
+        ----------
+        rpm : int
+            The default requests per minute of a model, 0 for no limit.
+        tpm : int
+            The default tokens per minute of a model, 0 for no limit.
+        limits : dict[str, tuple[int, int]] | None
+            The (RPM, TPM) limits of specific model IDs.
+        queue_timeout : float | None
+            The maximum seconds an interactive call waits for its quota.
+            Background calls wait indefinitely, or until their deadline.
+        output_tokens : int
+            The expected output tokens of a call, for the token estimate.
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self.limits = limits or {}
+        self.queue_timeout = queue_timeout
+        self.output_tokens = output_tokens
+        self.limiters: dict[str, RateLimiter] = {}
+
+    def limiter(self, model: str) -> RateLimiter:
+        """Returns the rate limiter of a model, or of a `model@location`
+        endpoint with the limits of the model."""
+        limiter = self.limiters.get(model)
+        if limiter is None:
+            model_id = model.split("@")[0]
+            rpm, tpm = self.limits.get(model_id, (self.rpm, self.tpm))
+            limiter = self.limiters[model] = RateLimiter(model, rpm=rpm, tpm=tpm)
+        return limiter
+
+    def estimate(self, contents: list[Any]) -> int:
+        """Estimates the tokens of a call from its contents (strings or content
+        dicts) and the expected output."""
+        tokens = self.output_tokens
+        for content in contents:
+            if isinstance(content, str):
+                tokens += estimate_tokens(content)
+            else:
+                tokens += sum(
+                    estimate_tokens(part.get("text", "")) for part in content["parts"]
+                )
+        return tokens
+
+    async def acquire(
+        self,
+        model: str,
+        priority: Priority,
+        tokens: int,
+        timeout: float | None = None,
+    ) -> float:
+        """Waits for the quota of a call to the model, see `RateLimiter.acquire`.
+
+        Interactive calls wait at most `queue_timeout` seconds, and every call
+        at most `timeout` seconds, such as the time left to its deadline.
+        """
+        if priority == Priority.INTERACTIVE and self.queue_timeout is not None:
+            timeout = (
+                self.queue_timeout
+                if timeout is None
+                else min(timeout, self.queue_timeout)
+            )
+        return await self.limiter(model).acquire(priority, tokens, timeout=timeout)
+
+    def settle(self, model: str, estimated: int, response: Any):
+        """Corrects the token bucket of the model with the usage of a response,
+        if it reports it."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        actual = usage.prompt_token_count + usage.candidates_token_count
+        self.limiter(model).settle(estimated, actual)
@@ -0,0 +1,257 @@
+"""Programmatic launch of the backend on an ASGI server.
+
+The backend runs on uvicorn, on Granian or on Gunicorn with uvicorn workers.
+The servers are started in-process instead of through their command lines,
+each with its own worker management: the app is imported by the workers, not
+by the launching process.
+
+By default a worker is started per CPU the process may use, which in a
+container is its CPU quota (cgroup v2 `cpu.max` or v1 `cpu.cfs_quota_us`)
+rather than the cores of the host, so a worker never shares its CPU with
+another one on a throttled container.
+
+All servers stop accepting connections on SIGTERM and let the workers finish
+their open requests before the app shuts down. uvicorn and Gunicorn cancel the
+requests still open after the graceful timeout; Granian waits for them.
+"""
+
+import importlib.util
+import logging
+import math
+import os
+import pathlib
+from typing import Callable
+
+from src.backend.config import ServerEngine
+
+# The import string of the app, imported by every worker
+APP = "src.backend.app:app"
+
+CGROUP_ROOT = pathlib.Path("/sys/fs/cgroup")
+
+# The module that has to be installed for every server engine
+ENGINE_MODULES = {
+    ServerEngine.UVICORN: "uvicorn",
+    ServerEngine.GRANIAN: "granian",
+    ServerEngine.GUNICORN: "gunicorn",
+}
+
+
+def _read(path: pathlib.Path) -> str | None:
+    try:
+        return path.read_text().strip()
+    except OSError:
+        return None
+
+
+def _cgroup_v2_dirs() -> list[pathlib.Path]:
+    """Returns the cgroup v2 directories of the process, from its own cgroup up
+    to the root, since a quota applies to all the cgroups below it."""
+    text = _read(pathlib.Path("/proc/self/cgroup")) or ""
+    relative = next(
+        (line[3:] for line in text.splitlines() if line.startswith("0::")), "/"
+    )
+    directory = CGROUP_ROOT / relative.lstrip("/")
+    return [
+        directory,
+        *directory.parents[: len(directory.relative_to(CGROUP_ROOT).parts)],
+    ]
+
+
+def cgroup_cpu_quota() -> float | None:
+    """Returns the CPU quota of the process in CPUs, None if it is unlimited.
+
+    The quota is the lowest of the cgroup v2 `cpu.max` of the cgroup of the
+    process and its parents, or the cgroup v1 CFS quota.
+    """
+    quotas = []
+    for directory in _cgroup_v2_dirs():
+        limit = _read(directory / "cpu.max")
+        if limit is None:
+            continue
+        quota, period = limit.split()
+        if quota != "max":
+            quotas.append(int(quota) / int(period))
+
+    for directory in (CGROUP_ROOT / "cpu", CGROUP_ROOT / "cpu,cpuacct"):
+        quota, period = (
+            _read(directory / "cpu.cfs_quota_us"),
+            _read(directory / "cpu.cfs_period_us"),
+        )
+        # A quota of -1 is unlimited
+        if quota and period and int(quota) > 0:
+            quotas.append(int(quota) / int(period))
+
+    return min(quotas) if quotas else None
+
+
+def available_cpus() -> float:
+    """Returns the CPUs the process may use: the CPUs it may be scheduled on,
+    capped by its CPU quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available on macOS
+        cpus = os.cpu_count() or 1
+    quota = cgroup_cpu_quota()
+    return min(cpus, quota) if quota is not None else float(cpus)
+
+
+def default_workers() -> int:
+    """Returns the number of workers for the available CPUs, one per whole CPU.
+
+    The workers are async, so one per CPU keeps the CPUs busy; more workers
+    only compete for the same quota.
+    """
+    return max(1, math.floor(available_cpus()))
+
+
+def available_engines() -> list[ServerEngine]:
+    """Returns the server engines that are installed."""
+    return [
+        engine
+        for engine, module in ENGINE_MODULES.items()
+        if importlib.util.find_spec(module) is not None
+    ]
+
+
+def run_uvicorn(
+    host: str,
+    port: int,
+    workers: int,
+    reload: bool,
+    max_requests: int,
+    graceful_timeout: float,
+):
+    """Runs the app on uvicorn with uvloop and httptools."""
+    import uvicorn
+
+    uvicorn.run(
+        APP,
+        host=host,
+        port=port,
+        workers=workers,
+        reload=reload,
+        loop="uvloop",
+        http="httptools",
+        limit_max_requests=max_requests or None,
+        timeout_graceful_shutdown=graceful_timeout,
+    )
+
+
+def run_granian(
+    host: str,
+    port: int,
+    workers: int,
+    reload: bool,
+    max_requests: int,
+    graceful_timeout: float,
+):
+    """Runs the app on Granian's ASGI interface with uvloop. Granian does not
+    restart workers after a number of requests and drains without timeout."""
+    from granian import Granian
+    from granian.constants import Interfaces, Loops
+
+    if max_requests:
+        logging.info("Granian does not restart workers after max requests")
+    Granian(
+        APP,
+        address=host,
+        port=port,
+        interface=Interfaces.ASGI,
+        workers=workers,
+        loop=Loops.uvloop,
+        reload=reload,
+    ).serve()
+
+
+def run_gunicorn(
+    host: str,
+    port: int,
+    workers: int,
+    reload: bool,
+    max_requests: int,
+    graceful_timeout: float,
+):
+    """Runs the app on uvicorn workers managed by Gunicorn, which restarts
+    workers that die or hang and spreads their max requests restarts."""
+    from gunicorn.app.base import BaseApplication
+    from gunicorn.util import import_app
+
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "reload": reload,
+        "max_requests": max_requests,
+        # Workers started together don't all restart at the same time
+        "max_requests_jitter": max_requests // 10,
+        "graceful_timeout": graceful_timeout,
+    }
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return import_app(APP)
+
+    Application().run()
+
+
+RUNNERS: dict[ServerEngine, Callable[..., None]] = {
+    ServerEngine.UVICORN: run_uvicorn,
+    ServerEngine.GRANIAN: run_granian,
+    ServerEngine.GUNICORN: run_gunicorn,
+}
+
+
+def serve(
+    engine: ServerEngine,
+    host: str,
+    port: int,
+    workers: int = 0,
+    reload: bool = False,
+    max_requests: int = 0,
+    graceful_timeout: float = 30.0,
+):
+    """Runs the app on a server until it is stopped.
+
+    Parameters
+    ----------
+    engine : ServerEngine
+        The ASGI server.
+    host : str
+        The host to bind to.
+    port : int
+        The port to bind to.
+    workers : int
+        The number of worker processes, 0 for one per available CPU.
+    reload : bool
+        Whether the app is reloaded when its code changes, with one worker.
+    max_requests : int
+        The number of requests after which a worker is restarted, 0 for none.
+    graceful_timeout : float
+        The seconds the open requests are given to finish on shutdown.
+    """
+    cpus = available_cpus()
+    if reload:
+        workers = 1
+    elif workers <= 0:
+        workers = default_workers()
+    elif workers > math.ceil(cpus):
+        logging.warning(f"{workers} workers share {cpus:g} available CPUs")
+
+    logging.info(
+        f"Starting {workers} {engine} worker(s) on {host}:{port} "
+        f"({cpus:g} CPUs available)"
+    )
+    RUNNERS[engine](
+        host=host,
+        port=port,
+        workers=workers,
+        reload=reload,
+        max_requests=max_requests,
+        graceful_timeout=graceful_timeout,
+    )
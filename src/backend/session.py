@@ -0,0 +1,93 @@
+import logging
+
+from src.schemas import Role, Message, Conversation
+
+
+class ConversationSession:
+    """Request-scoped unit of work over a single conversation.
+
+    The conversation is loaded once when the session is entered, all changes
+    (user turn, model turn, summary) are applied in memory and the result is
+    committed with a single write when the session exits without an error.
+    Only the history entries added during the session are written.
+
+    Sessions only need the turns that are not folded into the context summary
+    of the conversation, so the store may leave out the older ones (see
+    `ConversationStore`).
+    """
+
+    conversation: Conversation
+
+    def __init__(self, db, user_id: str):
+        """Initializes the session.
+
+        Parameters
+        ----------
+        db : ConversationStore
+            The store the conversation is loaded from and committed to.
+        user_id : str
+            The user ID.
+        """
+        self.db = db
+        self.user_id = user_id
+
+    async def __aenter__(self) -> "ConversationSession":
+        self.conversation, self.persisted, self.version = (
+            await self.db.load_conversation(user_id=self.user_id, full=False)
+        )
+        self.loaded_at = self.conversation.updated
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            await self.commit()
+
+    def add_message(self, message: Message, role: Role) -> bool:
+        """Adds a message to the in-memory conversation.
+
+        Parameters
+        ----------
+        message : Message
+            The message data.
+        role : Role
+            The role of the message.
+
+        Returns
+        -------
+        bool
+            Whether the message was added. A message with the same role as the
+            last message in the history is skipped.
+        """
+        history = self.conversation.history
+        if len(history) > 0 and history[-1].role == role:
+            logging.error(
+                f"Role {role} is the same as the last message role {history[-1].role}, skipping..."
+            )
+            return False
+
+        self.conversation.add_message(parts=[message], role=role)
+        return True
+
+    @property
+    def dirty(self) -> bool:
+        """Whether the conversation changed since it was loaded or last committed."""
+        return self.conversation.updated != self.loaded_at
+
+    async def commit(self):
+        """Writes the conversation to the database if it has changed.
+
+        Raises
+        ------
+        ConversationConflictError
+            If the conversation was written by someone else since it was loaded.
+        """
+        if not self.dirty:
+            return
+        self.version = await self.db.save_conversation(
+            user_id=self.user_id,
+            conversation=self.conversation,
+            persisted=self.persisted,
+            version=self.version,
+        )
+        self.persisted = len(self.conversation.history)
+        self.loaded_at = self.conversation.updated
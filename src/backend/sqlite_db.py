@@ -0,0 +1,399 @@
+import asyncio
+import contextvars
+import logging
+import sqlite3
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from src.schemas import (
+    Role,
+    Message,
+    Conversation,
+    SummaryStatus,
+    generate_empty_conv,
+)
+from src.tracing import traced
+
+from .codec import conversation_from_header, encode_entry, history_from_json
+from .metrics import store_timed
+from .session import ConversationSession
+from .store import ConversationConflictError
+
+# Header columns, one per `Conversation` field except `history`.
+# Columns missing from an existing database are added when it is opened,
+# so columns added later must be nullable or have a default.
+HEADER_COLUMNS = {
+    "created": "TEXT NOT NULL",
+    "updated": "TEXT NOT NULL",
+    "summary": "TEXT",
+    "summary_english": "TEXT",
+    "summary_status": "TEXT",
+    "context_summary": "TEXT",
+    "context_summary_turns": "INTEGER NOT NULL DEFAULT 0",
+}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS conversations (
+    user_id TEXT PRIMARY KEY,
+    {", ".join(f"{name} {kind}" for name, kind in HEADER_COLUMNS.items())},
+    length INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    user_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    entry TEXT NOT NULL,
+    PRIMARY KEY (user_id, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    version INTEGER NOT NULL
+);
+"""
+
+
+class SQLiteDB:
+    """Class for embedded SQLite Database interaction.
+
+    Uses the same append-only layout as `FirestoreDB`: one header row per
+    conversation and one row per `HistoryEntry`. The database runs in WAL mode
+    and all queries are executed on a single dedicated thread, so the event
+    loop is never blocked and the connection is never shared across threads.
+    """
+
+    connection: sqlite3.Connection
+
+    def __init__(self, path: str = "conversations.db"):
+        """Opens (and if needed creates) the SQLite database.
+
+        Parameters
+        ----------
+        path : str
+            The path of the database file.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self.connection = self.executor.submit(self._connect, path).result()
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        connection = sqlite3.connect(path, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        connection.executescript(SCHEMA)
+
+        existing = {
+            row[1] for row in connection.execute("PRAGMA table_info(conversations)")
+        }
+        for name, kind in HEADER_COLUMNS.items():
+            if name not in existing:
+                connection.execute(
+                    f"ALTER TABLE conversations ADD COLUMN {name} {kind}"
+                )
+        # The versions are drawn from one sequence, so a conversation that is
+        # deleted and created again never gets a version it had before
+        connection.execute(
+            "INSERT OR IGNORE INTO versions (id, version) "
+            "SELECT 0, COALESCE(MAX(version), 0) FROM conversations"
+        )
+        return connection
+
+    async def _run(self, func, *args):
+        """Runs a blocking function on the database thread, in the context of
+        the caller so its log records keep the route and sampling of the
+        request."""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, context.run, func, *args
+        )
+
+    def _load(self, user_id: str) -> tuple[Conversation, int, int | None]:
+        header = self.connection.execute(
+            f"SELECT {', '.join(HEADER_COLUMNS)}, length, version "
+            "FROM conversations WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+        if header is None:
+            logging.debug("Conversation Not Found for User ID %s", user_id)
+            return generate_empty_conv(), 0, None
+
+        logging.debug("Conversation Found for User ID %s", user_id)
+        *fields, length, version = header
+        rows = self.connection.execute(
+            "SELECT entry FROM messages WHERE user_id = ? AND idx < ? ORDER BY idx",
+            (user_id, length),
+        )
+        conversation = conversation_from_header(
+            dict(zip(HEADER_COLUMNS, fields)),
+            history_from_json([entry for (entry,) in rows]),
+        )
+        return conversation, length, version
+
+    def _fetch_version(self, user_id: str) -> int | None:
+        row = self.connection.execute(
+            "SELECT version FROM conversations WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def _save(
+        self,
+        user_id: str,
+        conversation: Conversation,
+        persisted: int,
+        version: int | None,
+        conditional: bool,
+    ) -> int:
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            if conditional and self._fetch_version(user_id) != version:
+                raise ConversationConflictError(
+                    f"Conversation for User ID {user_id} was modified concurrently"
+                )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO messages (user_id, idx, entry) VALUES (?, ?, ?)",
+                [
+                    (user_id, index, encode_entry(entry))
+                    for index, entry in enumerate(conversation.history)
+                    if index >= persisted
+                ],
+            )
+            [(new_version,)] = self.connection.execute(
+                "UPDATE versions SET version = version + 1 RETURNING version"
+            ).fetchall()
+            header = conversation.model_dump(mode="json", include=set(HEADER_COLUMNS))
+            self.connection.execute(
+                "INSERT INTO conversations "
+                f"(user_id, {', '.join(HEADER_COLUMNS)}, length, version) "
+                f"VALUES (?, {', '.join('?' for _ in HEADER_COLUMNS)}, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET "
+                + "".join(f"{name} = excluded.{name}, " for name in HEADER_COLUMNS)
+                + "length = excluded.length, version = excluded.version",
+                (
+                    user_id,
+                    *(header[name] for name in HEADER_COLUMNS),
+                    len(conversation.history),
+                    new_version,
+                ),
+            )
+            return new_version
+
+    def _delete(self, user_id: str | None) -> dict[str, int]:
+        where, params = (
+            ("", ()) if user_id is None else (" WHERE user_id = ?", (user_id,))
+        )
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            messages = self.connection.execute(f"DELETE FROM messages{where}", params)
+            conversations = self.connection.execute(
+                f"DELETE FROM conversations{where}", params
+            )
+        return {"conversations": conversations.rowcount, "messages": messages.rowcount}
+
+    @traced("sqlite.load_conversation")
+    @store_timed("sqlite", "load_conversation")
+    async def load_conversation(
+        self, user_id: str, full: bool = True
+    ) -> tuple[Conversation, int, int | None]:
+        """Loads the conversation for the specified user together with the number
+        of persisted history entries and the version of the header row.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        full : bool
+            Ignored, the history is always loaded in full.
+
+        Returns
+        -------
+        tuple[Conversation, int, int | None]
+            The conversation data, the number of persisted history entries and
+            the version of the header row (None if it doesn't exist).
+        """
+        return await self._run(self._load, user_id)
+
+    @traced("sqlite.fetch_version")
+    @store_timed("sqlite", "fetch_version")
+    async def fetch_version(self, user_id: str) -> int | None:
+        """Fetches the version of the conversation without reading its messages.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+
+        Returns
+        -------
+        int | None
+            The version of the header row (None if it doesn't exist).
+        """
+        return await self._run(self._fetch_version, user_id)
+
+    async def fetch_conversation(self, user_id: str):
+        """Fetches the conversation for the specified user.
+        If the conversation doesn't exist, will return an empty conversation.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+
+        Returns
+        -------
+        Conversation
+            The conversation data
+        """
+        conversation, _, _ = await self.load_conversation(user_id=user_id)
+        return conversation
+
+    @traced("sqlite.save_conversation")
+    @store_timed("sqlite", "save_conversation")
+    async def save_conversation(
+        self,
+        user_id: str,
+        conversation: Conversation,
+        persisted: int = 0,
+        version: int | None = None,
+    ) -> int:
+        """Writes the header row and the history entries that are not yet
+        persisted in a single transaction, provided the conversation still has
+        the version it had when it was loaded.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        conversation : Conversation
+            The conversation data.
+        persisted : int
+            The number of history entries already stored.
+        version : int | None
+            The version of the header row when it was loaded, or None if it
+            didn't exist.
+
+        Returns
+        -------
+        int
+            The new version of the header row.
+
+        Raises
+        ------
+        ConversationConflictError
+            If the conversation was written since it was loaded.
+        """
+        return await self._run(
+            self._save, user_id, conversation, persisted, version, True
+        )
+
+    def session(self, user_id: str) -> ConversationSession:
+        """Opens a unit of work over the conversation of the specified user.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+
+        Returns
+        -------
+        ConversationSession
+            The conversation session, to be used as an async context manager.
+        """
+        return ConversationSession(db=self, user_id=user_id)
+
+    async def add_message(self, user_id: str, message: Message, role: Role):
+        """Adds a message to the conversation.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        message : Message
+            The message data.
+        role : Role
+            The role of the message.
+        """
+        async with self.session(user_id=user_id) as session:
+            session.add_message(message=message, role=role)
+
+    @traced("sqlite.update_conversation")
+    @store_timed("sqlite", "update_conversation")
+    async def update_conversation(
+        self, user_id: str, conversation_data: Conversation
+    ) -> int:
+        """Updates the conversation data unconditionally.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        conversation_data : Conversation
+            The conversation data.
+
+        Returns
+        -------
+        int
+            The new version of the header row.
+        """
+        conversation_data.updated = datetime.datetime.now(datetime.UTC)
+        return await self._run(self._save, user_id, conversation_data, 0, None, False)
+
+    @traced("sqlite.delete_conversation")
+    @store_timed("sqlite", "delete_conversation")
+    async def delete_conversation(self, user_id: str):
+        """Deletes the conversation data.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        """
+        await self._run(self._delete, user_id)
+
+    @traced("sqlite.fetch_user_ids")
+    @store_timed("sqlite", "fetch_user_ids")
+    async def fetch_user_ids(self, summary_status: SummaryStatus) -> list[str]:
+        """Fetches the IDs of the users whose conversation has the summary status.
+
+        Parameters
+        ----------
+        summary_status : SummaryStatus
+            The summary status.
+
+        Returns
+        -------
+        list[str]
+            The user IDs.
+        """
+        rows = await self._run(
+            lambda: self.connection.execute(
+                "SELECT user_id FROM conversations WHERE summary_status = ?",
+                (summary_status,),
+            ).fetchall()
+        )
+        return [user_id for (user_id,) in rows]
+
+    @traced("sqlite.clear_collection")
+    @store_timed("sqlite", "clear_collection")
+    async def clear_collection(
+        self, batch_size: int = 500, concurrency: int = 8
+    ) -> dict[str, int]:
+        """Clears all conversations in a single transaction.
+
+        Parameters
+        ----------
+        batch_size : int
+            Unused, kept for compatibility with `FirestoreDB`.
+        concurrency : int
+            Unused, kept for compatibility with `FirestoreDB`.
+
+        Returns
+        -------
+        dict[str, int]
+            The number of deleted conversations and messages.
+        """
+        return await self._run(self._delete, None)
+
+    async def close(self):
+        """Closes the database connection."""
+        await self._run(self.connection.close)
+        self.executor.shutdown()
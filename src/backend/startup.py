@@ -0,0 +1,76 @@
+"""Startup profile of the worker process.
+
+Records how long the phases of the startup take (importing the app, loading
+the credentials, creating and warming up the clients) and when the worker
+became ready and sent its first response, counted from the start of the
+process. On a scale from zero, the first response is what the first user
+waits for.
+"""
+
+import contextlib
+import datetime
+import logging
+import os
+import time
+from typing import Any, Iterator
+
+
+def process_start_time() -> float:
+    """Returns the UNIX time the process started at, from `/proc` on Linux, or
+    the time this module was imported at elsewhere."""
+    try:
+        with open("/proc/self/stat") as file:
+            # The process name may contain spaces, the fields follow its ")"
+            fields = file.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as file:
+            uptime = float(file.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return time.time()
+    started_after_boot = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    return time.time() - uptime + started_after_boot
+
+
+class StartupProfile:
+    """Durations of the startup phases and times of the startup milestones."""
+
+    def __init__(self):
+        self.started = process_start_time()
+        self.phases: dict[str, float] = {}
+        self.milestones: dict[str, float] = {}
+
+    def elapsed(self) -> float:
+        """Returns the seconds since the process started."""
+        return time.time() - self.started
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Records the duration of the enclosed startup phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    def mark(self, milestone: str) -> float:
+        """Records a milestone, the first time only, and returns the seconds
+        from the process start to it."""
+        return self.milestones.setdefault(milestone, self.elapsed())
+
+    def report(self) -> dict[str, Any]:
+        """Returns the startup profile as a JSON-serializable dict."""
+        return {
+            "process_started": datetime.datetime.fromtimestamp(
+                self.started, datetime.UTC
+            ).isoformat(),
+            "milestones": dict(self.milestones),
+            "phases": dict(self.phases),
+        }
+
+    def log(self):
+        """Logs the startup profile in one line."""
+        milestones = ", ".join(f"{k} {v:.3f}s" for k, v in self.milestones.items())
+        phases = ", ".join(f"{k} {v:.3f}s" for k, v in self.phases.items())
+        logging.info(f"Startup after {milestones} (phases: {phases})")
+
+
+STARTUP = StartupProfile()
@@ -0,0 +1,164 @@
+"""Conversation store interface and factory."""
+
+from typing import Any, Protocol
+
+from src.schemas import Role, Message, Conversation, SummaryStatus
+from src.backend.config import BackendSettings, StoreBackend
+
+from .session import ConversationSession
+
+
+class ConversationConflictError(Exception):
+    """Raised when a conversation was modified concurrently."""
+
+
+class UnloadedEntryError(LookupError):
+    """Raised when a history entry left out of a partial load is used."""
+
+
+class _UnloadedEntry:
+    """Placeholder of a history entry that was not loaded. Any use of it
+    raises `UnloadedEntryError` instead of reading wrong data."""
+
+    __slots__ = ()
+
+    def __getattr__(self, name: str):
+        raise UnloadedEntryError(
+            "History entry was not loaded, load the full conversation to read it"
+        )
+
+    def __repr__(self) -> str:
+        return "UNLOADED"
+
+
+UNLOADED = _UnloadedEntry()
+
+
+def is_complete(conversation: Conversation) -> bool:
+    """Whether all history entries of the conversation are loaded. Entries are
+    only ever left out as a prefix of the history."""
+    history = conversation.history
+    return not history or history[0] is not UNLOADED
+
+
+class ConversationStore(Protocol):
+    """Interface of the conversation persistence layer.
+
+    Stores keep the history append-only: `save_conversation` only writes the
+    history entries past the `persisted` count returned by `load_conversation`.
+    Every write produces a new opaque version of the conversation, which can be
+    read cheaply with `fetch_version` (None if the conversation doesn't exist).
+    Versions are never reused, not even by a conversation that was deleted and
+    created again, so a version identifies a single state of the conversation.
+    `save_conversation` only succeeds if the conversation still has the version
+    it was loaded with and raises `ConversationConflictError` otherwise.
+
+    A load with `full=False` may leave out the history entries before
+    `context_summary_turns`, which are folded into the context summary: they
+    are `UNLOADED` placeholders, so the history keeps its length and indices.
+    Stores that can't read part of a history always load it in full.
+    """
+
+    async def load_conversation(
+        self, user_id: str, full: bool = True
+    ) -> tuple[Conversation, int, Any | None]:
+        """Loads the conversation, the number of persisted entries and its version."""
+        ...
+
+    async def fetch_version(self, user_id: str) -> Any | None:
+        """Fetches the version of the conversation without reading its messages."""
+        ...
+
+    async def save_conversation(
+        self,
+        user_id: str,
+        conversation: Conversation,
+        persisted: int = 0,
+        version: Any | None = None,
+    ) -> Any:
+        """Writes the conversation if it is still at `version`, appending the
+        entries past `persisted`, and returns its new version."""
+        ...
+
+    async def fetch_conversation(self, user_id: str) -> Conversation:
+        """Fetches the conversation, or an empty one if it doesn't exist."""
+        ...
+
+    def session(self, user_id: str) -> ConversationSession:
+        """Opens a unit of work over the conversation of the specified user."""
+        ...
+
+    async def add_message(self, user_id: str, message: Message, role: Role):
+        """Adds a message to the conversation."""
+        ...
+
+    async def update_conversation(
+        self, user_id: str, conversation_data: Conversation
+    ) -> Any:
+        """Replaces the conversation data unconditionally and returns its version."""
+        ...
+
+    async def delete_conversation(self, user_id: str):
+        """Deletes the conversation data."""
+        ...
+
+    async def fetch_user_ids(self, summary_status: SummaryStatus) -> list[str]:
+        """Fetches the IDs of the users whose conversation has the summary status."""
+        ...
+
+    async def clear_collection(
+        self, batch_size: int = 500, concurrency: int = 8
+    ) -> dict[str, int]:
+        """Deletes all conversations and returns the number of deleted
+        conversations and messages."""
+        ...
+
+    async def close(self):
+        """Releases the resources held by the store."""
+        ...
+
+
+def create_store(settings: BackendSettings) -> ConversationStore:
+    """Creates the conversation store selected in the settings, wrapped in a
+    conversation cache unless it is disabled.
+
+    Parameters
+    ----------
+    settings : BackendSettings
+        The backend settings.
+
+    Returns
+    -------
+    ConversationStore
+        The conversation store.
+    """
+    match settings.conversation_store:
+        case StoreBackend.FIRESTORE:
+            from .db import FirestoreDB
+
+            store = FirestoreDB(
+                project_id=settings.project_id,
+                database=settings.firestore_db,
+                collection_name="conversations",
+                segment_size=settings.history_segment_size,
+                recent_turns=settings.history_recent_turns,
+            )
+        case StoreBackend.SQLITE:
+            from .sqlite_db import SQLiteDB
+
+            store = SQLiteDB(path=settings.sqlite_path)
+        case _:
+            raise ValueError(
+                f"Unknown conversation store `{settings.conversation_store}`"
+            )
+
+    if settings.cache_max_size > 0:
+        from .cache import CachedStore, ConversationCache
+
+        store = CachedStore(
+            store=store,
+            cache=ConversationCache(
+                max_size=settings.cache_max_size, ttl=settings.cache_ttl
+            ),
+        )
+    return store
@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-from .config import AppSettings, LogLevel  # noqa: F401 (imported but unused)
+from .config import AppSettings, LogFormat, LogLevel, TraceExporter  # noqa: F401 (imported but unused)
 
 # Build the correct path to the .env file
 dotenv_path = os.path.join(
@@ -17,6 +17,21 @@ class LogLevel(StrEnum):
     ERROR = "ERROR"
 
 
+class LogFormat(StrEnum):
+    """Enum class for the log record format."""
+
+    JSON = "json"
+    TEXT = "text"
+
+
+class TraceExporter(StrEnum):
+    """Enum class for the trace span exporter."""
+
+    NONE = "none"
+    CONSOLE = "console"
+    FILE = "file"
+
+
 class AppSettings(BaseSettings):
     """
     Settings class for the application.
@@ -33,3 +48,21 @@ class AppSettings(BaseSettings):
     # UI Settings
     frontend_host: str = "0.0.0.0"
     frontend_port: int = 3000
+
+    # Logging Settings
+    # Records are written to stderr by a background thread, as JSON lines or
+    # text. DEBUG and INFO records of a request are logged for a fraction
+    # `log_sample_rate` of the requests, or the rate of its route in
+    # `log_route_sample_rates` (e.g. {"GET /chat/{user_id}": 0.01}). Records
+    # beyond `log_queue_size` waiting to be written are dropped
+    log_level: LogLevel = LogLevel.INFO
+    log_format: LogFormat = LogFormat.JSON
+    log_sample_rate: float = 1.0
+    log_route_sample_rates: dict[str, float] = {}
+    log_queue_size: int = 10000
+
+    # Tracing Settings
+    # Spans are written as JSON lines to stderr (`console`) or to `tracing_file`
+    tracing_exporter: TraceExporter = TraceExporter.NONE
+    tracing_file: str = "traces.jsonl"
+    tracing_sample_rate: float = 1.0
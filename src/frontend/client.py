@@ -0,0 +1,224 @@
+"""Pooled HTTP client of the backend API."""
+
+from typing import Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+import streamlit as st
+
+from src.schemas import Message, Conversation, ConversationPage
+from src.frontend.config import settings
+from src.tracing import TRACEPARENT, tracer
+
+
+class BackendClient:
+    """Client of the backend API sharing a pool of keep-alive connections.
+
+    A single client is shared by all sessions of the Streamlit server (see
+    `get_client`), so interactions reuse open TCP/TLS connections instead of
+    opening a new one per request. Every request runs in a client span whose
+    trace context is sent along in the `traceparent` header.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        connect_timeout: float = settings.backend_connect_timeout,
+        read_timeout: float = settings.backend_read_timeout,
+        pool_size: int = settings.backend_pool_size,
+    ):
+        """Initializes the client.
+
+        Parameters
+        ----------
+        base_url : str
+            The base URL of the backend.
+        connect_timeout : float
+            The number of seconds to wait for a connection to the backend.
+        read_timeout : float
+            The number of seconds to wait for (a chunk of) a response.
+        pool_size : int
+            The maximum number of kept-alive connections to the backend.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get_chat_page(
+        self, user_id: str, cursor: int = 0, etag: str | None = None
+    ) -> tuple[ConversationPage | None, str | None]:
+        """Get the chat history of a user from the specified cursor on.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        cursor : int
+            The index of the first history entry to get.
+        etag : str | None
+            The ETag of the conversation the client already has, if any.
+
+        Returns
+        -------
+        tuple[ConversationPage | None, str | None]
+            The chat history page, None if the conversation did not change
+            since `etag`, and the current ETag.
+        """
+        with tracer.span("GET /chat/{user_id}", kind="client", cursor=cursor) as span:
+            headers = {"If-None-Match": etag} if etag else {}
+            response = self.session.get(
+                f"{self.base_url}/chat/{user_id}",
+                params={"cursor": cursor},
+                headers=tracer.inject(headers),
+                timeout=self.timeout,
+            )
+            span.set_attribute("http.response.status_code", response.status_code)
+            response.raise_for_status()
+        etag = response.headers.get("ETag", etag)
+        if response.status_code == requests.codes.not_modified:
+            return None, etag
+        return ConversationPage(**response.json()), etag
+
+    def get_chat(self, user_id: str) -> Conversation:
+        """Get the chat history of a user, fetching only what changed since the
+        previous call of the same Streamlit session.
+
+        The conversation is cached in `st.session_state` with its ETag and the
+        cursor of the next history entry. Unchanged conversations cost a
+        304 Not Modified, changed ones only their new history entries.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+
+        Returns
+        -------
+        Conversation
+            The chat history.
+        """
+        cached = st.session_state.get("conversation")
+        if cached is None or cached["user_id"] != user_id:
+            cached = {"user_id": user_id, "page": None, "etag": None}
+
+        page: ConversationPage | None = cached["page"]
+        if page is None:
+            page, etag = self.get_chat_page(user_id=user_id)
+        else:
+            delta, etag = self.get_chat_page(
+                user_id=user_id, cursor=page.cursor, etag=cached["etag"]
+            )
+            if delta is not None and (
+                delta.length < page.cursor or delta.created != page.created
+            ):
+                # The conversation was deleted or replaced, start over
+                page, etag = self.get_chat_page(user_id=user_id)
+            elif delta is not None:
+                history = page.history + delta.history
+                page = delta.model_copy(update={"history": history})
+
+        st.session_state["conversation"] = {
+            "user_id": user_id,
+            "page": page,
+            "etag": etag,
+        }
+        return page.model_copy(update={"history": list(page.history)})
+
+    def send_message(self, user_id: str, message: Message) -> Message:
+        """Send a message to the chat.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        message : Message
+            The message to send.
+
+        Returns
+        -------
+        Message
+            The response message.
+        """
+        with tracer.span("POST /chat/{user_id}", kind="client") as span:
+            response = self.session.post(
+                f"{self.base_url}/chat/{user_id}",
+                json=message.model_dump(),
+                headers=tracer.inject(),
+                timeout=self.timeout,
+            )
+            span.set_attribute("http.response.status_code", response.status_code)
+            response.raise_for_status()
+        return Message(**response.json())
+
+    def send_message_stream(self, user_id: str, message: Message) -> Iterator[str]:
+        """Send a message to the chat and stream the response as it is generated.
+
+        Parameters
+        ----------
+        user_id : str
+            The user ID.
+        message : Message
+            The message to send.
+
+        Yields
+        ------
+        str
+            The text chunks of the response message.
+        """
+        # The span stays open across the yields, so it is not made current
+        with (
+            tracer.span(
+                "POST /chat/{user_id}/stream", kind="client", activate=False
+            ) as span,
+            self.session.post(
+                f"{self.base_url}/chat/{user_id}/stream",
+                json=message.model_dump(),
+                headers={"Accept": "text/event-stream", TRACEPARENT: span.traceparent},
+                stream=True,
+                timeout=self.timeout,
+            ) as response,
+        ):
+            span.set_attribute("http.response.status_code", response.status_code)
+            response.raise_for_status()
+
+            # Parse the Server-Sent Events: `event:`/`data:` fields, blank line ends an event
+            event, data = "message", []
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:") :].strip()
+                elif line.startswith("data:"):
+                    data.append(line[len("data:") :].removeprefix(" "))
+                elif line == "":
+                    if event == "message" and data:
+                        yield "\n".join(data)
+                    elif event == "error":
+                        raise RuntimeError("\n".join(data))
+                    elif event == "done":
+                        return
+                    event, data = "message", []
+
+
+@st.cache_resource
+def get_client() -> BackendClient:
+    """Get the backend client shared by all sessions of the Streamlit server.
+
+    Returns
+    -------
+    BackendClient
+        The backend client.
+    """
+    tracer.configure(
+        service_name="frontend",
+        exporter=settings.tracing_exporter,
+        path=settings.tracing_file,
+        sample_rate=settings.tracing_sample_rate,
+    )
+
+    if "http" not in settings.backend_host:
+        base_url = f"http://{settings.backend_host}:{settings.backend_port}"
+    else:
+        base_url = settings.backend_host
+    return BackendClient(base_url=base_url)
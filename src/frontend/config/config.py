@@ -9,4 +9,7 @@ class FrontendSettings(AppSettings):
     Will contain all .env variables
     """
 
-    pass
+    # Backend Client Settings
+    backend_connect_timeout: float = 3.05
+    backend_read_timeout: float = 120.0
+    backend_pool_size: int = 32
@@ -1,12 +1,11 @@
-import requests
 import sys
 import streamlit as st
 
 # add total project layout to path
 sys.path.append(".")
 
-from src.schemas import Role, Message, Conversation
-from src.frontend.config import settings
+from src.schemas import Role, Message
+from src.frontend.client import get_client
 
 
 ROLE_CONV = {
@@ -15,55 +14,6 @@ ROLE_CONV = {
 }
 
 
-def get_chat(user_id: str) -> Conversation:
-    """Get the chat history for a user.
-
-    Parameters
-    ----------
-    user_id : str
-        The user ID.
-
-    Returns
-    -------
-    Conversation
-        The chat history.
-    """
-    if "http" not in settings.backend_host:
-        url_base = f"http://{settings.backend_host}:{settings.backend_port}"
-    else:
-        url_base = settings.backend_host
-    response = requests.get(url_base + f"/chat/{user_id}")
-    response.raise_for_status()
-    return Conversation(**response.json())
-
-
-def send_message(user_id: str, message: Message) -> Message:
-    """Send a message to the chat.
-
-    Parameters
-    ----------
-    user_id : str
-        The user ID.
-    message : Message
-        The message to send.
-
-    Returns
-    -------
-    Message
-        The response message.
-    """
-    if "http" not in settings.backend_host:
-        url_base = f"http://{settings.backend_host}:{settings.backend_port}"
-    else:
-        url_base = settings.backend_host
-    response = requests.post(
-        url_base + f"/chat/{user_id}",
-        json=message.model_dump(),
-    )
-    response.raise_for_status()
-    return Message(**response.json())
-
-
 if __name__ == "__main__":
     with st.sidebar:
         user_id_key = st.text_input(
@@ -81,8 +31,9 @@ if __name__ == "__main__":
         st.info("Please enter a User ID to continue.")
         st.stop()
 
-    # Make HTTP request to backend to get conversation
-    conversation = get_chat(user_id=user_id_key)
+    # Make HTTP request to backend to get the new part of the conversation
+    client = get_client()
+    conversation = client.get_chat(user_id=user_id_key)
 
     # Display the conversation
     if len(conversation.history) > 0:
@@ -101,14 +52,15 @@ if __name__ == "__main__":
         # Display the user input
         st.chat_message(ROLE_CONV[Role.USER]).write(user_input)
 
-        # Send message to backend
-        response = send_message(
-            user_id=user_id_key,
-            message=Message(text=user_input),
+        # Send message to backend and display the response as it streams in
+        response = Message(
+            text=st.chat_message(ROLE_CONV[Role.MODEL]).write_stream(
+                client.send_message_stream(
+                    user_id=user_id_key,
+                    message=Message(text=user_input),
+                )
+            )
         )
 
         # Store the response
         conversation.add_message(parts=[response], role=Role.MODEL)
-
-        # Display the response
-        st.chat_message(ROLE_CONV[Role.MODEL]).write(response.text)
@@ -0,0 +1,206 @@
+"""Non-blocking, structured logging.
+
+Log calls only put their record on a queue. A background thread formats the
+records and writes them to stderr, so a slow or blocked stderr doesn't stall
+the event loop. Records are JSON lines with the fields Cloud Logging reads
+(`severity`, `message`), the logger, the route of the request and the trace
+and span IDs of the current span, to join the logs with the traces.
+
+Messages are formatted lazily: with `%`-style arguments
+(`logging.debug("Request: %s", data)`) records below the level are not
+formatted at all, and the others are formatted in the writer thread. The
+arguments must therefore not be mutated after the call.
+
+DEBUG and INFO records of HTTP requests are sampled per request, with the
+sample rate of their route: a request is logged in full or not at all.
+WARNING and above are always logged.
+"""
+
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from typing import Any, TextIO
+
+from src.asgi import route_key
+from src.config import LogFormat, LogLevel
+from src.tracing import current_span
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+_route: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "log_route", default=None
+)
+_sampled: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "log_sampled", default=True
+)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as JSON lines."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "timestamp": datetime.datetime.fromtimestamp(
+                record.created, datetime.UTC
+            ).isoformat(),
+            "severity": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("route", "trace_id", "span_id"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Drops the records below WARNING of the requests that are not sampled."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or _sampled.get()
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Puts the records on the queue unformatted, with the request context of
+    the caller, and drops them while the queue is full."""
+
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        route = _route.get()
+        if route is not None:
+            record.route = route
+        span = current_span()
+        if span is not None:
+            record.trace_id = span.trace_id
+            record.span_id = span.span_id
+        if record.exc_info:
+            # The traceback holds on to the frames of the caller
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """The queue handler of the root logger and the thread writing its
+    records."""
+
+    def __init__(self):
+        self.handler: QueueHandler | None = None
+        self.listener: logging.handlers.QueueListener | None = None
+        self.sample_rate = 1.0
+        self.route_sample_rates: dict[str, float] = {}
+
+    def configure(
+        self,
+        level: LogLevel = LogLevel.INFO,
+        format: LogFormat = LogFormat.JSON,
+        sample_rate: float = 1.0,
+        route_sample_rates: dict[str, float] | None = None,
+        queue_size: int = 10000,
+        stream: TextIO | None = None,
+    ):
+        """Replaces the handlers of the root logger with the queue handler and
+        starts the writer thread.
+
+        Parameters
+        ----------
+        level : LogLevel
+            The level of the root logger.
+        format : LogFormat
+            The format of the records, JSON lines or text.
+        sample_rate : float
+            The fraction of the requests whose DEBUG and INFO records are
+            logged.
+        route_sample_rates : dict[str, float] | None
+            The sample rates of specific routes (`"GET /chat/{user_id}"`).
+        queue_size : int
+            The maximum number of records waiting to be written, 0 for no limit.
+        stream : TextIO | None
+            The stream the records are written to, stderr by default.
+        """
+        self.shutdown()
+        self.sample_rate = sample_rate
+        self.route_sample_rates = dict(route_sample_rates or {})
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(
+            JsonFormatter()
+            if format == LogFormat.JSON
+            else logging.Formatter(TEXT_FORMAT)
+        )
+        records: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.handler = QueueHandler(records)
+        self.handler.addFilter(SamplingFilter())
+
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(level)
+
+        self.listener = logging.handlers.QueueListener(records, output)
+        self.listener.start()
+
+    def shutdown(self):
+        """Writes the queued records and stops the writer thread."""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        if self.handler is not None:
+            logging.getLogger().removeHandler(self.handler)
+            if self.handler.dropped:
+                logging.warning(f"Dropped {self.handler.dropped} log records")
+            self.handler = None
+
+    def sample(self, route: str) -> bool:
+        """Decides whether the DEBUG and INFO records of a request are logged."""
+        rate = self.route_sample_rates.get(route, self.sample_rate)
+        return rate >= 1 or random.random() < rate
+
+
+log_pipeline = LogPipeline()
+atexit.register(log_pipeline.shutdown)
+
+
+class LoggingMiddleware:
+    """ASGI middleware setting the route and the sampling decision of the log
+    records of every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = route_key(scope)
+        route_token = _route.set(route)
+        sampled_token = _sampled.set(log_pipeline.sample(route))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _sampled.reset(sampled_token)
+            _route.reset(route_token)
@@ -11,6 +11,15 @@ class Role(StrEnum):
     MODEL = "model"
 
 
+class SummaryStatus(StrEnum):
+    """Summary job status enumeration."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
 class Message(BaseModel):
     """Message model."""
 
@@ -22,6 +31,8 @@ class HistoryEntry(BaseModel):
 
     role: Role
     parts: list[Message]
+    # None for the entries stored before entries were timestamped
+    created: AwareDatetime | None = None
 
 
 class Conversation(BaseModel):
@@ -34,6 +45,9 @@ class Conversation(BaseModel):
     updated: AwareDatetime = datetime.datetime.now(datetime.UTC)
     summary: str | None = None
     summary_english: str | None = None
+    summary_status: SummaryStatus | None = None
+    context_summary: str | None = None
+    context_summary_turns: int = 0
 
     def add_message(self, parts: list[Message], role: Role):
         """Add a message to the conversation.
@@ -56,8 +70,9 @@ class Conversation(BaseModel):
                 raise ValueError(
                     f"Role {role} is the same as the last message role {last_role}, skipping..."
                 )
-        self.history.append(HistoryEntry(role=role, parts=parts))
-        self.updated = datetime.datetime.now(datetime.UTC)
+        now = datetime.datetime.now(datetime.UTC)
+        self.history.append(HistoryEntry(role=role, parts=parts, created=now))
+        self.updated = now
         return self
 
     def add_summary(self, summary: str, summary_english: str):
@@ -77,9 +92,112 @@ class Conversation(BaseModel):
         """
         self.summary = summary
         self.summary_english = summary_english
+        self.summary_status = SummaryStatus.DONE
+        self.updated = datetime.datetime.now(datetime.UTC)
+        return self
+
+    def request_summary(self):
+        """Mark the conversation as waiting for its summary to be generated.
+
+        Returns
+        -------
+        Conversation
+            The updated conversation.
+        """
+        self.summary_status = SummaryStatus.PENDING
+        self.updated = datetime.datetime.now(datetime.UTC)
+        return self
+
+    def start_summary(self):
+        """Mark the summary of the conversation as being generated.
+
+        Returns
+        -------
+        Conversation
+            The updated conversation.
+        """
+        self.summary_status = SummaryStatus.RUNNING
         self.updated = datetime.datetime.now(datetime.UTC)
         return self
 
+    def fail_summary(self):
+        """Mark the summary generation of the conversation as failed.
+
+        Returns
+        -------
+        Conversation
+            The updated conversation.
+        """
+        self.summary_status = SummaryStatus.FAILED
+        self.updated = datetime.datetime.now(datetime.UTC)
+        return self
+
+    def fold_context(self, context_summary: str, turns: int):
+        """Fold the oldest history entries into the rolling context summary.
+
+        Parameters
+        ----------
+        context_summary : str
+            The summary of the first `turns` history entries.
+        turns : int
+            The number of history entries covered by the summary.
+
+        Returns
+        -------
+        Conversation
+            The updated conversation.
+        """
+        self.context_summary = context_summary
+        self.context_summary_turns = turns
+        self.updated = datetime.datetime.now(datetime.UTC)
+        return self
+
+
+class ConversationPage(Conversation):
+    """Conversation Data model holding a page of its history."""
+
+    cursor: int = 0
+    length: int = 0
+
+    @classmethod
+    def from_conversation(
+        cls, conversation: Conversation, start: int = 0, limit: int | None = None
+    ):
+        """Create a page of the history of a conversation.
+
+        Parameters
+        ----------
+        conversation : Conversation
+            The conversation data.
+        start : int
+            The index of the first history entry of the page.
+        limit : int | None
+            The maximum number of history entries of the page, None for all.
+
+        Returns
+        -------
+        ConversationPage
+            The conversation data with the history entries of the page, the
+            cursor of the next page and the length of the full history.
+        """
+        length = len(conversation.history)
+        start = min(start, length)
+        stop = length if limit is None else min(start + limit, length)
+        return cls(
+            **conversation.model_dump(exclude={"history"}),
+            history=conversation.history[start:stop],
+            cursor=stop,
+            length=length,
+        )
+
+
+class Summary(BaseModel):
+    """Conversation Summary model."""
+
+    status: SummaryStatus | None = None
+    summary: str | None = None
+    summary_english: str | None = None
+
 
 def generate_empty_conv():
     return Conversation(
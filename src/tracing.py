@@ -0,0 +1,399 @@
+"""Lightweight, OpenTelemetry-compatible tracing.
+
+Spans follow the OpenTelemetry data model (trace and span IDs, parent span,
+kind, attributes, status) and the trace context is propagated between the
+frontend and the backend with the W3C `traceparent` header, so traces can be
+joined with those of other OpenTelemetry services. Finished spans are written
+as JSON lines to the console or to a file by a background thread, which needs
+no collector.
+
+Tracing is disabled until `tracer.configure` is called with an exporter; a
+disabled tracer only keeps the trace context.
+"""
+
+import atexit
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Any, Callable, Iterator, TextIO
+
+from src.asgi import route_key
+from src.config import TraceExporter
+
+TRACEPARENT = "traceparent"
+
+_current: contextvars.ContextVar["Span | None"] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    """A timed operation of a trace."""
+
+    __slots__ = (
+        "name",
+        "kind",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "sampled",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "status",
+        "status_message",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: str | None,
+        sampled: bool,
+        kind: str = "internal",
+        attributes: dict[str, Any] | None = None,
+    ):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.status = "unset"
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any):
+        """Sets an attribute of the span."""
+        self.attributes[key] = value
+
+    def set_error(self, exc: BaseException):
+        """Marks the span as failed with the specified exception."""
+        self.status = "error"
+        self.status_message = f"{type(exc).__name__}: {exc}"
+
+    @property
+    def traceparent(self) -> str:
+        """The W3C `traceparent` header value of the span."""
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self, resource: dict[str, Any]) -> dict[str, Any]:
+        """Converts the span into a JSON-serializable dict."""
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+            "status": {"code": self.status, "message": self.status_message},
+            "resource": resource,
+        }
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str, bool] | None:
+    """Parses a W3C `traceparent` header.
+
+    Parameters
+    ----------
+    header : str | None
+        The header value.
+
+    Returns
+    -------
+    tuple[str, str, bool] | None
+        The trace ID, the parent span ID and the sampled flag, or None if the
+        header is missing or invalid.
+    """
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    version, trace_id, span_id, flags = parts[:4]
+    try:
+        sampled = bool(int(flags, 16) & 1)
+        int(trace_id, 16), int(span_id, 16)
+    except ValueError:
+        return None
+    if version == "ff" or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return trace_id, span_id, sampled
+
+
+class JsonLinesExporter:
+    """Writes finished spans as JSON lines to a text stream.
+
+    Like the log records (see `src.logs`), finished spans are only put on a
+    queue; a background thread serializes and writes them, so the event loop
+    never blocks on the stream.
+    """
+
+    def __init__(self, stream: TextIO, close: bool = False, queue_size: int = 10000):
+        """Initializes the exporter and starts its writer thread.
+
+        Parameters
+        ----------
+        stream : TextIO
+            The stream the spans are written to.
+        close : bool
+            Whether the stream is closed on shutdown.
+        queue_size : int
+            The maximum number of spans waiting to be written, 0 for no limit.
+        """
+        self.stream = stream
+        self.close_stream = close
+        self.spans: queue.Queue[dict[str, Any] | None] = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.thread = threading.Thread(
+            target=self._write, name="span-exporter", daemon=True
+        )
+        self.thread.start()
+
+    def export(self, span: dict[str, Any]):
+        """Queues a finished span, dropping it while the queue is full."""
+        try:
+            self.spans.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self):
+        while (span := self.spans.get()) is not None:
+            try:
+                self.stream.write(json.dumps(span, default=str) + "\n")
+                if self.spans.empty():
+                    self.stream.flush()
+            except Exception as e:
+                logging.warning(f"Error writing span {span.get('name')}: {e}")
+
+    def shutdown(self):
+        """Writes the queued spans and stops the writer thread."""
+        self.spans.put(None)
+        self.thread.join()
+        self.stream.flush()
+        if self.close_stream:
+            self.stream.close()
+        if self.dropped:
+            logging.warning(f"Dropped {self.dropped} spans")
+
+
+class Tracer:
+    """Creates spans and hands the sampled ones to the exporter once finished."""
+
+    def __init__(self):
+        self.exporter: JsonLinesExporter | None = None
+        self.sample_rate = 1.0
+        self.resource: dict[str, Any] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def configure(
+        self,
+        service_name: str,
+        exporter: TraceExporter = TraceExporter.NONE,
+        path: str = "traces.jsonl",
+        sample_rate: float = 1.0,
+    ):
+        """Configures where the spans are exported to.
+
+        Parameters
+        ----------
+        service_name : str
+            The `service.name` resource attribute of the spans.
+        exporter : TraceExporter
+            The span exporter, `none` disables tracing.
+        path : str
+            The JSON lines file of the `file` exporter.
+        sample_rate : float
+            The fraction of the traces started here that are recorded. Traces
+            continued from a `traceparent` header keep its sampling decision.
+        """
+        self.shutdown()
+        self.resource = {"service.name": service_name}
+        self.sample_rate = sample_rate
+        match exporter:
+            case TraceExporter.CONSOLE:
+                self.exporter = JsonLinesExporter(sys.stderr)
+            case TraceExporter.FILE:
+                self.exporter = JsonLinesExporter(
+                    open(path, "a", encoding="utf-8"), close=True
+                )
+            case _:
+                self.exporter = None
+
+    def shutdown(self):
+        """Flushes and closes the exporter."""
+        if self.exporter is not None:
+            self.exporter.shutdown()
+            self.exporter = None
+
+    @contextlib.contextmanager
+    def span(
+        self,
+        name: str,
+        kind: str = "internal",
+        traceparent: str | None = None,
+        activate: bool = True,
+        **attributes: Any,
+    ) -> Iterator[Span]:
+        """Runs the enclosed block in a new span, a child of the current span.
+
+        Parameters
+        ----------
+        name : str
+            The span name.
+        kind : str
+            The span kind (`internal`, `server` or `client`).
+        traceparent : str | None
+            A `traceparent` header to continue, for spans of incoming requests.
+        activate : bool
+            Whether the span becomes the current span within the block. Spans
+            held open across the yields of a generator are not activated, so
+            they don't leak into the context of the consumer.
+        **attributes : Any
+            The span attributes.
+
+        Yields
+        ------
+        Span
+            The span, which is the current span within the block.
+        """
+        parent = _current.get()
+        remote = parse_traceparent(traceparent) if parent is None else None
+        if parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id, parent.sampled, kind)
+        elif remote is not None:
+            span = Span(name, remote[0], remote[1], remote[2], kind)
+        else:
+            trace_id = f"{random.getrandbits(128):032x}"
+            sampled = random.random() < self.sample_rate
+            span = Span(name, trace_id, None, sampled, kind)
+        span.attributes.update(attributes)
+
+        token = _current.set(span) if activate else None
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(e)
+            raise
+        finally:
+            if token is not None:
+                _current.reset(token)
+            span.end_ns = time.time_ns()
+            exporter = self.exporter
+            if span.sampled and exporter is not None:
+                try:
+                    exporter.export(span.to_dict(self.resource))
+                except Exception as e:
+                    logging.warning(f"Error exporting span {span.name}: {e}")
+
+    def inject(self, headers: dict[str, str] | None = None) -> dict[str, str]:
+        """Adds the `traceparent` header of the current span to the headers.
+
+        Parameters
+        ----------
+        headers : dict[str, str] | None
+            The outgoing request headers.
+
+        Returns
+        -------
+        dict[str, str]
+            The headers, with `traceparent` if there is a current span.
+        """
+        headers = dict(headers or {})
+        span = _current.get()
+        if span is not None:
+            headers[TRACEPARENT] = span.traceparent
+        return headers
+
+
+def current_span() -> Span | None:
+    """Returns the current span, if any."""
+    return _current.get()
+
+
+tracer = Tracer()
+atexit.register(tracer.shutdown)
+
+
+def traced(name: str, **attributes: Any) -> Callable:
+    """Decorator running an async function or async generator in a span.
+
+    Parameters
+    ----------
+    name : str
+        The span name.
+    **attributes : Any
+        The span attributes.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.isasyncgenfunction(func):
+
+            @functools.wraps(func)
+            async def generator(*args, **kwargs):
+                with tracer.span(name, activate=False, **attributes):
+                    async for item in func(*args, **kwargs):
+                        yield item
+
+            return generator
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with tracer.span(name, **attributes):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TracingMiddleware:
+    """ASGI middleware running every HTTP request in a server span that
+    continues the trace of the `traceparent` request header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+
+        method = scope["method"]
+        with tracer.span(
+            route_key(scope),
+            kind="server",
+            traceparent=traceparent,
+            **{"http.request.method": method, "url.path": scope["path"]},
+        ) as span:
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.response.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.status = "error"
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,60 @@
+"""Shared fixtures of the backend tests.
+
+The app runs in-process on an SQLite conversation store in a temporary
+directory and with `FakeChatBot` instead of Vertex AI, so the tests need no
+GCP access.
+"""
+
+import httpx
+import pytest
+
+from benchmarks.fakes import FakeChatBot
+from src.backend import app as app_module
+from src.backend.config import settings
+from src.backend.sqlite_db import SQLiteDB
+
+# The app state created by `app_startup`, dropped after every test
+APP_STATE = ("model", "db", "locks", "rate_limiter", "admission", "summaries")
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+def model() -> FakeChatBot:
+    return FakeChatBot(latency=0.0, tokens_per_second=1e6, reply_tokens=4)
+
+
+@pytest.fixture
+async def db(tmp_path):
+    store = SQLiteDB(path=str(tmp_path / "conversations.db"))
+    yield store
+    await store.close()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch, model):
+    """The backend app with the fake model and an SQLite store."""
+    monkeypatch.setattr(
+        app_module, "init_gcp_credentials", lambda: (None, settings.project_id)
+    )
+    monkeypatch.setattr(settings, "startup_warmup", False)
+    app = app_module.app
+    app.state.model = model
+    app.state.db = SQLiteDB(path=str(tmp_path / "app.db"))
+    yield app
+    for key in APP_STATE:
+        if hasattr(app.state, key):
+            delattr(app.state, key)
+
+
+@pytest.fixture
+async def client(app):
+    """HTTP client of the started app."""
+    async with app.lifespan():
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            yield client
@@ -0,0 +1,96 @@
+import asyncio
+
+import anyio
+import pytest
+
+from src.backend.admission import AdmissionController, AdmissionRejectedError
+from src.backend.config import settings
+
+pytestmark = pytest.mark.anyio
+
+ROUTES = ["POST /chat/{user_id}"]
+
+
+async def test_requests_over_the_limit_wait_in_arrival_order():
+    admission = AdmissionController(max_concurrency=1, routes=ROUTES, queue_size=2)
+    await admission.acquire()
+    order = []
+
+    async def request(name: str):
+        await admission.acquire()
+        order.append(name)
+        admission.release()
+
+    async with anyio.create_task_group() as tasks:
+        tasks.start_soon(request, "first")
+        await asyncio.sleep(0)
+        tasks.start_soon(request, "second")
+        await asyncio.sleep(0)
+        assert admission.waiting == 2
+        admission.release()
+
+    assert order == ["first", "second"]
+    assert admission.active == 0
+
+
+async def test_full_queue_is_shed():
+    admission = AdmissionController(max_concurrency=1, routes=ROUTES, queue_size=0)
+    await admission.acquire()
+
+    with pytest.raises(AdmissionRejectedError) as error:
+        await admission.acquire()
+
+    assert error.value.reason == "queue_full"
+    assert error.value.retry_after > 0
+
+
+async def test_long_wait_is_shed():
+    admission = AdmissionController(
+        max_concurrency=1, routes=ROUTES, queue_size=1, queue_timeout=0.01
+    )
+    await admission.acquire()
+
+    with pytest.raises(AdmissionRejectedError) as error:
+        await admission.acquire()
+
+    assert error.value.reason == "queue_timeout"
+    assert admission.waiting == 0
+
+
+async def test_retry_after_follows_the_request_durations():
+    admission = AdmissionController(max_concurrency=2, routes=ROUTES, alpha=1.0)
+    await admission.acquire()
+    admission.release(duration=4.0)
+
+    assert admission.retry_after() == 2.0
+
+
+@pytest.fixture
+def one_turn_at_a_time(monkeypatch, model):
+    monkeypatch.setattr(settings, "admission_max_concurrency", 1)
+    monkeypatch.setattr(settings, "admission_queue_size", 0)
+    model.latency = 0.1
+
+
+async def test_turns_over_the_limit_are_rejected(one_turn_at_a_time, client):
+    responses = []
+
+    async def turn(user_id: str):
+        responses.append(await client.post(f"/chat/{user_id}", json={"text": "hi"}))
+
+    async with anyio.create_task_group() as tasks:
+        for user_id in ("alice", "bob", "carol"):
+            tasks.start_soon(turn, user_id)
+
+    statuses = sorted(response.status_code for response in responses)
+    assert statuses == [201, 429, 429]
+    for response in responses:
+        if response.status_code == 429:
+            assert int(response.headers["Retry-After"]) >= 1
+
+    # Other routes are not under admission control
+    async with anyio.create_task_group() as tasks:
+        tasks.start_soon(turn, "dave")
+        await asyncio.sleep(0.01)
+        history = await client.get("/chat/alice")
+    assert history.status_code == 200
@@ -0,0 +1,116 @@
+import pytest
+
+from src.backend.cache import CachedStore, ConversationCache
+from src.backend.sqlite_db import SQLiteDB
+from src.schemas import Message, Role, generate_empty_conv
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def stores(tmp_path):
+    """Two cached stores over the same database, like two workers."""
+    path = str(tmp_path / "shared.db")
+    first = CachedStore(store=SQLiteDB(path=path), cache=ConversationCache())
+    second = CachedStore(store=SQLiteDB(path=path), cache=ConversationCache())
+    yield first, second
+    await first.close()
+    await second.close()
+
+
+async def add_turn(store, user_id: str, text: str):
+    async with store.session(user_id=user_id) as session:
+        session.add_message(Message(text=text), role=Role.USER)
+        session.add_message(Message(text=f"re: {text}"), role=Role.MODEL)
+
+
+def texts(conversation) -> list[str]:
+    return [entry.parts[0].text for entry in conversation.history]
+
+
+async def test_cached_conversation_is_served_without_reading_it(stores):
+    first, _ = stores
+    await add_turn(first, "alice", "hello")
+
+    conversation = await first.fetch_conversation("alice")
+
+    assert texts(conversation) == ["hello", "re: hello"]
+    assert first.cache.hits == 1
+
+
+async def test_write_of_another_worker_is_not_served_stale(stores):
+    first, second = stores
+    await add_turn(first, "alice", "hello")
+    await second.fetch_conversation("alice")
+    await add_turn(first, "alice", "again")
+
+    conversation = await second.fetch_conversation("alice")
+
+    assert texts(conversation)[-1] == "re: again"
+
+
+async def test_recreated_conversation_never_matches_a_stale_entry(stores):
+    first, second = stores
+    await add_turn(first, "alice", "old")
+    await second.fetch_conversation("alice")
+    stale = second.cache.entries["alice"].version
+
+    await first.delete_conversation("alice")
+    await add_turn(first, "alice", "new")
+
+    assert await first.fetch_version("alice") != stale
+    assert texts(await second.fetch_conversation("alice")) == ["new", "re: new"]
+
+
+async def test_versions_survive_reopening(tmp_path):
+    path = str(tmp_path / "reopened.db")
+    db = SQLiteDB(path=path)
+    await add_turn(db, "alice", "old")
+    version = await db.fetch_version("alice")
+    await db.delete_conversation("alice")
+    await db.close()
+
+    db = SQLiteDB(path=path)
+    try:
+        await add_turn(db, "alice", "new")
+        assert await db.fetch_version("alice") > version
+    finally:
+        await db.close()
+
+
+async def test_missing_conversation_counts_as_a_miss(stores):
+    first, second = stores
+    await add_turn(first, "alice", "hello")
+    await second.fetch_conversation("alice")
+    await first.delete_conversation("alice")
+
+    misses = second.cache.misses
+    conversation = await second.fetch_conversation("alice")
+
+    assert conversation.history == []
+    assert second.cache.misses == misses + 1
+    assert "alice" not in second.cache.entries
+
+    await second.fetch_conversation("nobody")
+    assert second.cache.misses == misses + 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ConversationCache(max_size=2)
+    for user_id in ("alice", "bob"):
+        cache.put(user_id, conversation=generate_empty_conv(), persisted=0, version=1)
+    assert cache.get("alice", version=1) is not None
+
+    cache.put("carol", conversation=generate_empty_conv(), persisted=0, version=1)
+
+    assert list(cache.entries) == ["alice", "carol"]
+    assert cache.evictions == 1
+
+
+def test_expired_entry_is_a_miss():
+    cache = ConversationCache(ttl=-1.0)
+    cache.put("alice", conversation=generate_empty_conv(), persisted=0, version=1)
+
+    assert cache.get("alice", version=1) is None
+    assert cache.stats()["misses"] == 1
+    assert "alice" not in cache.entries
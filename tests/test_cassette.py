@@ -0,0 +1,117 @@
+import pytest
+from vertexai.preview.generative_models import GenerationResponse
+
+from src.backend.cassette import CassetteMissError, CassetteModel, request_key
+from src.backend.config import CassetteMatch, CassetteMode
+
+pytestmark = pytest.mark.anyio
+
+
+def response(text: str) -> GenerationResponse:
+    return GenerationResponse.from_dict(
+        {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+    )
+
+
+class EchoModel:
+    """Model answering with the last content, in chunks of words if streamed."""
+
+    _model_name = "echo"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        self.calls += 1
+        text = contents[-1]
+        if not stream:
+            return response(text)
+
+        async def chunks():
+            for word in text.split():
+                yield response(word)
+
+        return chunks()
+
+
+async def record(path, model, *prompts: str, stream: bool = False):
+    recorder = CassetteModel(path=str(path), mode=CassetteMode.RECORD, model=model)
+    for prompt in prompts:
+        result = await recorder.generate_content_async([prompt], stream=stream)
+        if stream:
+            [chunk async for chunk in result]
+
+
+async def test_recorded_calls_are_replayed(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    await record(path, EchoModel(), "hello", "bye")
+
+    replay = CassetteModel(path=str(path), mode=CassetteMode.REPLAY, timing_scale=0)
+
+    assert (await replay.generate_content_async(["bye"])).text == "bye"
+    assert (await replay.generate_content_async(["hello"])).text == "hello"
+
+
+async def test_streams_are_replayed_chunk_by_chunk(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    await record(path, EchoModel(), "one two three", stream=True)
+
+    replay = CassetteModel(path=str(path), mode=CassetteMode.REPLAY, timing_scale=0)
+    chunks = await replay.generate_content_async(["one two three"], stream=True)
+
+    assert [chunk.text async for chunk in chunks] == ["one", "two", "three"]
+
+
+async def test_unknown_request_is_a_miss(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    await record(path, EchoModel(), "hello")
+
+    replay = CassetteModel(path=str(path), mode=CassetteMode.REPLAY, timing_scale=0)
+
+    with pytest.raises(CassetteMissError):
+        await replay.generate_content_async(["something else"])
+
+
+async def test_sequence_mode_replays_any_request_in_order(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    await record(path, EchoModel(), "first", "second")
+
+    replay = CassetteModel(
+        path=str(path),
+        mode=CassetteMode.REPLAY,
+        match=CassetteMatch.SEQUENCE,
+        timing_scale=0,
+    )
+    texts = [
+        (await replay.generate_content_async([prompt])).text
+        for prompt in ("x", "y", "z")
+    ]
+
+    assert texts == ["first", "second", "first"]
+
+
+async def test_unfinished_stream_is_not_recorded(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    recorder = CassetteModel(
+        path=str(path), mode=CassetteMode.RECORD, model=EchoModel()
+    )
+
+    chunks = await recorder.generate_content_async(["one two"], stream=True)
+    await anext(chunks)
+    await chunks.aclose()
+
+    assert not path.exists()
+
+
+def test_request_key_depends_on_the_request():
+    key, request = request_key(["hello"], None, None, stream=False)
+
+    assert request["contents"] == ["hello"]
+    assert key == request_key(["hello"], None, None, stream=False)[0]
+    assert key != request_key(["hello"], None, None, stream=True)[0]
+    assert key != request_key(["bye"], None, None, stream=False)[0]
+
+
+def test_recording_requires_a_model(tmp_path):
+    with pytest.raises(ValueError):
+        CassetteModel(path=str(tmp_path / "cassette.jsonl"), mode=CassetteMode.RECORD)
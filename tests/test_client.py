@@ -0,0 +1,179 @@
+import datetime
+import types
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+from src.frontend import client as client_module  # noqa: E402
+from src.frontend.client import BackendClient  # noqa: E402
+from src.schemas import Message, Role, generate_empty_conv  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, json=None, headers=None, lines=()):
+        self.status_code = status_code
+        self._json = json
+        self.headers = headers or {}
+        self.lines = lines
+
+    def json(self):
+        return self._json
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.lines)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    """Records the requests and answers them with the queued responses."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, **kwargs):
+        self.requests.append(("GET", url, kwargs))
+        return self.responses.pop(0)
+
+    def post(self, url, **kwargs):
+        self.requests.append(("POST", url, kwargs))
+        return self.responses.pop(0)
+
+
+CREATED = datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+
+
+def page(
+    texts: list[str],
+    start: int = 0,
+    length: int | None = None,
+    created: datetime.datetime = CREATED,
+) -> dict:
+    conversation = generate_empty_conv()
+    conversation.created = created
+    roles = [Role.USER, Role.MODEL]
+    for i, text in enumerate(texts):
+        conversation.add_message([Message(text=text)], role=roles[(start + i) % 2])
+    return {
+        **conversation.model_dump(mode="json"),
+        "cursor": start + len(texts),
+        "length": length if length is not None else start + len(texts),
+    }
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(client_module, "st", types.SimpleNamespace(session_state={}))
+    return BackendClient(base_url="http://backend/")
+
+
+def test_first_read_fetches_the_whole_history(backend):
+    backend.session = FakeSession(
+        FakeResponse(json=page(["hello", "hi"]), headers={"ETag": '"1"'})
+    )
+
+    conversation = backend.get_chat("alice")
+
+    assert [entry.parts[0].text for entry in conversation.history] == ["hello", "hi"]
+    _, url, kwargs = backend.session.requests[0]
+    assert url == "http://backend/chat/alice"
+    assert kwargs["params"] == {"cursor": 0}
+    assert "If-None-Match" not in kwargs["headers"]
+
+
+def test_unchanged_history_is_revalidated(backend):
+    backend.session = FakeSession(
+        FakeResponse(json=page(["hello", "hi"]), headers={"ETag": '"1"'}),
+        FakeResponse(status_code=304, headers={"ETag": '"1"'}),
+    )
+
+    backend.get_chat("alice")
+    conversation = backend.get_chat("alice")
+
+    assert len(conversation.history) == 2
+    _, _, kwargs = backend.session.requests[1]
+    assert kwargs["params"] == {"cursor": 2}
+    assert kwargs["headers"]["If-None-Match"] == '"1"'
+
+
+def test_only_new_entries_are_fetched(backend):
+    backend.session = FakeSession(
+        FakeResponse(json=page(["hello", "hi"]), headers={"ETag": '"1"'}),
+        FakeResponse(json=page(["more", "sure"], start=2), headers={"ETag": '"2"'}),
+    )
+
+    backend.get_chat("alice")
+    conversation = backend.get_chat("alice")
+
+    assert [entry.parts[0].text for entry in conversation.history] == [
+        "hello",
+        "hi",
+        "more",
+        "sure",
+    ]
+    assert client_module.st.session_state["conversation"]["etag"] == '"2"'
+
+
+def test_replaced_history_is_fetched_again(backend):
+    backend.session = FakeSession(
+        FakeResponse(json=page(["hello", "hi"]), headers={"ETag": '"1"'}),
+        FakeResponse(json=page([], start=0, length=0), headers={"ETag": '"2"'}),
+        FakeResponse(json=page(["new"]), headers={"ETag": '"3"'}),
+    )
+
+    backend.get_chat("alice")
+    conversation = backend.get_chat("alice")
+
+    assert [entry.parts[0].text for entry in conversation.history] == ["new"]
+    assert backend.session.requests[2][2]["params"] == {"cursor": 0}
+
+
+def test_recreated_history_is_fetched_again(backend):
+    # A new conversation that already grew past the cached cursor
+    recreated = CREATED + datetime.timedelta(hours=1)
+    backend.session = FakeSession(
+        FakeResponse(json=page(["hello", "hi"]), headers={"ETag": '"1"'}),
+        FakeResponse(
+            json=page(["and"], start=2, created=recreated), headers={"ETag": '"2"'}
+        ),
+        FakeResponse(
+            json=page(["new", "one", "and"], created=recreated), headers={"ETag": '"3"'}
+        ),
+    )
+
+    backend.get_chat("alice")
+    conversation = backend.get_chat("alice")
+
+    assert [entry.parts[0].text for entry in conversation.history] == [
+        "new",
+        "one",
+        "and",
+    ]
+    assert backend.session.requests[2][2]["params"] == {"cursor": 0}
+
+
+def test_stream_yields_the_chunks_until_done(backend):
+    lines = ["data: Hello", "", "data: world", "", "event: done", "data:", ""]
+    backend.session = FakeSession(FakeResponse(lines=lines))
+
+    chunks = list(backend.send_message_stream("alice", Message(text="hi")))
+
+    assert chunks == ["Hello", "world"]
+
+
+def test_stream_error_is_raised(backend):
+    lines = ["data: Hel", "", "event: error", "data: Internal Server Error", ""]
+    backend.session = FakeSession(FakeResponse(lines=lines))
+
+    with pytest.raises(RuntimeError, match="Internal Server Error"):
+        list(backend.send_message_stream("alice", Message(text="hi")))
@@ -0,0 +1,92 @@
+import datetime
+import json
+
+import pydantic
+import pytest
+
+from src.backend.codec import (
+    conversation_from_header,
+    conversation_to_builtins,
+    decode_segment,
+    encode_entry,
+    encode_segment,
+    entry_to_builtins,
+    history_from_dicts,
+    history_from_json,
+)
+from src.schemas import (
+    ConversationPage,
+    HistoryEntry,
+    Message,
+    Role,
+    SummaryStatus,
+    generate_empty_conv,
+)
+
+
+def conversation_of(turns: int):
+    conversation = generate_empty_conv()
+    for i in range(turns):
+        role = Role.USER if i % 2 == 0 else Role.MODEL
+        conversation.add_message([Message(text=f'text {i} "é"')], role=role)
+    return conversation
+
+
+def test_entry_builtins_match_model_dump():
+    for entry in conversation_of(2).history:
+        assert entry_to_builtins(entry) == entry.model_dump()
+
+
+def test_entry_without_timestamp_has_no_created_field():
+    entry = HistoryEntry(role=Role.USER, parts=[Message(text="old")])
+
+    assert entry_to_builtins(entry) == {"role": "user", "parts": [{"text": "old"}]}
+
+
+def test_json_roundtrip():
+    history = conversation_of(4).history
+
+    assert history_from_json([encode_entry(entry) for entry in history]) == history
+
+
+def test_dict_roundtrip_ignores_store_fields():
+    history = conversation_of(3).history
+    stored = [
+        {**entry_to_builtins(entry), "index": index}
+        for index, entry in enumerate(history)
+    ]
+
+    assert history_from_dicts(stored) == history
+
+
+def test_segment_roundtrip():
+    history = conversation_of(5).history
+
+    decoded = history_from_dicts(decode_segment(encode_segment(history)))
+
+    assert decoded == history
+
+
+def test_invalid_entry_is_rejected():
+    with pytest.raises(pydantic.ValidationError):
+        history_from_json([json.dumps({"role": "robot", "parts": []})])
+
+
+def test_conversation_from_header_validates_the_header():
+    header = {
+        "created": datetime.datetime.now(datetime.UTC),
+        "updated": datetime.datetime.now(datetime.UTC),
+        "summary_status": "pending",
+    }
+    history = conversation_of(2).history
+
+    conversation = conversation_from_header(header, history)
+
+    assert conversation.summary_status == SummaryStatus.PENDING
+    assert conversation.history == history
+
+
+def test_page_builtins_match_model_dump():
+    page = ConversationPage.from_conversation(conversation_of(4), start=1, limit=2)
+
+    assert conversation_to_builtins(page) == page.model_dump()
@@ -0,0 +1,72 @@
+from src.backend.context import ContextWindow, estimate_tokens
+from src.schemas import Message, Role, generate_empty_conv
+
+
+def conversation_of(turns: int, text: str = "hello"):
+    conversation = generate_empty_conv()
+    for i in range(turns):
+        role = Role.USER if i % 2 == 0 else Role.MODEL
+        conversation.add_message([Message(text=f"{text} {i}")], role=role)
+    return conversation
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("a" * 40) == 11
+
+
+def test_window_that_fits_folds_nothing():
+    window = ContextWindow(recent_turns=10, max_tokens=1000)
+
+    assert window.turns_to_fold(conversation_of(10)) == []
+
+
+def test_window_over_the_turn_limit_is_halved():
+    window = ContextWindow(recent_turns=10, max_tokens=1000)
+    conversation = conversation_of(12)
+
+    folded = window.turns_to_fold(conversation)
+
+    assert folded == conversation.history[:6]
+    # The verbatim window starts with a user turn
+    assert conversation.history[len(folded)].role == Role.USER
+
+
+def test_window_over_the_token_budget_is_folded():
+    window = ContextWindow(recent_turns=100, max_tokens=100)
+    conversation = conversation_of(6, text="x" * 100)
+
+    folded = window.turns_to_fold(conversation)
+
+    assert 0 < len(folded) < 6
+    assert conversation.history[len(folded)].role == Role.USER
+
+
+def test_already_folded_turns_are_not_folded_again():
+    window = ContextWindow(recent_turns=10, max_tokens=1000)
+    conversation = conversation_of(12)
+    conversation.fold_context(context_summary="earlier turns", turns=8)
+
+    assert window.turns_to_fold(conversation) == []
+
+
+def test_contents_start_with_the_summary():
+    window = ContextWindow()
+    conversation = conversation_of(6)
+    conversation.fold_context(context_summary="earlier turns", turns=4)
+
+    contents = window.contents(conversation)
+
+    assert len(contents) == 4
+    assert "earlier turns" in contents[0]["parts"][0]["text"]
+    assert contents[1]["role"] == Role.MODEL
+    assert contents[2]["parts"][0]["text"] == "hello 4"
+
+
+def test_contents_without_summary_are_the_history():
+    contents = ContextWindow().contents(conversation_of(2))
+
+    assert [content["parts"][0]["text"] for content in contents] == [
+        "hello 0",
+        "hello 1",
+    ]
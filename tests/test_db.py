@@ -0,0 +1,398 @@
+import pytest
+from google.api_core.exceptions import NotFound, ServiceUnavailable
+from google.cloud import firestore
+
+from benchmarks.fakes import FirestoreStub
+from src.backend.cache import CachedStore, ConversationCache
+from src.backend.codec import decode_segment
+from src.backend.db import FirestoreDB
+from src.backend.store import UNLOADED, ConversationConflictError, UnloadedEntryError
+from src.schemas import Conversation, HistoryEntry, Message, Role
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def store(monkeypatch) -> FirestoreDB:
+    FirestoreStub.reset()
+    monkeypatch.setattr(firestore, "AsyncClient", FirestoreStub)
+    return FirestoreDB(project_id="test", database="test")
+
+
+def messages(store: FirestoreDB, user_id: str) -> dict[str, tuple]:
+    prefix = ("conversations", user_id, "messages")
+    return {
+        path[-1]: value
+        for path, value in FirestoreStub.documents.items()
+        if path[:-1] == prefix
+    }
+
+
+async def add_turns(store: FirestoreDB, user_id: str, *texts: str):
+    roles = [Role.USER, Role.MODEL]
+    async with store.session(user_id=user_id) as session:
+        start = len(session.conversation.history)
+        for i, text in enumerate(texts):
+            session.add_message(Message(text=text), role=roles[(start + i) % 2])
+
+
+async def test_save_appends_only_new_messages(store):
+    await add_turns(store, "alice", "hello", "hi")
+    first = messages(store, "alice")
+    await add_turns(store, "alice", "how are you", "fine")
+
+    stored = messages(store, "alice")
+    assert sorted(stored) == ["00000000", "00000001", "00000002", "00000003"]
+    # The messages of the first turn were not written again
+    assert all(stored[name][1] == first[name][1] for name in first)
+
+    conversation, persisted, version = await store.load_conversation("alice")
+    assert [entry.parts[0].text for entry in conversation.history] == [
+        "hello",
+        "hi",
+        "how are you",
+        "fine",
+    ]
+    assert persisted == 4
+    assert version == await store.fetch_version("alice")
+
+
+async def test_missing_conversation_is_empty(store):
+    conversation, persisted, version = await store.load_conversation("nobody")
+
+    assert conversation.history == []
+    assert persisted == 0
+    assert version is None
+
+
+async def test_not_found_is_an_empty_conversation(store, monkeypatch):
+    async def not_found(*args, **kwargs):
+        raise NotFound("database not found")
+
+    monkeypatch.setattr("benchmarks.fakes._Document.get", not_found)
+
+    conversation, _, version = await store.load_conversation("alice")
+    assert conversation.history == []
+    assert version is None
+
+
+async def test_read_errors_are_not_an_empty_conversation(store, monkeypatch):
+    await add_turns(store, "alice", "hello")
+
+    async def unavailable(*args, **kwargs):
+        raise ServiceUnavailable("try again")
+
+    monkeypatch.setattr("benchmarks.fakes._Document.get", unavailable)
+
+    with pytest.raises(ServiceUnavailable):
+        await store.load_conversation("alice")
+
+
+async def test_read_overlapping_a_write_is_repeated(store, monkeypatch):
+    await add_turns(store, "alice", "hello", "hi")
+    # The header of a concurrent turn is read, its messages are not
+    header = ("conversations", "alice")
+    data, update_time = FirestoreStub.documents[header]
+    FirestoreStub.documents[header] = ({**data, "length": 4}, update_time)
+
+    reads = 0
+    original = FirestoreStub.round_trip
+
+    async def round_trip(self):
+        nonlocal reads
+        reads += 1
+        if reads == 4:
+            # The messages of the turn are written before the second read
+            FirestoreStub.documents[header + ("messages", "00000002")] = (
+                {"role": "user", "parts": [{"text": "more"}], "index": 2},
+                update_time,
+            )
+            FirestoreStub.documents[header + ("messages", "00000003")] = (
+                {"role": "model", "parts": [{"text": "sure"}], "index": 3},
+                update_time,
+            )
+        await original(self)
+
+    monkeypatch.setattr(FirestoreStub, "round_trip", round_trip)
+
+    conversation, persisted, _ = await store.load_conversation("alice")
+    assert persisted == 4
+    assert len(conversation.history) == 4
+
+
+async def test_incomplete_history_is_a_conflict(store):
+    await add_turns(store, "alice", "hello", "hi")
+    FirestoreStub.documents.pop(("conversations", "alice", "messages", "00000001"))
+
+    with pytest.raises(ConversationConflictError):
+        await store.load_conversation("alice")
+
+
+async def test_concurrent_sessions_conflict(store):
+    await add_turns(store, "alice", "hello")
+
+    with pytest.raises(ConversationConflictError):
+        async with store.session(user_id="alice") as first:
+            async with store.session(user_id="alice") as second:
+                second.add_message(Message(text="hi"), role=Role.MODEL)
+            first.add_message(Message(text="hey"), role=Role.MODEL)
+
+    conversation = await store.fetch_conversation("alice")
+    assert [entry.parts[0].text for entry in conversation.history] == ["hello", "hi"]
+
+
+async def test_concurrent_creation_conflicts(store):
+    with pytest.raises(ConversationConflictError):
+        async with store.session(user_id="alice") as first:
+            await add_turns(store, "alice", "hello")
+            first.add_message(Message(text="hey"), role=Role.USER)
+
+
+async def test_session_over_a_recreated_conversation_conflicts(store):
+    await add_turns(store, "alice", "old")
+
+    with pytest.raises(ConversationConflictError):
+        async with store.session(user_id="alice") as session:
+            await store.delete_conversation("alice")
+            await add_turns(store, "alice", "new")
+            session.add_message(Message(text="late"), role=Role.MODEL)
+
+    conversation = await store.fetch_conversation("alice")
+    assert [entry.parts[0].text for entry in conversation.history] == ["new"]
+
+
+async def test_legacy_conversation_is_migrated_on_save(store):
+    legacy = Conversation(
+        history=[
+            HistoryEntry(role=Role.USER, parts=[Message(text="hello")]),
+            HistoryEntry(role=Role.MODEL, parts=[Message(text="hi")]),
+        ]
+    )
+    FirestoreStub.documents[("conversations", "alice")] = (
+        legacy.model_dump(),
+        FirestoreStub.now(),
+    )
+
+    conversation, persisted, _ = await store.load_conversation("alice")
+    assert persisted == 0
+    assert len(conversation.history) == 2
+
+    await add_turns(store, "alice", "bye")
+
+    header, _ = FirestoreStub.documents[("conversations", "alice")]
+    assert "history" not in header
+    assert header["length"] == 3
+    assert len(messages(store, "alice")) == 3
+
+
+async def test_clear_collection_deletes_everything(store):
+    for i in range(7):
+        await add_turns(store, f"user-{i}", "hello", "hi")
+
+    progress = await store.clear_collection(batch_size=3, concurrency=2)
+
+    assert progress == {"conversations": 7, "messages": 14}
+    assert FirestoreStub.documents == {}
+
+
+async def test_clear_collection_bounds_the_parallel_deletes(store, monkeypatch):
+    for i in range(6):
+        await add_turns(store, f"user-{i}", "hello")
+    purge = store._purge_conversation
+    running = peak = 0
+
+    async def counted(doc_ref):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            return await purge(doc_ref)
+        finally:
+            running -= 1
+
+    monkeypatch.setattr(store, "_purge_conversation", counted)
+    FirestoreStub.latency = 0.01
+
+    await store.clear_collection(batch_size=4, concurrency=2)
+
+    assert peak == 2
+
+
+async def test_interrupted_clear_collection_resumes(store, monkeypatch):
+    for i in range(4):
+        await add_turns(store, f"user-{i}", "hello")
+    purge = store._purge_conversation
+    purged = 0
+
+    async def interrupted(doc_ref):
+        nonlocal purged
+        if purged == 2:
+            raise RuntimeError("interrupted")
+        purged += 1
+        return await purge(doc_ref)
+
+    monkeypatch.setattr(store, "_purge_conversation", interrupted)
+    with pytest.raises(RuntimeError):
+        await store.clear_collection(batch_size=1, concurrency=1)
+    monkeypatch.setattr(store, "_purge_conversation", purge)
+
+    assert await store.clear_collection() == {"conversations": 2, "messages": 2}
+    assert FirestoreStub.documents == {}
+
+
+async def test_delete_conversation_deletes_its_messages(store):
+    await add_turns(store, "alice", "hello", "hi")
+    await add_turns(store, "bob", "hello")
+
+    await store.delete_conversation("alice")
+
+    assert messages(store, "alice") == {}
+    assert await store.fetch_version("alice") is None
+    assert len(messages(store, "bob")) == 1
+
+
+@pytest.fixture
+def segmented_store(monkeypatch) -> FirestoreDB:
+    FirestoreStub.reset()
+    monkeypatch.setattr(firestore, "AsyncClient", FirestoreStub)
+    return FirestoreDB(
+        project_id="test", database="test", segment_size=4, recent_turns=2
+    )
+
+
+def segments(user_id: str) -> dict[str, tuple]:
+    prefix = ("conversations", user_id, "segments")
+    return {
+        path[-1]: value
+        for path, value in FirestoreStub.documents.items()
+        if path[:-1] == prefix
+    }
+
+
+async def test_cold_history_is_packed_into_segments(segmented_store):
+    store = segmented_store
+    texts = [f"text {i}" for i in range(11)]
+    for text in texts:
+        await add_turns(store, "alice", text)
+
+    header, _ = FirestoreStub.documents[("conversations", "alice")]
+    assert header["segmented"] == 8
+    assert [value[0]["start"] for value in segments("alice").values()] == [0, 4]
+    # The packed messages are deleted, the recent ones stay plain
+    assert sorted(messages(store, "alice")) == ["00000008", "00000009", "00000010"]
+
+    conversation, persisted, _ = await store.load_conversation("alice")
+    assert [entry.parts[0].text for entry in conversation.history] == texts
+    assert persisted == 11
+
+
+async def test_segmented_history_keeps_appending(segmented_store):
+    store = segmented_store
+    for i in range(9):
+        await add_turns(store, "alice", f"text {i}")
+
+    async with store.session(user_id="alice") as session:
+        assert len(session.conversation.history) == 9
+        session.add_message(Message(text="more"), role=Role.MODEL)
+
+    conversation = await store.fetch_conversation("alice")
+    assert conversation.history[-1].parts[0].text == "more"
+    assert len(conversation.history) == 10
+
+
+async def test_missing_segment_is_a_conflict(segmented_store):
+    store = segmented_store
+    for i in range(9):
+        await add_turns(store, "alice", f"text {i}")
+    FirestoreStub.documents.pop(
+        next(
+            path
+            for path in FirestoreStub.documents
+            if path[:3] == ("conversations", "alice", "segments")
+        )
+    )
+
+    with pytest.raises(ConversationConflictError):
+        await store.load_conversation("alice")
+
+
+async def test_segmented_conversation_is_purged(segmented_store):
+    store = segmented_store
+    for i in range(9):
+        await add_turns(store, "alice", f"text {i}")
+
+    await store.delete_conversation("alice")
+
+    assert FirestoreStub.documents == {}
+
+
+async def fold(store: FirestoreDB, user_id: str, turns: int):
+    async with store.session(user_id=user_id) as session:
+        session.conversation.fold_context(context_summary="summary", turns=turns)
+
+
+@pytest.fixture
+def decoded(monkeypatch) -> list[int]:
+    """Records the number of entries of every segment that is decompressed."""
+    sizes = []
+
+    def decode(data):
+        entries = decode_segment(data)
+        sizes.append(len(entries))
+        return entries
+
+    monkeypatch.setattr("src.backend.db.decode_segment", decode)
+    return sizes
+
+
+async def test_session_skips_the_folded_segments(segmented_store, decoded):
+    store = segmented_store
+    for i in range(11):
+        await add_turns(store, "alice", f"text {i}")
+    await fold(store, "alice", turns=9)
+    decoded.clear()
+
+    async with store.session(user_id="alice") as session:
+        history = session.conversation.history
+        assert len(history) == 11
+        assert history[0] is UNLOADED
+        assert history[-1].parts[0].text == "text 10"
+        with pytest.raises(UnloadedEntryError):
+            history[7].role
+        session.add_message(Message(text="more"), role=Role.MODEL)
+
+    assert decoded == []
+    conversation = await store.fetch_conversation("alice")
+    assert [entry.parts[0].text for entry in conversation.history] == [
+        f"text {i}" for i in range(11)
+    ] + ["more"]
+
+
+async def test_session_reads_the_segments_past_the_summary(segmented_store, decoded):
+    store = segmented_store
+    for i in range(11):
+        await add_turns(store, "alice", f"text {i}")
+    await fold(store, "alice", turns=5)
+    decoded.clear()
+
+    async with store.session(user_id="alice") as session:
+        history = session.conversation.history
+        assert history[3] is UNLOADED
+        assert [entry.parts[0].text for entry in history[4:]] == [
+            f"text {i}" for i in range(4, 11)
+        ]
+
+    assert len(decoded) == 1
+
+
+async def test_cache_serves_partial_conversations_to_sessions_only(segmented_store):
+    for i in range(11):
+        await add_turns(segmented_store, "alice", f"text {i}")
+    await fold(segmented_store, "alice", turns=9)
+
+    store = CachedStore(store=segmented_store, cache=ConversationCache())
+    async with store.session(user_id="alice") as session:
+        assert session.conversation.history[0] is UNLOADED
+
+    conversation = await store.fetch_conversation("alice")
+    assert conversation.history[0].parts[0].text == "text 0"
@@ -0,0 +1,100 @@
+import datetime
+
+import pytest
+
+from src.backend.app import since_index
+from src.schemas import Conversation, HistoryEntry, Message, Role, generate_empty_conv
+
+pytestmark = pytest.mark.anyio
+
+
+async def chat(client, user_id: str, text: str):
+    response = await client.post(f"/chat/{user_id}", json={"text": text})
+    assert response.status_code == 201
+
+
+def texts(page: dict) -> list[str]:
+    return [entry["parts"][0]["text"] for entry in page["history"]]
+
+
+async def test_history_is_paginated(client):
+    await chat(client, "alice", "one")
+    await chat(client, "alice", "two")
+
+    first = (await client.get("/chat/alice", params={"limit": 3})).json()
+    rest = (await client.get("/chat/alice", params={"cursor": first["cursor"]})).json()
+
+    assert first["cursor"] == 3
+    assert first["length"] == rest["length"] == 4
+    assert len(rest["history"]) == 1
+    assert rest["cursor"] == 4
+
+
+async def test_unchanged_history_is_not_modified(client):
+    await chat(client, "alice", "one")
+    first = await client.get("/chat/alice")
+
+    again = await client.get(
+        "/chat/alice", headers={"If-None-Match": first.headers["ETag"]}
+    )
+    assert again.status_code == 304
+
+    await chat(client, "alice", "two")
+    changed = await client.get(
+        "/chat/alice", headers={"If-None-Match": first.headers["ETag"]}
+    )
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != first.headers["ETag"]
+
+
+async def test_missing_conversation_has_a_constant_etag(client):
+    first = await client.get("/chat/nobody")
+    second = await client.get("/chat/nobody")
+
+    assert first.headers["ETag"] == second.headers["ETag"]
+    again = await client.get(
+        "/chat/nobody", headers={"If-None-Match": first.headers["ETag"]}
+    )
+    assert again.status_code == 304
+
+
+async def test_since_returns_the_entries_created_after_it(client):
+    await chat(client, "alice", "one")
+    page = (await client.get("/chat/alice")).json()
+    since = page["history"][-1]["created"]
+    await chat(client, "alice", "two")
+
+    newer = (await client.get("/chat/alice", params={"since": since})).json()
+
+    assert texts(newer)[0] == "two"
+    assert len(newer["history"]) == 2
+
+
+async def test_naive_since_is_utc(client):
+    await chat(client, "alice", "one")
+    now = datetime.datetime.now(datetime.UTC)
+    await chat(client, "alice", "two")
+
+    naive = now.replace(tzinfo=None).isoformat()
+    response = await client.get("/chat/alice", params={"since": naive})
+
+    assert response.status_code == 200
+    assert texts(response.json())[0] == "two"
+
+
+def test_untimestamped_entries_follow_the_conversation_update():
+    updated = datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+    conversation = Conversation(
+        history=[HistoryEntry(role=Role.USER, parts=[Message(text="old")])],
+        updated=updated,
+    )
+
+    assert since_index(conversation, updated - datetime.timedelta(seconds=1)) == 0
+    assert since_index(conversation, updated) == 1
+
+
+def test_entries_are_timestamped():
+    conversation = generate_empty_conv()
+    conversation.add_message([Message(text="hello")], role=Role.USER)
+
+    assert conversation.history[0].created == conversation.updated
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import FakeChatBot
+from src.backend.jobs import JobQueue, SummaryJobQueue
+from src.backend.sqlite_db import SQLiteDB
+from src.schemas import Message, Role, SummaryStatus, generate_empty_conv
+
+pytestmark = pytest.mark.anyio
+
+
+class CountingChatBot(FakeChatBot):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.summaries = 0
+
+    async def add_summary(self, conversation):
+        self.summaries += 1
+        return await super().add_summary(conversation)
+
+
+@pytest.fixture
+async def workers(tmp_path):
+    """Two summary queues over the same database, like two worker processes."""
+    path = str(tmp_path / "shared.db")
+    model = CountingChatBot(latency=0.05)
+    queues = [
+        SummaryJobQueue(db=SQLiteDB(path=path), model=model, retry_delay=0.0)
+        for _ in range(2)
+    ]
+    for queue in queues:
+        await queue.start()
+    yield queues, model
+    for queue in queues:
+        await queue.stop()
+        await queue.db.close()
+
+
+async def pending_conversation(db, user_id: str, status=SummaryStatus.PENDING):
+    async with db.session(user_id=user_id) as session:
+        session.add_message(Message(text="hello"), role=Role.USER)
+        session.add_message(Message(text="bye DONE"), role=Role.MODEL)
+        session.conversation.summary_status = status
+
+
+async def test_summary_resumed_by_all_workers_is_generated_once(workers):
+    queues, model = workers
+    await pending_conversation(queues[0].db, "alice")
+
+    assert [await queue.resume() for queue in queues] == [1, 1]
+    await asyncio.gather(*(queue.queue.join() for queue in queues))
+
+    assert model.summaries == 1
+    conversation = await queues[0].db.fetch_conversation("alice")
+    assert conversation.summary_status == SummaryStatus.DONE
+    assert conversation.summary == "bye DONE"
+
+
+async def test_claim_of_another_worker_is_skipped(workers):
+    queues, model = workers
+    await pending_conversation(queues[0].db, "alice", status=SummaryStatus.RUNNING)
+
+    queues[0].submit("alice")
+    await queues[0].queue.join()
+
+    assert model.summaries == 0
+    conversation = await queues[0].db.fetch_conversation("alice")
+    assert conversation.summary_status == SummaryStatus.RUNNING
+
+
+async def test_stale_claim_is_taken_over(workers):
+    queues, model = workers
+    queues[0].claim_timeout = 0.0
+    await pending_conversation(queues[0].db, "alice", status=SummaryStatus.RUNNING)
+    await asyncio.sleep(0.01)
+
+    assert await queues[0].resume() == 1
+    await queues[0].queue.join()
+
+    assert model.summaries == 1
+    conversation = await queues[0].db.fetch_conversation("alice")
+    assert conversation.summary_status == SummaryStatus.DONE
+
+
+async def test_failed_summary_is_marked_failed(workers):
+    queues, model = workers
+    queues[0].max_retries = 1
+
+    async def broken(conversation):
+        raise RuntimeError("model unavailable")
+
+    model.add_summary = broken
+    await pending_conversation(queues[0].db, "alice")
+
+    queues[0].submit("alice")
+    await queues[0].queue.join()
+
+    conversation = await queues[0].db.fetch_conversation("alice")
+    assert conversation.summary_status == SummaryStatus.FAILED
+    assert queues[0].claimed == set()
+
+
+async def test_job_is_queued_once_and_retried():
+    attempts = []
+
+    class FlakyQueue(JobQueue):
+        async def run(self, key):
+            attempts.append(key)
+            if len(attempts) < 2:
+                raise RuntimeError("flaky")
+
+    queue = FlakyQueue(workers=1, retry_delay=0.0)
+    assert queue.submit("alice")
+    assert not queue.submit("alice")
+
+    await queue.start()
+    await queue.queue.join()
+    await queue.stop()
+
+    assert attempts == ["alice", "alice"]
+
+
+def test_start_summary_marks_the_conversation_running():
+    conversation = generate_empty_conv()
+    before = conversation.updated
+    conversation.start_summary()
+
+    assert conversation.summary_status == SummaryStatus.RUNNING
+    assert conversation.updated >= before
@@ -0,0 +1,49 @@
+import math
+
+import pytest
+
+from benchmarks.loadtest import build_parser, compare, drive, percentile
+
+pytestmark = pytest.mark.anyio
+
+
+def test_percentile_is_the_nearest_rank():
+    values = [float(value) for value in range(1, 101)]
+
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([3.0], 95) == 3.0
+    assert math.isnan(percentile([], 50))
+
+
+def result(p95: float, turns_per_second: float) -> dict:
+    stats = {"p50_ms": 10.0, "p95_ms": p95, "p99_ms": 30.0}
+    return {
+        "version": "0.0.0",
+        "commit": "abc",
+        "routes": {"POST /chat/{user_id}": stats},
+        "turns_per_second": turns_per_second,
+    }
+
+
+def test_regressions_beyond_the_tolerance_are_reported():
+    baseline = result(p95=20.0, turns_per_second=10.0)
+
+    assert compare(result(21.0, 9.5), baseline, tolerance=0.1) == []
+    regressions = compare(result(30.0, 8.0), baseline, tolerance=0.1)
+    assert regressions == ["POST /chat/{user_id} p95_ms +50.0%", "turns/s -20.0%"]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+async def test_simulated_users_drive_the_app(client, stream):
+    options = ["--users", "3", "--turns", "2", "--polls", "2"]
+    args = build_parser().parse_args(
+        options + ["--summary-timeout", "0"] + (["--stream"] if stream else [])
+    )
+
+    summary = await drive(client, args)
+
+    assert summary["errors"] == 0
+    turn_route = "POST /chat/{user_id}/stream" if stream else "POST /chat/{user_id}"
+    assert summary["routes"][turn_route]["count"] == 6
+    assert summary["routes"]["GET /chat/{user_id}"]["count"] == 12
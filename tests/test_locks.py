@@ -0,0 +1,75 @@
+import asyncio
+
+import anyio
+import pytest
+
+from src.backend.config import settings
+from src.backend.locks import ConversationBusyError, StripedLock
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_turns_of_a_user_run_one_at_a_time():
+    locks = StripedLock(stripes=4)
+    running = 0
+    overlap = 0
+
+    async def turn():
+        nonlocal running, overlap
+        async with locks.lock(user_id="alice"):
+            running += 1
+            overlap = max(overlap, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(*(turn() for _ in range(5)))
+
+    assert overlap == 1
+
+
+async def test_held_lock_fails_fast_with_zero_timeout():
+    locks = StripedLock()
+
+    async with locks.lock(user_id="alice"):
+        with pytest.raises(ConversationBusyError):
+            async with locks.lock(user_id="alice", timeout=0):
+                pass
+
+    async with locks.lock(user_id="alice", timeout=0):
+        pass
+
+
+async def test_held_lock_times_out():
+    locks = StripedLock()
+
+    async with locks.lock(user_id="alice"):
+        with pytest.raises(ConversationBusyError):
+            async with locks.lock(user_id="alice", timeout=0.01):
+                pass
+
+
+def test_users_map_onto_a_bounded_set_of_stripes():
+    locks = StripedLock(stripes=8)
+
+    stripes = {id(locks.stripe(f"user-{i}")) for i in range(100)}
+
+    assert len(stripes) <= 8
+    assert locks.stripe("alice") is locks.stripe("alice")
+
+
+async def test_concurrent_turn_is_a_conflict(app, client, model, monkeypatch):
+    monkeypatch.setattr(settings, "chat_lock_timeout", 0.0)
+    model.latency = 0.2
+    responses = []
+
+    async def post():
+        responses.append(await client.post("/chat/alice", json={"text": "hello"}))
+
+    async with anyio.create_task_group() as tasks:
+        tasks.start_soon(post)
+        await anyio.sleep(0.05)
+        tasks.start_soon(post)
+
+    assert sorted(response.status_code for response in responses) == [201, 409]
+    conversation = await app.state.db.fetch_conversation(user_id="alice")
+    assert len(conversation.history) == 2
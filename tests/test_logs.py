@@ -0,0 +1,102 @@
+import io
+import json
+import logging
+
+import pytest
+
+from src.backend.config import settings
+from src.config import LogFormat, LogLevel
+from src.logs import log_pipeline
+from src.tracing import tracer
+
+pytestmark = pytest.mark.anyio
+
+CHAT_ROUTE = "POST /chat/{user_id}"
+
+
+@pytest.fixture
+def records():
+    """Configures the log pipeline with DEBUG records written to a buffer and
+    returns a reader of the records."""
+    stream = io.StringIO()
+
+    def configure(**kwargs) -> None:
+        log_pipeline.configure(level=LogLevel.DEBUG, stream=stream, **kwargs)
+
+    def read() -> list[dict]:
+        log_pipeline.shutdown()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    read.configure = configure
+    configure()
+    yield read
+    log_pipeline.configure(
+        level=settings.log_level,
+        format=settings.log_format,
+        sample_rate=settings.log_sample_rate,
+        route_sample_rates=settings.log_route_sample_rates,
+        queue_size=settings.log_queue_size,
+    )
+
+
+def test_records_are_json_lines_with_the_current_span(records):
+    with tracer.span("work") as span:
+        logging.info("Hello %s", "world")
+    try:
+        raise ValueError("broken")
+    except ValueError:
+        logging.exception("Failed")
+
+    hello, failed = records()
+    assert hello["severity"] == "INFO"
+    assert hello["message"] == "Hello world"
+    assert hello["trace_id"] == span.trace_id
+    assert hello["span_id"] == span.span_id
+    assert "ValueError: broken" in failed["exception"]
+
+
+def test_text_format(records):
+    stream = io.StringIO()
+    log_pipeline.configure(format=LogFormat.TEXT, stream=stream)
+    logging.info("plain")
+    log_pipeline.shutdown()
+
+    assert stream.getvalue().rstrip().endswith("- INFO - plain")
+
+
+async def test_records_carry_the_route_template(client, records):
+    await client.post("/chat/alice", json={"text": "hello"})
+
+    logged = [record for record in records() if record["logger"] == "root"]
+    assert logged
+    assert {record.get("route") for record in logged} == {CHAT_ROUTE}
+
+
+async def test_requests_are_sampled_per_route(client, records):
+    records.configure(route_sample_rates={CHAT_ROUTE: 0.0})
+    await client.post("/chat/alice", json={"text": "hello"})
+
+    severities = {
+        record["severity"] for record in records() if record.get("route") == CHAT_ROUTE
+    }
+    assert not severities & {"DEBUG", "INFO"}
+
+
+async def test_unsampled_requests_keep_their_warnings(
+    app, client, records, monkeypatch
+):
+    records.configure(sample_rate=0.0)
+
+    async def unavailable(*args, **kwargs):
+        logging.warning("Model unavailable")
+        raise RuntimeError("Model unavailable")
+
+    monkeypatch.setattr(app.state.model, "generate_turn", unavailable)
+    monkeypatch.setattr(app.state.model, "generate_response", unavailable)
+    await client.post("/chat/alice", json={"text": "hello"})
+
+    severities = {
+        record["severity"] for record in records() if record.get("route") == CHAT_ROUTE
+    }
+    assert "WARNING" in severities
+    assert not severities & {"DEBUG", "INFO"}
@@ -0,0 +1,117 @@
+import types
+
+import pytest
+
+from src.asgi import route_key, route_template
+from src.backend.metrics import (
+    HTTP_REQUEST_DURATION,
+    Counter,
+    Gauge,
+    Histogram,
+    Registry,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def test_counter_and_gauge_render():
+    registry = Registry()
+    counter = Counter("jobs", "Jobs run.", ("kind",), registry=registry)
+    gauge = Gauge("queue_depth", "Queued jobs.", registry=registry)
+    counter.inc("summary", amount=2)
+    gauge.labels().set(3)
+
+    assert registry.render() == (
+        "# HELP jobs Jobs run.\n"
+        "# TYPE jobs counter\n"
+        'jobs_total{kind="summary"} 2.0\n'
+        "# HELP queue_depth Queued jobs.\n"
+        "# TYPE queue_depth gauge\n"
+        "queue_depth 3\n"
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(
+        "latency", "Latency.", buckets=(0.1, 1.0), registry=Registry()
+    )
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value=value)
+
+    samples = list(histogram.samples())
+
+    assert [value for _, _, value in samples] == [1, 2, 3, 5.55, 3]
+    assert samples[2][1] == '{le="+Inf"}'
+
+
+def test_label_values_are_escaped():
+    counter = Counter("errors", "Errors.", ("reason",), registry=Registry())
+    counter.inc('say "hi"\n')
+
+    assert 'reason="say \\"hi\\"\\n"' in counter.render()
+
+
+def test_wrong_label_count_is_rejected():
+    counter = Counter("calls", "Calls.", ("method",), registry=Registry())
+
+    with pytest.raises(ValueError):
+        counter.inc()
+
+
+async def test_requests_are_labelled_with_the_route_template(client):
+    for user_id in ("alice", "bob"):
+        await client.post(f"/chat/{user_id}", json={"text": "hello"})
+
+    labels = set(HTTP_REQUEST_DURATION.children)
+
+    assert ("POST", "/chat/{user_id}", "201") in labels
+    assert not any("alice" in path or "bob" in path for _, path, _ in labels)
+
+
+async def test_metrics_are_exposed(client):
+    await client.get("/chat/alice")
+
+    response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'path="/chat/{user_id}"' in response.text
+
+
+class FakeApp:
+    """App with the routes of the handlers, like `Litestar.routes`."""
+
+    def __init__(self, *routes: tuple[str, list]):
+        self.routes = [
+            types.SimpleNamespace(path_format=path, route_handlers=handlers)
+            for path, handlers in routes
+        ]
+
+
+def test_route_template_of_the_scope_is_used():
+    scope = {"path_template": "/chat/{user_id}", "path": "/chat/alice"}
+
+    assert route_template(scope) == "/chat/{user_id}"
+
+
+def test_route_template_is_looked_up_from_the_handler():
+    handler, other = object(), object()
+    app = FakeApp(("/chat/{user_id}", [handler]), ("/metrics", [other]))
+    scope = {"app": app, "route_handler": handler, "path": "/chat/alice"}
+
+    assert route_template(scope) == "/chat/{user_id}"
+
+
+def test_route_template_of_a_handler_with_several_paths():
+    handler = object()
+    app = FakeApp(("/chat/{user_id}", [handler]), ("/chat/{user_id}/x", [handler]))
+    scope = {"app": app, "route_handler": handler, "path": "/chat/alice/x"}
+
+    assert route_template(scope) == "/chat/{user_id}/x"
+
+
+def test_unrouted_request_is_unmatched():
+    scope = {"app": FakeApp(), "method": "GET", "path": "/nope"}
+
+    assert route_template(scope) is None
+    assert route_key(scope) == "GET unmatched"
@@ -0,0 +1,89 @@
+import types
+
+import pytest
+
+from src.backend.context import ContextWindow
+from src.backend.metrics import MODEL_DURATION, MODEL_TOKENS
+from src.backend.model import ChatBot, Turn
+from src.schemas import Message, Role, generate_empty_conv
+
+pytestmark = pytest.mark.anyio
+
+
+class StubRouter:
+    """Router answering every call with a fixed text and token usage."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.calls = []
+
+    async def generate(self, contents, **kwargs):
+        self.calls.append(kwargs)
+        return types.SimpleNamespace(
+            text=self.text,
+            usage_metadata=types.SimpleNamespace(
+                prompt_token_count=10, candidates_token_count=5
+            ),
+        )
+
+
+def chat_bot(text: str, structured_output: bool = False) -> ChatBot:
+    """A ChatBot calling a stub router instead of Vertex AI."""
+    bot = object.__new__(ChatBot)
+    bot.router = StubRouter(text)
+    bot.context_window = ContextWindow()
+    bot.structured_output = structured_output
+    return bot
+
+
+def conversation():
+    conversation = generate_empty_conv()
+    conversation.add_message([Message(text="hello")], role=Role.USER)
+    return conversation
+
+
+def calls(method: str) -> int:
+    return sum(MODEL_DURATION.labels(method).counts)
+
+
+def tokens(method: str) -> float:
+    return MODEL_TOKENS.labels(method, "prompt").value
+
+
+async def test_turn_is_counted_once():
+    bot = chat_bot("Tell me more. DONE")
+    before = {
+        method: (calls(method), tokens(method))
+        for method in ("generate_turn", "generate_response")
+    }
+
+    turn = await bot.generate_turn(conversation())
+
+    assert turn == Turn(reply="Tell me more. DONE", done=True)
+    assert len(bot.router.calls) == 1
+    assert calls("generate_turn") == before["generate_turn"][0] + 1
+    assert tokens("generate_turn") == before["generate_turn"][1] + 10
+    assert (calls("generate_response"), tokens("generate_response")) == before[
+        "generate_response"
+    ]
+
+
+async def test_structured_turn_is_parsed():
+    bot = chat_bot(
+        '{"reply": "Bye", "done": true, "summary": "S", "summary_english": "S"}',
+        structured_output=True,
+    )
+
+    turn = await bot.generate_turn(conversation())
+
+    assert turn == Turn(reply="Bye", done=True, summary="S", summary_english="S")
+
+
+async def test_response_is_a_message():
+    bot = chat_bot("Hi there")
+
+    assert await bot.generate_response(conversation()) == Message(text="Hi there")
+
+
+def test_invalid_structured_turn_is_the_reply():
+    assert ChatBot.parse_turn("not json DONE") == Turn(reply="not json DONE", done=True)
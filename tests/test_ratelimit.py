@@ -0,0 +1,112 @@
+import pytest
+
+from src.backend.config import settings
+from src.backend.ratelimit import (
+    MemoryCounterStore,
+    RateLimitExceededError,
+    RequestRateLimiter,
+    SQLiteCounterStore,
+    sliding_window_delay,
+)
+
+pytestmark = pytest.mark.anyio
+
+ROUTES = ["POST /chat/{user_id}"]
+
+
+def test_request_within_the_sliding_window_has_no_delay():
+    # Half of the previous window overlaps the sliding window
+    assert sliding_window_delay(10, 60.0, 30.0, current=5, previous=10) == 0.0
+
+
+def test_request_waits_for_the_previous_window_to_decay():
+    delay = sliding_window_delay(10, 60.0, 30.0, current=6, previous=10)
+
+    # At 36s, 4 of the previous requests still count: 4 + 5 + 1 = 10
+    assert delay == pytest.approx(6.0)
+    assert sliding_window_delay(10, 60.0, 30.0 + delay, 6, 10) == 0.0
+
+
+def test_full_window_waits_for_the_next_one():
+    delay = sliding_window_delay(2, 60.0, 10.0, current=3, previous=0)
+
+    assert delay == pytest.approx(80.0)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+async def store(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryCounterStore()
+        return
+    store = SQLiteCounterStore(path=str(tmp_path / "rate_limits.db"))
+    yield store
+    await store.close()
+
+
+async def test_store_counts_per_key_and_window(store):
+    assert await store.increment("alice", 1, 60.0) == (1, 0)
+    assert await store.increment("alice", 1, 60.0) == (2, 0)
+    assert await store.increment("bob", 1, 60.0) == (1, 0)
+    assert await store.increment("alice", 2, 60.0) == (1, 2)
+
+    await store.decrement("alice", 2)
+    assert await store.increment("alice", 2, 60.0) == (1, 2)
+
+
+async def test_requests_over_the_user_limit_are_rejected(store):
+    limiter = RequestRateLimiter(store, ROUTES, user_limit=3, window=3600.0)
+    for _ in range(3):
+        await limiter.check("alice")
+
+    with pytest.raises(RateLimitExceededError) as error:
+        await limiter.check("alice")
+
+    assert error.value.scope == "user"
+    assert error.value.retry_after > 0
+    await limiter.check("bob")
+
+
+async def test_rejected_requests_are_not_counted():
+    limiter = RequestRateLimiter(
+        MemoryCounterStore(), ROUTES, user_limit=1, global_limit=2, window=3600.0
+    )
+    await limiter.check("alice")
+    for _ in range(3):
+        with pytest.raises(RateLimitExceededError):
+            await limiter.check("alice")
+
+    await limiter.check("bob")
+    with pytest.raises(RateLimitExceededError) as error:
+        await limiter.check("carol")
+    assert error.value.scope == "global"
+
+
+async def test_failing_store_lets_requests_through():
+    class FailingStore(MemoryCounterStore):
+        async def increment(self, key, index, window):
+            raise ConnectionError("unreachable")
+
+    limiter = RequestRateLimiter(FailingStore(), ROUTES, user_limit=1)
+
+    for _ in range(3):
+        await limiter.check("alice")
+
+
+@pytest.fixture
+def two_turns_per_user(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_user", 2)
+    monkeypatch.setattr(settings, "rate_limit_window", 3600.0)
+
+
+async def test_turns_over_the_user_limit_get_429(two_turns_per_user, client):
+    for _ in range(2):
+        response = await client.post("/chat/alice", json={"text": "hi"})
+        assert response.status_code == 201
+
+    response = await client.post("/chat/alice", json={"text": "hi"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+    # Other users and routes are not limited
+    assert (await client.post("/chat/bob", json={"text": "hi"})).status_code == 201
+    assert (await client.get("/chat/alice")).status_code == 200
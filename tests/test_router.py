@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+from google.api_core.exceptions import InvalidArgument, ServiceUnavailable
+
+from src.backend.config import RoutingStrategy
+from src.backend.router import ModelRouter
+from src.backend.scheduler import ModelQueueTimeoutError, ModelScheduler, Priority
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeModel:
+    """Model answering with its name after a delay, or failing."""
+
+    def __init__(self, name: str, latency: float = 0.0, errors: list | None = None):
+        self.name = name
+        self.latency = latency
+        self.errors = list(errors or [])
+        self.calls = 0
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.name
+
+
+def router(*models: FakeModel, **kwargs) -> ModelRouter:
+    kwargs.setdefault("strategy", RoutingStrategy.ORDERED)
+    kwargs.setdefault("retry_delay", 0.0)
+    router = ModelRouter(**kwargs)
+    for model in models:
+        router.add_endpoint(model.name, model)
+    return router
+
+
+async def test_retryable_failure_falls_back_to_the_next_endpoint():
+    primary = FakeModel("primary", errors=[ServiceUnavailable("down")])
+    fallback = FakeModel("fallback")
+    models = router(primary, fallback, max_retries=1)
+
+    assert await models.generate(["hello"]) == "fallback"
+    assert models.endpoints[0].error_rate > 0
+    assert models.endpoints[1].error_rate == 0
+
+
+async def test_other_failures_are_recorded_but_not_retried():
+    primary = FakeModel("primary", errors=[InvalidArgument("bad request")])
+    fallback = FakeModel("fallback")
+    models = router(primary, fallback, max_retries=1)
+
+    with pytest.raises(InvalidArgument):
+        await models.generate(["hello"])
+
+    assert fallback.calls == 0
+    assert models.endpoints[0].error_rate > 0
+
+
+async def test_failing_endpoint_is_ranked_last():
+    primary = FakeModel("primary", errors=[InvalidArgument("bad request")] * 3)
+    fallback = FakeModel("fallback")
+    models = router(primary, fallback, error_threshold=0.4)
+
+    for _ in range(3):
+        with pytest.raises(InvalidArgument):
+            await models.generate(["hello"])
+
+    assert [endpoint.name for endpoint in models.ranked()] == ["fallback", "primary"]
+
+
+async def test_slow_attempt_times_out_and_is_retried():
+    primary = FakeModel("primary", latency=1.0)
+    fallback = FakeModel("fallback")
+    models = router(primary, fallback, attempt_timeout=0.05, max_retries=1)
+
+    assert await models.generate(["hello"]) == "fallback"
+
+
+async def test_wait_for_the_quota_is_bounded_by_the_deadline():
+    scheduler = ModelScheduler(rpm=60, queue_timeout=30.0)
+    scheduler.limiter("primary").requests.take(60)
+    models = router(FakeModel("primary"), scheduler=scheduler, deadline=0.05)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    with pytest.raises(ModelQueueTimeoutError):
+        await models.generate(["hello"], priority=Priority.BACKGROUND)
+    assert loop.time() - start < 1.0
+
+
+async def test_slow_endpoint_is_hedged():
+    primary = FakeModel("primary", latency=1.0)
+    fallback = FakeModel("fallback")
+    models = router(primary, fallback, hedge_percentile=50, hedge_min_samples=1)
+    models.endpoints[0].observe(0.01, stream=False, ok=True)
+
+    assert await models.generate(["hello"]) == "fallback"
+    assert primary.calls == fallback.calls == 1
@@ -0,0 +1,85 @@
+import asyncio
+import types
+
+import pytest
+
+from src.backend.scheduler import (
+    ModelQueueTimeoutError,
+    ModelScheduler,
+    Priority,
+    RateLimiter,
+    TokenBucket,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def test_bucket_refills_at_its_rate():
+    bucket = TokenBucket(per_minute=60)
+    bucket.take(60)
+
+    assert bucket.delay(1, now=bucket.updated) == pytest.approx(1.0)
+    # Amounts over the capacity only wait for a full bucket
+    assert bucket.delay(1000, now=bucket.updated) == pytest.approx(60.0)
+    assert bucket.delay(1, now=bucket.updated + 1) == 0.0
+
+
+async def test_unlimited_model_is_not_queued():
+    limiter = RateLimiter("model")
+
+    assert await limiter.acquire(Priority.INTERACTIVE, tokens=10**6) == 0.0
+
+
+async def test_interactive_calls_are_served_before_background_ones():
+    limiter = RateLimiter("model", rpm=6000)
+    limiter.requests.take(limiter.requests.tokens)
+    order = []
+
+    async def call(name: str, priority: Priority):
+        await limiter.acquire(priority, tokens=1)
+        order.append(name)
+
+    background = asyncio.create_task(call("background", Priority.BACKGROUND))
+    await asyncio.sleep(0)
+    interactive = asyncio.create_task(call("interactive", Priority.INTERACTIVE))
+    await asyncio.gather(background, interactive)
+
+    assert order == ["interactive", "background"]
+
+
+async def test_call_over_its_timeout_is_rejected():
+    limiter = RateLimiter("model", tpm=60)
+    limiter.tokens.take(limiter.tokens.tokens)
+
+    with pytest.raises(ModelQueueTimeoutError) as error:
+        await limiter.acquire(Priority.INTERACTIVE, tokens=30, timeout=0.01)
+
+    assert error.value.retry_after > 0
+    assert all(waiter.future.done() for waiter in limiter.waiters)
+
+
+async def test_settle_corrects_the_token_estimate():
+    scheduler = ModelScheduler(tpm=1000)
+    limiter = scheduler.limiter("model")
+    await scheduler.acquire("model", Priority.INTERACTIVE, tokens=100)
+    usage = types.SimpleNamespace(prompt_token_count=300, candidates_token_count=100)
+
+    scheduler.settle("model", 100, types.SimpleNamespace(usage_metadata=usage))
+
+    assert limiter.tokens.tokens == pytest.approx(600, abs=1)
+
+
+def test_limits_are_per_model_id():
+    scheduler = ModelScheduler(rpm=10, limits={"flash": (100, 0)})
+
+    assert scheduler.limiter("flash@europe-west4").requests.capacity == 100
+    assert scheduler.limiter("flash@europe-west4") is not scheduler.limiter("flash")
+    assert scheduler.limiter("pro").requests.capacity == 10
+    assert scheduler.limiter("pro").tokens is None
+
+
+def test_estimate_counts_contents_and_output():
+    scheduler = ModelScheduler(output_tokens=10)
+    contents = ["a" * 40, {"role": "user", "parts": [{"text": "b" * 80}]}]
+
+    assert scheduler.estimate(contents) == 10 + 11 + 21
@@ -0,0 +1,98 @@
+import pathlib
+
+import pytest
+
+from src.backend import server
+from src.backend.config import ServerEngine
+
+
+@pytest.fixture
+def cgroup(tmp_path, monkeypatch) -> pathlib.Path:
+    """A cgroup v2 hierarchy with the process in `/system.slice/app.scope`."""
+    monkeypatch.setattr(server, "CGROUP_ROOT", tmp_path)
+    read = server._read
+
+    def fake_read(path: pathlib.Path) -> str | None:
+        if path == pathlib.Path("/proc/self/cgroup"):
+            return "0::/system.slice/app.scope"
+        return read(path)
+
+    monkeypatch.setattr(server, "_read", fake_read)
+    directory = tmp_path / "system.slice" / "app.scope"
+    directory.mkdir(parents=True)
+    return directory
+
+
+def test_unlimited_cgroup_has_no_quota(cgroup):
+    (cgroup / "cpu.max").write_text("max 100000\n")
+
+    assert server.cgroup_cpu_quota() is None
+
+
+def test_quota_of_the_cgroup(cgroup):
+    (cgroup / "cpu.max").write_text("150000 100000\n")
+
+    assert server.cgroup_cpu_quota() == 1.5
+
+
+def test_lowest_quota_of_the_parent_cgroups(cgroup):
+    (cgroup / "cpu.max").write_text("max 100000\n")
+    (cgroup.parent / "cpu.max").write_text("50000 100000\n")
+
+    assert server.cgroup_cpu_quota() == 0.5
+
+
+def test_cgroup_v1_quota(cgroup):
+    v1 = cgroup.parents[1] / "cpu,cpuacct"
+    v1.mkdir()
+    (v1 / "cpu.cfs_quota_us").write_text("200000\n")
+    (v1 / "cpu.cfs_period_us").write_text("100000\n")
+
+    assert server.cgroup_cpu_quota() == 2.0
+
+
+def test_cgroup_v1_unlimited_quota(cgroup):
+    v1 = cgroup.parents[1] / "cpu"
+    v1.mkdir()
+    (v1 / "cpu.cfs_quota_us").write_text("-1\n")
+    (v1 / "cpu.cfs_period_us").write_text("100000\n")
+
+    assert server.cgroup_cpu_quota() is None
+
+
+@pytest.mark.parametrize("quota, workers", [(None, 8), (2.5, 2), (0.5, 1)])
+def test_one_worker_per_available_cpu(monkeypatch, quota, workers):
+    monkeypatch.setattr(server.os, "sched_getaffinity", lambda pid: set(range(8)))
+    monkeypatch.setattr(server, "cgroup_cpu_quota", lambda: quota)
+
+    assert server.default_workers() == workers
+
+
+@pytest.fixture
+def runs(monkeypatch) -> list[dict]:
+    runs = []
+    monkeypatch.setitem(
+        server.RUNNERS, ServerEngine.UVICORN, lambda **kwargs: runs.append(kwargs)
+    )
+    monkeypatch.setattr(server, "available_cpus", lambda: 2.0)
+    return runs
+
+
+def test_serve_defaults_to_the_available_cpus(runs):
+    server.serve(ServerEngine.UVICORN, host="0.0.0.0", port=8080)
+
+    assert runs[0]["workers"] == 2
+
+
+def test_serve_reloads_with_one_worker(runs):
+    server.serve(
+        ServerEngine.UVICORN, host="0.0.0.0", port=8080, workers=4, reload=True
+    )
+
+    assert runs[0]["workers"] == 1
+
+
+def test_serve_keeps_an_explicit_worker_count(runs):
+    server.serve(ServerEngine.UVICORN, host="0.0.0.0", port=8080, workers=4)
+
+    assert runs[0]["workers"] == 4
@@ -0,0 +1,102 @@
+import pytest
+
+from src.backend.session import ConversationSession
+from src.schemas import Message, Role, generate_empty_conv
+
+pytestmark = pytest.mark.anyio
+
+
+class RecordingStore:
+    """Store keeping one conversation in memory and recording the calls."""
+
+    def __init__(self):
+        self.conversation = generate_empty_conv()
+        self.version = None
+        self.loads = 0
+        self.saves: list[tuple[int, int | None]] = []
+
+    async def load_conversation(self, user_id: str, full: bool = True):
+        self.loads += 1
+        return (
+            self.conversation.model_copy(deep=True),
+            len(self.conversation.history),
+            self.version,
+        )
+
+    async def save_conversation(self, user_id, conversation, persisted, version):
+        self.saves.append((persisted, version))
+        self.conversation = conversation.model_copy(deep=True)
+        self.version = (version or 0) + 1
+        return self.version
+
+
+async def test_session_loads_once_and_commits_once():
+    store = RecordingStore()
+    async with ConversationSession(db=store, user_id="alice") as session:
+        session.add_message(Message(text="hello"), role=Role.USER)
+        session.add_message(Message(text="hi"), role=Role.MODEL)
+
+    assert store.loads == 1
+    assert store.saves == [(0, None)]
+    assert [entry.parts[0].text for entry in store.conversation.history] == [
+        "hello",
+        "hi",
+    ]
+
+
+async def test_session_commits_only_new_entries():
+    store = RecordingStore()
+    async with ConversationSession(db=store, user_id="alice") as session:
+        session.add_message(Message(text="hello"), role=Role.USER)
+    async with ConversationSession(db=store, user_id="alice") as session:
+        session.add_message(Message(text="hi"), role=Role.MODEL)
+
+    assert store.saves == [(0, None), (1, 1)]
+
+
+async def test_unchanged_session_is_not_committed():
+    store = RecordingStore()
+    async with ConversationSession(db=store, user_id="alice"):
+        pass
+
+    assert store.loads == 1
+    assert store.saves == []
+
+
+async def test_failed_session_is_not_committed():
+    store = RecordingStore()
+    with pytest.raises(RuntimeError):
+        async with ConversationSession(db=store, user_id="alice") as session:
+            session.add_message(Message(text="hello"), role=Role.USER)
+            raise RuntimeError("model call failed")
+
+    assert store.saves == []
+
+
+async def test_message_with_the_same_role_is_skipped():
+    store = RecordingStore()
+    async with ConversationSession(db=store, user_id="alice") as session:
+        assert session.add_message(Message(text="hello"), role=Role.USER)
+        assert not session.add_message(Message(text="again"), role=Role.USER)
+
+    assert len(store.conversation.history) == 1
+
+
+async def test_chat_turn_loads_and_commits_once(app, client, monkeypatch):
+    calls = []
+    for method in ("load_conversation", "save_conversation", "fetch_version"):
+        original = getattr(app.state.db, method)
+
+        async def recorded(*args, method=method, original=original, **kwargs):
+            calls.append(method)
+            return await original(*args, **kwargs)
+
+        monkeypatch.setattr(app.state.db, method, recorded)
+
+    response = await client.post("/chat/alice", json={"text": "hello"})
+
+    assert response.status_code == 201
+    assert response.json()["text"]
+    assert calls == ["load_conversation", "save_conversation"]
+    conversation = await app.state.db.fetch_conversation(user_id="alice")
+    assert [entry.role for entry in conversation.history] == [Role.USER, Role.MODEL]
@@ -0,0 +1,116 @@
+import sqlite3
+
+import pytest
+
+from src.backend.sqlite_db import SQLiteDB
+from src.backend.store import ConversationConflictError
+from src.schemas import Message, Role, SummaryStatus
+
+pytestmark = pytest.mark.anyio
+
+
+async def add_turn(db: SQLiteDB, user_id: str, text: str = "hello"):
+    async with db.session(user_id=user_id) as session:
+        session.add_message(Message(text=text), role=Role.USER)
+        session.add_message(Message(text=f"re: {text}"), role=Role.MODEL)
+
+
+async def test_conversation_roundtrip(db):
+    await add_turn(db, "alice", "hello")
+    await add_turn(db, "alice", "bye")
+
+    conversation, persisted, version = await db.load_conversation("alice")
+    assert [entry.parts[0].text for entry in conversation.history] == [
+        "hello",
+        "re: hello",
+        "bye",
+        "re: bye",
+    ]
+    assert persisted == 4
+    assert version == await db.fetch_version("alice")
+
+
+async def test_missing_conversation_is_empty(db):
+    conversation, persisted, version = await db.load_conversation("nobody")
+
+    assert conversation.history == []
+    assert persisted == 0
+    assert version is None
+
+
+async def test_read_errors_propagate(db, monkeypatch):
+    def broken(user_id):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(db, "_load", broken)
+
+    with pytest.raises(sqlite3.OperationalError):
+        await db.load_conversation("alice")
+
+
+async def test_stale_save_conflicts(db):
+    await add_turn(db, "alice")
+    conversation, persisted, version = await db.load_conversation("alice")
+    await add_turn(db, "alice", "again")
+
+    conversation.add_message([Message(text="late")], role=Role.USER)
+    with pytest.raises(ConversationConflictError):
+        await db.save_conversation("alice", conversation, persisted, version)
+
+
+async def test_reopened_database_keeps_conversations(tmp_path):
+    path = str(tmp_path / "reopened.db")
+    db = SQLiteDB(path=path)
+    await add_turn(db, "alice")
+    await db.close()
+
+    db = SQLiteDB(path=path)
+    try:
+        conversation = await db.fetch_conversation("alice")
+    finally:
+        await db.close()
+    assert len(conversation.history) == 2
+
+
+async def test_delete_conversation(db):
+    await add_turn(db, "alice")
+    await add_turn(db, "bob")
+
+    await db.delete_conversation("alice")
+
+    assert (await db.fetch_conversation("alice")).history == []
+    assert len((await db.fetch_conversation("bob")).history) == 2
+
+
+async def test_fetch_user_ids_by_summary_status(db):
+    await add_turn(db, "alice")
+    await add_turn(db, "bob")
+    conversation = await db.fetch_conversation("bob")
+    conversation.summary_status = SummaryStatus.PENDING
+    await db.update_conversation("bob", conversation)
+
+    assert await db.fetch_user_ids(SummaryStatus.PENDING) == ["bob"]
+
+
+async def test_clear_collection(db):
+    await add_turn(db, "alice")
+    await add_turn(db, "bob")
+
+    assert await db.clear_collection() == {"conversations": 2, "messages": 4}
+    assert await db.fetch_version("alice") is None
+
+
+async def test_session_over_a_recreated_conversation_conflicts(db):
+    await add_turn(db, "alice", "old")
+
+    with pytest.raises(ConversationConflictError):
+        async with db.session(user_id="alice") as session:
+            await db.delete_conversation("alice")
+            await add_turn(db, "alice", "new")
+            session.add_message(Message(text="late"), role=Role.USER)
+
+    conversation = await db.fetch_conversation("alice")
+    assert [entry.parts[0].text for entry in conversation.history] == [
+        "new",
+        "re: new",
+    ]
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import subprocess
+import sys
+import time
+
+import pytest
+
+from src.backend import app as app_module
+from src.backend.config import settings
+from src.backend.startup import StartupProfile, process_start_time
+
+pytestmark = pytest.mark.anyio
+
+
+def test_process_started_before_now():
+    assert process_start_time() <= time.time()
+
+
+def test_milestones_are_recorded_once():
+    profile = StartupProfile()
+    first = profile.mark("ready")
+    time.sleep(0.01)
+
+    assert profile.mark("ready") == first
+    assert profile.report()["milestones"] == {"ready": first}
+
+
+def test_phase_is_recorded_when_it_fails():
+    profile = StartupProfile()
+    with pytest.raises(RuntimeError):
+        with profile.phase("store"):
+            raise RuntimeError("unavailable")
+
+    assert profile.phases["store"] >= 0
+
+
+def test_app_import_defers_the_vertex_sdk():
+    code = "import sys, src.backend.app; print('vertexai' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+
+    assert result.stdout.strip() == "False"
+
+
+async def test_startup_report(client):
+    await client.get("/stats/cache")
+    response = await client.get("/stats/startup")
+
+    assert response.status_code == 200
+    report = response.json()
+    assert {"imported", "ready", "first_response"} <= set(report["milestones"])
+    assert "startup" in report["phases"]
+
+
+async def test_warm_up_primes_the_store_and_the_model(db, model, monkeypatch):
+    calls = []
+
+    async def fetch_version(user_id):
+        calls.append("store")
+
+    async def warmup():
+        calls.append("model")
+
+    monkeypatch.setattr(db, "fetch_version", fetch_version)
+    monkeypatch.setattr(model, "warmup", warmup)
+
+    await app_module.warm_up(db=db, model=model)
+
+    assert sorted(calls) == ["model", "store"]
+
+
+async def test_failed_warm_up_is_only_logged(db, model, monkeypatch, caplog):
+    async def warmup():
+        raise ConnectionError("unreachable")
+
+    monkeypatch.setattr(model, "warmup", warmup)
+
+    with caplog.at_level(logging.WARNING):
+        await app_module.warm_up(db=db, model=model)
+
+    assert "Warm-up of the model failed" in caplog.text
+
+
+async def test_warm_up_is_bounded(db, model, monkeypatch, caplog):
+    async def warmup():
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(model, "warmup", warmup)
+    monkeypatch.setattr(settings, "startup_warmup_timeout", 0.05)
+
+    with caplog.at_level(logging.WARNING):
+        await app_module.warm_up(db=db, model=model)
+
+    assert "did not finish" in caplog.text
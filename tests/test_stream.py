@@ -0,0 +1,62 @@
+import pytest
+
+from src.backend.config import settings
+from src.schemas import Role
+
+pytestmark = pytest.mark.anyio
+
+
+def parse_events(body: str) -> list[tuple[str, str]]:
+    """Splits a Server-Sent Events body into (event, data) pairs."""
+    events = []
+    for block in body.replace("\r\n", "\n").split("\n\n"):
+        event, data = "message", []
+        for line in block.split("\n"):
+            field, _, value = line.partition(":")
+            value = value.removeprefix(" ")
+            if field == "event":
+                event = value
+            elif field == "data":
+                data.append(value)
+        if data or event != "message":
+            events.append((event, "\n".join(data)))
+    return events
+
+
+async def test_stream_sends_chunks_then_done(app, client, model):
+    model.reply_tokens = 20
+
+    response = await client.post("/chat/alice/stream", json={"text": "hello"})
+
+    assert response.status_code == 201
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(response.text)
+    chunks = [data for event, data in events if event == "message"]
+    assert len(chunks) == len(model._chunks())
+    assert events[-1][0] == "done"
+
+    conversation = await app.state.db.fetch_conversation(user_id="alice")
+    assert [entry.role for entry in conversation.history] == [Role.USER, Role.MODEL]
+    assert conversation.history[-1].parts[0].text == "".join(model._chunks())
+
+
+async def test_failed_stream_sends_error_and_stores_nothing(app, client, model):
+    async def broken(conversation):
+        raise RuntimeError("model unavailable")
+        yield
+
+    model.stream_response = broken
+
+    response = await client.post("/chat/alice/stream", json={"text": "hello"})
+
+    assert parse_events(response.text) == [("error", "Internal Server Error")]
+    assert await app.state.db.fetch_version(user_id="alice") is None
+
+
+async def test_stream_during_a_turn_is_a_conflict(app, client, monkeypatch):
+    monkeypatch.setattr(settings, "chat_lock_timeout", 0.0)
+
+    async with app.state.locks.lock(user_id="alice"):
+        response = await client.post("/chat/alice/stream", json={"text": "hello"})
+
+    assert response.status_code == 409
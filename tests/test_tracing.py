@@ -0,0 +1,108 @@
+import io
+import json
+import threading
+
+import pytest
+
+from src.config import TraceExporter
+from src.tracing import JsonLinesExporter, parse_traceparent, tracer
+
+pytestmark = pytest.mark.anyio
+
+
+class BlockingStream(io.StringIO):
+    """Stream whose writes wait until they are released."""
+
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+        self.writer: str | None = None
+
+    def write(self, text: str) -> int:
+        self.writer = threading.current_thread().name
+        self.released.wait()
+        return super().write(text)
+
+
+@pytest.fixture
+def spans(tmp_path):
+    """Exports the spans to a file and returns the function reading them."""
+    path = tmp_path / "traces.jsonl"
+    tracer.configure(service_name="test", exporter=TraceExporter.FILE, path=str(path))
+
+    def read() -> list[dict]:
+        tracer.shutdown()
+        return [json.loads(line) for line in path.read_text().splitlines()]
+
+    yield read
+    tracer.shutdown()
+
+
+def test_export_does_not_wait_for_the_stream():
+    stream = BlockingStream()
+    exporter = JsonLinesExporter(stream)
+
+    exporter.export({"name": "span"})
+    stream.released.set()
+    exporter.shutdown()
+
+    assert json.loads(stream.getvalue()) == {"name": "span"}
+    assert stream.writer == "span-exporter"
+
+
+def test_spans_are_dropped_while_the_queue_is_full():
+    stream = BlockingStream()
+    exporter = JsonLinesExporter(stream, queue_size=1)
+
+    for i in range(5):
+        exporter.export({"name": f"span {i}"})
+    stream.released.set()
+    exporter.shutdown()
+
+    assert exporter.dropped >= 3
+    assert len(stream.getvalue().splitlines()) == 5 - exporter.dropped
+
+
+def test_shutdown_closes_the_file(tmp_path):
+    stream = open(tmp_path / "traces.jsonl", "w", encoding="utf-8")
+    exporter = JsonLinesExporter(stream, close=True)
+    exporter.export({"name": "span"})
+
+    exporter.shutdown()
+
+    assert stream.closed
+    assert (tmp_path / "traces.jsonl").read_text() == '{"name": "span"}\n'
+
+
+def test_traceparent_parsing():
+    trace_id, span_id = "a" * 32, "b" * 16
+
+    assert parse_traceparent(f"00-{trace_id}-{span_id}-01") == (trace_id, span_id, True)
+    assert parse_traceparent(f"00-{trace_id}-{span_id}-00")[2] is False
+    assert parse_traceparent(f"00-{'0' * 32}-{span_id}-01") is None
+    assert parse_traceparent("garbage") is None
+    assert parse_traceparent(None) is None
+
+
+def test_child_spans_join_the_trace(spans):
+    with tracer.span("parent") as parent, tracer.span("child") as child:
+        assert tracer.inject()["traceparent"] == child.traceparent
+
+    assert child.trace_id == parent.trace_id
+    assert child.parent_id == parent.span_id
+    assert [span["name"] for span in spans()] == ["child", "parent"]
+
+
+async def test_server_span_is_named_after_the_route(client, spans):
+    # The tracer is configured after the app started, see the fixture order
+    trace_id = "c" * 32
+    await client.post(
+        "/chat/alice",
+        json={"text": "hello"},
+        headers={"traceparent": f"00-{trace_id}-{'d' * 16}-01"},
+    )
+
+    server = next(span for span in spans() if span["kind"] == "server")
+    assert server["name"] == "POST /chat/{user_id}"
+    assert server["trace_id"] == trace_id
+    assert server["attributes"]["http.response.status_code"] == 201